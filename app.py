@@ -1,22 +1,55 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import os
 from urllib.parse import quote
 import uuid
 import sys
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, render_template_string
+import tempfile
+import json
+import base64
+import hmac
+import mimetypes
+import math
+import click
+from datetime import datetime, timedelta
+from flask import Flask, Request, Response, render_template, request, redirect, url_for, session, flash, jsonify, render_template_string, current_app, abort, send_file, stream_with_context
 from werkzeug.utils import secure_filename
-from models import db, Work, Review, Appointment
-from sqlalchemy import func
-
-# ==========================================
-# NEW: HEIC IMAGE PROCESSING IMPORTS
-# ==========================================
-from PIL import Image
-import pillow_heif
-
-# Register HEIC opener so Pillow can handle .heic files
-pillow_heif.register_heif_opener()
+from werkzeug.security import safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
+from models import db, Work, Review, Appointment, ArchivedAppointment, ImageJob, Client, PENDING_IMAGE, LISTED_CLIENT, upgrade_schema
+from sqlalchemy import func, text, tuple_
+from sqlalchemy.orm import load_only, raiseload
+import images
+import jobs
+import query_plans
+import page_cache
+import kudos
+import review_stats
+import db_profile
+import clients
+import assets
+import metrics
+import outbox
+import search
+import dedupe
+import throttle
+import storage
+import moderation
+import exports
+import archive
+
+class StreamingUploadRequest(Request):
+    """
+    Uploaded files are streamed in chunks straight into the staging folder
+    instead of Werkzeug's default in-memory spool, so a 16MB upload costs
+    one small buffer of RAM and stage_image() can hard-link it into place.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.NamedTemporaryFile('wb+', dir=current_app.config['STAGING_FOLDER'], prefix='upload-', suffix='.part')
 
 app = Flask(__name__)
+app.request_class = StreamingUploadRequest
 
 # ==========================================
 # 1. CONFIGURATION & SETUP
@@ -25,11 +58,21 @@ app.config['SECRET_KEY'] = '56trfew34ertyuiui8stuti756rfyiouiyuertfhgjhyiukfyr6e
 
 # --- DATABASE FIX: USE ABSOLUTE PATH ---
 basedir = os.path.abspath(os.path.dirname(__file__))
-db_path = os.path.join(basedir, 'instance', 'database.db')
+db_path = os.environ.get('DATABASE_PATH', os.path.join(basedir, 'instance', 'database.db'))
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
 
+# --- SQLITE TUNING PROFILE (see db_profile.py) ---
+# 'gunicorn' (boot.sh), 'waitress' (run_waitress.py) or 'dev'; picks the pool size
+app.config['SERVER_MODE'] = os.environ.get('SERVER_MODE', 'dev')
+app.config['SQLITE_JOURNAL_MODE'] = 'WAL'
+app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLITE_CACHE_SIZE_KB'] = 20 * 1024              # 20MB page cache per connection
+app.config['SQLITE_MMAP_SIZE'] = 256 * 1024 * 1024          # shared, read through the OS page cache
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_profile.engine_options(app.config)
+
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'static/uploads')
 
 # --- UPDATED: Allow HEIC and HEIF extensions ---
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'webp', 'heic', 'heif'}
@@ -37,21 +80,188 @@ app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'webp', 'heic', 'heif'
 # Increase max size slightly because HEIC conversion takes memory
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 
 
-# Ensure upload directories exist
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'before'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'after'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'reviews'), exist_ok=True)
-
+# --- STATIC ASSET PIPELINE (see assets.py) ---
+# Content-hashed, pre-compressed copies of static/css, js and asset, cached for a year.
+# Set ASSETS_FINGERPRINT=0 while editing CSS/JS locally to serve the raw files.
+app.config['ASSETS_FINGERPRINT'] = os.environ.get('ASSETS_FINGERPRINT', '1') == '1'
+app.config['ASSETS_BUILD_FOLDER'] = os.path.join(basedir, 'instance', 'assets')
+# Inline the shared base.css into <head> (critical) and keep page CSS as links (non-critical)
+app.config['ASSETS_INLINE_CRITICAL_CSS'] = os.environ.get('ASSETS_INLINE_CRITICAL_CSS', '0') == '1'
+
+# --- UPLOADED PHOTO SERVING (/media/...) ---
+# 'wsgi': sent by the app through wsgi.file_wrapper (sendfile under gunicorn,
+#         waitress's async file buffer), so no request thread copies bytes.
+# 'x-accel': nginx serves it; needs an internal location, e.g.
+#         location /_uploads/ { internal; alias /path/to/static/uploads/; }
+# 'x-sendfile': Apache mod_xsendfile / lighttpd serve it.
+app.config['UPLOAD_SERVE_MODE'] = os.environ.get('UPLOAD_SERVE_MODE', 'wsgi')
+app.config['UPLOAD_ACCEL_PREFIX'] = '/_uploads/'
+# Makes send_file() emit an X-Sendfile header instead of the body
+app.config['USE_X_SENDFILE'] = app.config['UPLOAD_SERVE_MODE'] == 'x-sendfile'
+app.config['UPLOAD_SUBFOLDERS'] = {'before', 'after', 'reviews', 'reels'}
+# New uploads go to <subfolder>/<first N chars of their random name>/, i.e.
+# 256 directories per subfolder for N=2 (older flat names keep working)
+app.config['UPLOAD_SHARD_CHARS'] = 2
+
+# --- UPLOAD GARBAGE COLLECTION (`flask gc-uploads`, see storage.py) ---
+# Files younger than this are never touched (uploads still being converted)
+app.config['UPLOAD_GC_GRACE_SECONDS'] = 60 * 60
+app.config['UPLOAD_GC_BATCH_SIZE'] = 500
+# Orphans are moved here first and only deleted after UPLOAD_QUARANTINE_DAYS
+app.config['UPLOAD_QUARANTINE_FOLDER'] = os.path.join(basedir, 'instance', 'quarantine')
+app.config['UPLOAD_QUARANTINE_DAYS'] = 14
+
+# --- DUPLICATE PHOTOS (see dedupe.py) ---
+# Perceptual hashes at most this many bits apart (of 64) count as the same photo
+app.config['DUPLICATE_MAX_DISTANCE'] = 4
+
+# Cards per page on the gallery / reviews wall (more load via infinite scroll)
+app.config['GALLERY_PAGE_SIZE'] = 12
+app.config['REVIEWS_PAGE_SIZE'] = 12
+app.config['CLIENTS_PAGE_SIZE'] = 24
+app.config['SEARCH_RESULTS'] = 20
+
+# Country code assumed for phone numbers typed without one (see clients.py)
+app.config['PHONE_DEFAULT_COUNTRY'] = '91'
+
+# --- PUBLIC PAGE CACHE ---
+# 'sqlite' is shared by every gunicorn worker; 'memory' is per process (waitress / dev only)
+app.config['PAGE_CACHE_BACKEND'] = os.environ.get('PAGE_CACHE_BACKEND', 'sqlite')
+app.config['PAGE_CACHE_PATH'] = os.environ.get('PAGE_CACHE_PATH', os.path.join(basedir, 'instance', 'page_cache.db'))
+app.config['PAGE_CACHE_MAX_ENTRIES'] = 500
+app.config['PAGE_CACHE_TTL'] = 60 * 60         # safety net for edits made outside the app
+
+# --- FORM THROTTLING (token buckets, see throttle.py) ---
+app.config['THROTTLE_ENABLED'] = os.environ.get('THROTTLE_ENABLED', '1') == '1'
+app.config['THROTTLE_PATH'] = os.environ.get('THROTTLE_PATH', os.path.join(basedir, 'instance', 'throttle.db'))
+# '<action>:<scope>': (burst, period in seconds), i.e. `burst` submissions, refilled over `period`
+app.config['THROTTLE_LIMITS'] = {
+    'review:ip': (5, 60 * 60),
+    'review:phone': (3, 24 * 60 * 60),
+    'appointment:ip': (10, 60 * 60),
+    'appointment:phone': (5, 24 * 60 * 60),
+}
+# Number of reverse proxies (nginx...) in front of the app. Client IPs (per-IP
+# limits, kudos) are taken from X-Forwarded-For only when this is set
+app.config['PROXY_FIX_HOPS'] = int(os.environ.get('PROXY_FIX_HOPS', 0))
+if app.config['PROXY_FIX_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_HOPS'])
+
+# --- KUDOS (batched, see kudos.py) ---
+app.config['KUDOS_FLUSH_SECONDS'] = 5
+app.config['KUDOS_DEDUPE_SECONDS'] = 24 * 60 * 60   # one kudos per client per review per day
+app.config['KUDOS_RATE_PER_MINUTE'] = 30
+app.config['KUDOS_DEDUPE_MAX_CLIENTS'] = 50000
+
+# --- ADMIN BULK MODERATION (see moderation.py) ---
+app.config['BULK_MODERATION_MAX_IDS'] = 500   # ids per request, so one transaction never runs long
+
+# --- EXPORTS & ARCHIVAL (see exports.py, archive.py) ---
+app.config['EXPORT_BATCH_SIZE'] = 1000         # rows read (and sent) per chunk
+# `flask archive-appointments` moves bookings older than this out of the appointment table
+app.config['APPOINTMENT_ARCHIVE_DAYS'] = int(os.environ.get('APPOINTMENT_ARCHIVE_DAYS', 365))
+app.config['APPOINTMENT_ARCHIVE_BATCH_SIZE'] = 500
+
+# Reject images above this many pixels from the header alone, before any decoding
+# (48MP iPhone photos fit; decompression bombs and panoramas don't)
+app.config['MAX_UPLOAD_PIXELS'] = 50 * 1000 * 1000
+
+# --- BACKGROUND IMAGE PROCESSING ---
+# Raw uploads wait here until a worker process converts them into UPLOAD_FOLDER
+app.config['STAGING_FOLDER'] = os.path.join(basedir, 'instance', 'staging')
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))   # worker processes per server process
+app.config['IMAGE_JOB_POLL_SECONDS'] = 5       # how often to look for jobs queued by other processes
+app.config['IMAGE_JOB_TIMEOUT'] = 10 * 60      # a 'running' job older than this is retried
+app.config['IMAGE_JOB_MAX_ATTEMPTS'] = 3
+
+# --- BOOKING NOTIFICATIONS (outbox, see outbox.py) ---
+# 'log' prints them (dev / tests); 'webhook' POSTs them to OUTBOX_WEBHOOK_URL
+app.config['OUTBOX_TRANSPORT'] = os.environ.get('OUTBOX_TRANSPORT', 'log')
+app.config['OUTBOX_WEBHOOK_URL'] = os.environ.get('OUTBOX_WEBHOOK_URL')
+app.config['OUTBOX_WEBHOOK_SECRET'] = os.environ.get('OUTBOX_WEBHOOK_SECRET')   # signs the body (X-Signature-256)
+app.config['OUTBOX_HTTP_TIMEOUT'] = 10
+app.config['OUTBOX_BATCH_SIZE'] = 20
+app.config['OUTBOX_POLL_SECONDS'] = 5          # picks up retries and other workers' messages
+app.config['OUTBOX_SEND_TIMEOUT'] = 2 * 60     # a 'sending' batch older than this is retried
+app.config['OUTBOX_MAX_ATTEMPTS'] = 8
+app.config['OUTBOX_RETRY_BASE_SECONDS'] = 30   # 30s, 1m, 2m, 4m... capped below
+app.config['OUTBOX_RETRY_MAX_SECONDS'] = 60 * 60
+
+# --- REQUEST METRICS (see metrics.py) ---
+# Scraped from /metrics by a logged-in admin or with "Authorization: Bearer <METRICS_TOKEN>"
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(basedir, 'instance', 'metrics'))
+app.config['METRICS_FLUSH_SECONDS'] = 10
+# Requests slower than this print a trace with their SQL
+app.config['METRICS_SLOW_REQUEST_MS'] = int(os.environ.get('METRICS_SLOW_REQUEST_MS', 500))
+# Most SQL statements one request may run. Exceeding it fails the request in
+# testing mode (app.testing) and fails `flask check-query-plans`
+app.config['QUERY_BUDGET'] = 10
+
+# Importing this module only configures the app and registers hooks and
+# routes: no disk, database or Pillow work happens here (see create_app()).
 db.init_app(app)
+db_profile.init_app(app)
+metrics.init_app(app)
 
-with app.app_context():
-    db.create_all()
+def init_db():
+    """
+    Creates the upload folders and brings the database up to date (new
+    tables, columns and indexes, then the booking id sequence, upload dedupe
+    key, rating summary, client records and search index on first run). A deploy step, `flask
+    init-db` (boot.sh runs it), instead of work every worker repeats on
+    import. Needs an app context.
+    """
+    for subfolder in app.config['UPLOAD_SUBFOLDERS']:
+        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], subfolder), exist_ok=True)
+    os.makedirs(app.config['STAGING_FOLDER'], exist_ok=True)
+
+    db_profile.report(app)
+    upgrade_schema()
+    archive.ensure_built()
+    dedupe.ensure_built()
+    review_stats.ensure_built()
+    clients.ensure_built()
+    search.ensure_built()
+
+def create_app():
+    """
+    Entry point for servers: gunicorn --preload 'app:create_app()' (boot.sh),
+    run_waitress.py, or `flask --app app:create_app run`. Does the per-process
+    setup that touches the disk (page cache, static asset build) and reports
+    the SQLite profile and startup time. Returns the app; safe to call again. Run `flask init-db` first.
+    """
+    if 'startup' in app.extensions:
+        return app
+
+    started = time.perf_counter()
+    assets.init_app(app)
+    # After the asset build: the manifest is part of the cache's build id
+    page_cache.init_app(app)
+    throttle.init_app(app)
+    # What the serving processes actually got, not just what `flask init-db` saw
+    with app.app_context():
+        db_profile.report(app)
+
+    setup_seconds = time.perf_counter() - started
+    app.extensions['startup'] = {'import_seconds': IMPORT_SECONDS, 'setup_seconds': setup_seconds}
+    print(f"✅ App ready in {(IMPORT_SECONDS + setup_seconds) * 1000:.0f}ms "
+          f"(import {IMPORT_SECONDS * 1000:.0f}ms, setup {setup_seconds * 1000:.0f}ms, pid {os.getpid()})")
+    return app
 
 # --- HARDCODED CREDENTIALS --- 
 ADMIN_USER = "arpit"
 ADMIN_PASS = "123" 
 ARPIT_PHONE_NUMBER = "917014790175" 
 
+@app.before_request
+def start_background_workers():
+    # Per-process and idempotent, so it is fork-safe under gunicorn
+    jobs.start(app)
+    kudos.start(app)
+    metrics.start(app)
+    outbox.start(app)
+
 # ==========================================
 # 2. HELPER FUNCTIONS
 # ==========================================
@@ -59,49 +269,188 @@ def allowed_file(filename):
     """Checks if the file extension is allowed."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def save_image(file, subfolder='reviews'):
+def stage_image(file, subfolder='reviews'):
     """
-    Saves an uploaded image.
-    - IF HEIC: Converts to JPG and saves.
-    - IF OTHER: Saves normally.
-    Returns the final filename (including extension).
+    Writes an uploaded image to the staging folder as-is, without decoding it.
+    - Checks the real format from the magic bytes, not just the extension.
+    - Rejects oversized images by reading only the header.
+    The actual conversion (HEIC -> JPG, resized copies) happens in a background
+    worker once the job is queued with jobs.enqueue().
+    Returns (staged path, final filename) or None if there is no valid file.
     """
-    if file and allowed_file(file.filename):
-        # 1. Get original extension
-        original_ext = file.filename.rsplit('.', 1)[1].lower()
-        
-        # 2. Generate unique name
-        unique_name = uuid.uuid4().hex
-        
-        # 3. Define folder path
-        save_dir = os.path.join(app.config['UPLOAD_FOLDER'], subfolder)
-        
-        # --- HEIC CONVERSION LOGIC ---
-        if original_ext in ['heic', 'heif']:
-            # Force new extension to .jpg
-            filename = f"{unique_name}.jpg"
-            save_path = os.path.join(save_dir, filename)
-            
-            try:
-                # Open HEIC using Pillow (via pillow_heif)
-                img = Image.open(file)
-                # Convert to RGB (HEIC handles transparency differently, standard JPG doesn't)
-                img = img.convert("RGB")
-                # Save as high-quality JPG
-                img.save(save_path, "JPEG", quality=90)
-                return filename
-            except Exception as e:
-                print(f"❌ HEIC Conversion Failed: {e}")
-                return None
-        
-        # --- STANDARD IMAGE LOGIC ---
-        else:
-            filename = f"{unique_name}.{original_ext}"
-            save_path = os.path.join(save_dir, filename)
-            file.save(save_path)
-            return filename
+    if not (file and allowed_file(file.filename)):
+        return None
+
+    # 1. Sniff the real format (a renamed .jpg may well be a HEIC)
+    head = file.stream.read(16)
+    file.stream.seek(0)
+    detected_ext = images.sniff_extension(head)
+    if detected_ext is None:
+        print(f"❌ Rejected upload {file.filename!r}: not a supported image")
+        return None
+
+    # 2. Generate unique name (HEIC will be stored as .jpg)
+    unique_name = uuid.uuid4().hex
+    filename = images.sharded_name(f"{unique_name}.{images.stored_extension(detected_ext)}",
+                                   app.config['UPLOAD_SHARD_CHARS'])
+    staged_path = os.path.join(app.config['STAGING_FOLDER'], f"{unique_name}.{detected_ext}")
+
+    with metrics.timer('image_stage_seconds', subfolder=subfolder):
+        # 3. Park the raw bytes until a worker picks them up
+        park_upload(file, staged_path)
+
+        # 4. Header-only size check
+        try:
+            images.check_dimensions(staged_path, app.config['MAX_UPLOAD_PIXELS'])
+        except ValueError as e:
+            print(f"❌ Rejected upload {file.filename!r}: {e}")
+            os.remove(staged_path)
+            return None
+
+    return staged_path, filename
+
+def park_upload(file, staged_path):
+    """
+    Puts an upload's raw bytes at staged_path. Uploads streamed by
+    StreamingUploadRequest already live in the staging folder: just link them.
+    """
+    stream_path = getattr(file.stream, 'name', None)
+    try:
+        if not isinstance(stream_path, str):
+            raise OSError("upload is not backed by a file")
+        file.stream.flush()
+        os.link(stream_path, staged_path)
+    except OSError:
+        file.save(staged_path)
+
+def stage_reel_poster(file):
+    """
+    Stages the optional reel poster: either a still image, or a short clip
+    that the worker pulls a frame from with ffmpeg. Returns what stage_image()
+    returns, or None if there is no usable file.
+    """
+    if not (file and file.filename):
+        return None
+    if allowed_file(file.filename):
+        return stage_image(file, 'reels')
+
+    head = file.stream.read(16)
+    file.stream.seek(0)
+    clip_ext = images.sniff_video(head)
+    if clip_ext is None or images.FFMPEG is None:
+        print(f"❌ Rejected reel poster {file.filename!r}: not an image, or a clip without ffmpeg installed")
+        return None
+
+    unique_name = uuid.uuid4().hex
+    staged_path = os.path.join(app.config['STAGING_FOLDER'], f"{unique_name}.{clip_ext}")
+    park_upload(file, staged_path)
+    return staged_path, images.sharded_name(f"{unique_name}.jpg", app.config['UPLOAD_SHARD_CHARS'])
+
+@app.template_global()
+def upload_url(subfolder, filename):
+    """Public URL of a file under static/uploads/<subfolder> (served by media())."""
+    return url_for('media', subfolder=subfolder, filename=filename)
+
+@app.template_global()
+def upload_variant_url(subfolder, filename, width, ext):
+    """Public URL of one resized copy of an upload."""
+    return upload_url(subfolder, images.variant_name(filename, width, ext))
+
+@app.template_global()
+def upload_srcset(subfolder, filename, widths, ext):
+    """srcset value listing every resized copy of an upload in one format."""
+    return ", ".join(f"{upload_variant_url(subfolder, filename, w, ext)} {w}w" for w in widths)
+
+@app.template_global()
+def critical_css(filename):
+    """Stylesheet contents to inline in <head>, or None to link it normally."""
+    return assets.inline_css(app, filename)
+
+def encode_cursor(row, columns):
+    """Opaque page token holding the sort-key values of the last row shown."""
+    values = [getattr(row, col.key) for col in columns]
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(token, columns):
+    """Inverse of encode_cursor(). A tampered/garbled token is a 400."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+        if len(values) != len(columns):
+            raise ValueError("wrong number of keys")
+        if any(not isinstance(col.type, db.DateTime) and v is not None and type(v) is not int
+               for v, col in zip(values, columns)):
+            raise ValueError("sort keys other than timestamps are integers")
+        return [datetime.fromisoformat(v) if isinstance(col.type, db.DateTime) else v
+                for v, col in zip(values, columns)]
+    except (ValueError, TypeError):
+        abort(400)
+
+def keyset_paginate(query, columns, cursor, per_page):
+    """
+    Keyset (cursor) pagination: every column is sorted descending and the next
+    page starts strictly after the cursor, using a row-value comparison like
+    (created_at, id) < (?, ?). Cost per page stays constant however deep you go,
+    unlike OFFSET. The last column must be unique (the primary key).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    query = query.order_by(*[col.desc() for col in columns])
+    if cursor:
+        query = query.filter(tuple_(*columns) < tuple(decode_cursor(cursor, columns)))
+
+    rows = query.limit(per_page + 1).all()
+    next_cursor = encode_cursor(rows[per_page - 1], columns) if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
+
+# --- LOADER STRATEGIES FOR LIST VIEWS ---
+# No list template walks review.work / work.reviews, so lazy loads are made to
+# raise instead of silently firing one query per row; a page that starts
+# showing related rows must eager-load them (joinedload / selectinload).
+# load_only leaves out columns a list never renders (and raises if one is used).
+REVIEW_CARD_OPTIONS = (
+    load_only(Review.id, Review.customer_name, Review.branch, Review.rating, Review.content, Review.kudos,
+              Review.image_back, Review.image_front, Review.variants, Review.created_at, raiseload=True),
+    raiseload('*'),
+)
+WORK_CARD_OPTIONS = (raiseload('*'),)
+WORK_ADMIN_ROW_OPTIONS = (
+    load_only(Work.id, Work.title, Work.hair_type, Work.cost, Work.after_image, raiseload=True),
+    raiseload('*'),
+)
+
+def gallery_page(hair_filter, cursor=None):
+    """One page of the public transformations gallery, newest first."""
+    query = Work.query.options(*WORK_CARD_OPTIONS)
+
+    # Hide posts whose images are still being processed
+    query = query.filter(Work.before_image != PENDING_IMAGE, Work.after_image != PENDING_IMAGE)
+
+    if hair_filter and hair_filter.lower() != 'all':
+        # Case-insensitive equality, matching the NOCASE index
+        query = query.filter(Work.hair_type.collate('NOCASE') == hair_filter)
+
+    return keyset_paginate(query, [Work.created_at, Work.id], cursor, app.config['GALLERY_PAGE_SIZE'])
+
+def reviews_page(filter_stars, sort_by, cursor=None):
+    """One page of approved reviews, by kudos (default) or newest first."""
+    query = Review.query.options(*REVIEW_CARD_OPTIONS).filter_by(is_approved=True)
+
+    if filter_stars and filter_stars != 'all':
+        if not filter_stars.isdigit(): abort(400)
+        query = query.filter_by(rating=int(filter_stars))
+
+    if sort_by == 'newest':
+        columns = [Review.created_at, Review.id]
+    else:
+        columns = [Review.kudos, Review.created_at, Review.id]
+
+    return keyset_paginate(query, columns, cursor, app.config['REVIEWS_PAGE_SIZE'])
 
-    return None
+def clients_page(cursor=None):
+    """One page of the admin client list, most recently active first."""
+    # Same predicate as the partial index, so SQLite can use it
+    query = Client.query.filter(text(f"({LISTED_CLIENT})"))
+    return keyset_paginate(query, [Client.last_seen_at, Client.id], cursor, app.config['CLIENTS_PAGE_SIZE'])
 
 def convert_reel_to_embed(url):
     """
@@ -118,36 +467,42 @@ def convert_reel_to_embed(url):
 # ==========================================
 
 @app.route('/')
+@page_cache.cached(tags=('works', 'reviews'), args={'hair': 'all'})
 def index():
     hair_filter = request.args.get('hair', 'all')
-    query = Work.query
+    works, next_cursor = gallery_page(hair_filter)
+    featured_reviews = Review.query.options(*REVIEW_CARD_OPTIONS).filter_by(is_featured=True).limit(3).all()
 
-    if hair_filter and hair_filter.lower() != 'all':
-        query = query.filter(Work.hair_type.ilike(hair_filter))
+    return render_template('index.html', works=works, reviews=featured_reviews, current_hair=hair_filter,
+                           next_cursor=next_cursor)
 
-    works = query.order_by(Work.created_at.desc()).all()
-    featured_reviews = Review.query.filter_by(is_featured=True).limit(3).all()
+# --- INFINITE SCROLL API (next page of gallery cards) ---
+@app.route('/api/works')
+@page_cache.cached(tags=('works',), args={'hair': 'all', 'cursor': ''})
+def api_works():
+    hair_filter = request.args.get('hair', 'all')
+    works, next_cursor = gallery_page(hair_filter, request.args.get('cursor'))
 
-    return render_template('index.html', works=works, reviews=featured_reviews, current_hair=hair_filter)
+    html = ''.join(render_template('partials/work_card.html', work=work) for work in works)
+    next_url = url_for('api_works', hair=hair_filter, cursor=next_cursor) if next_cursor else None
+    return jsonify({'html': html, 'next_url': next_url})
 
 @app.route('/about-me')
+@page_cache.cached(tags=('reviews',))
 def about_me():
-    all_approved_reviews = Review.query.filter_by(is_approved=True).all()
-    
-    if all_approved_reviews:
-        total_score = sum([r.rating for r in all_approved_reviews])
-        avg_rating = round(total_score / len(all_approved_reviews), 1)
-        total_count = len(all_approved_reviews)
-    else:
-        avg_rating = 5.0
-        total_count = 0
+    # Read from the maintained rating summary, not the review table
+    stats = review_stats.summary()
+    avg_rating = stats['average'] or 5.0
+    total_count = stats['count']
 
-    featured_reviews = Review.query.filter_by(is_featured=True).limit(3).all()
-    return render_template('about_me.html', avg_rating=avg_rating, total_count=total_count, reviews=featured_reviews)
+    return render_template('about_me.html', avg_rating=avg_rating, total_count=total_count)
 
 @app.route('/appointment', methods=['GET', 'POST'])
 def appointment():
     if request.method == 'POST':
+        # Before anything reads the form body
+        throttle.check('appointment', 'ip', request.remote_addr)
+
         name = request.form.get('name')
         phone = request.form.get('phone')
         branch = request.form.get('branch')
@@ -158,6 +513,10 @@ def appointment():
             flash("Please fill in all fields.")
             return redirect(url_for('appointment'))
 
+        # A number normalize_phone() can't read (a short landline, an odd foreign
+        # format) is still a booking: it is only left without a client record
+        throttle.check('appointment', 'phone', clients.normalize_phone(phone) or phone.strip())
+
         try:
             new_apt = Appointment(
                 customer_name=name, 
@@ -168,11 +527,27 @@ def appointment():
                 is_confirmed=False
             )
             
+            msg = f"Hi Arpit, I am {name}. I'd like to book a {service} at your {branch} branch on {date}."
+
             db.session.add(new_apt)
+            clients.record_appointment(new_apt, +1)
+            db.session.flush()
+            # Tell Arpit too, in the same commit; sent in the background by outbox.py.
+            # Appointment ids are AUTOINCREMENT and never reused, so the key names this
+            # booking for good and the receiving end can drop a redelivered message
+            outbox.enqueue('appointment.created', f"appointment-{new_apt.id}-created", {
+                'appointment_id': new_apt.id,
+                'name': name,
+                'phone': clients.normalize_phone(phone) or phone,
+                'service': service,
+                'branch': branch,
+                'date': date,
+                'text': msg,
+            })
             db.session.commit()
+            outbox.notify()
             print("✅ Data Saved to DB")
 
-            msg = f"Hi Arpit, I am {name}. I'd like to book a {service} at your {branch} branch on {date}."
             encoded_msg = quote(msg)
             whatsapp_url = f"https://wa.me/{ARPIT_PHONE_NUMBER}?text={encoded_msg}"
             
@@ -188,8 +563,12 @@ def appointment():
     
 # --- REVIEWS ROUTE ---
 @app.route('/reviews', methods=['GET', 'POST'])
+@page_cache.cached(tags=('reviews',), args={'stars': 'all', 'sort': 'kudos'})
 def reviews():
     if request.method == 'POST':
+        # Before anything reads the form body (and its photos)
+        throttle.check('review', 'ip', request.remote_addr)
+
         name = request.form.get('name')
         phone = request.form.get('phone') 
         branch = request.form.get('branch')
@@ -197,12 +576,20 @@ def reviews():
         content = request.form.get('content')
         work_id = request.form.get('work_id') 
 
+        # Before any photo is staged or checked
+        throttle.check('review', 'phone', clients.normalize_phone(phone))
+
         img_back_file = request.files.get('image_back')
         img_front_file = request.files.get('image_front')
 
-        # save_image now handles HEIC conversion automatically
-        filename_back = save_image(img_back_file)
-        filename_front = save_image(img_front_file)
+        # Photos are only staged here; the image columns are filled in
+        # by the background worker once conversion finishes
+        staged_back = stage_image(img_back_file)
+        staged_front = stage_image(img_front_file)
+
+        if (img_back_file and img_back_file.filename and not staged_back) or \
+           (img_front_file and img_front_file.filename and not staged_front):
+            flash("One of your photos couldn't be used (unsupported format or too large), so it was skipped.")
 
         new_review = Review(
             customer_name=name, 
@@ -210,8 +597,6 @@ def reviews():
             branch=branch,
             rating=rating, 
             content=content, 
-            image_back=filename_back,   
-            image_front=filename_front, 
             is_approved=False 
         )
         
@@ -219,7 +604,14 @@ def reviews():
             new_review.work_id = work_id
             
         db.session.add(new_review)
+        clients.record_review(new_review, +1)
+        db.session.flush()
+
+        if staged_back: jobs.enqueue(new_review, 'image_back', 'reviews', staged_back)
+        if staged_front: jobs.enqueue(new_review, 'image_front', 'reviews', staged_front)
+
         db.session.commit()
+        jobs.notify()
         flash("Thanks you for your time!")
         return redirect(url_for('reviews'))
 
@@ -227,30 +619,93 @@ def reviews():
     filter_stars = request.args.get('stars')
     sort_by = request.args.get('sort', 'kudos') 
 
-    query = Review.query.filter_by(is_approved=True)
-
-    if filter_stars and filter_stars != 'all':
-        query = query.filter_by(rating=int(filter_stars))
-
-    if sort_by == 'newest':
-        query = query.order_by(Review.created_at.desc())
-    else:
-        query = query.order_by(Review.kudos.desc(), Review.created_at.desc())
-
-    all_reviews = query.all()
+    reviews_list, next_cursor = reviews_page(filter_stars, sort_by)
 
     return render_template('reviews.html', 
-                           reviews=all_reviews, 
+                           reviews=reviews_list, 
                            current_filter=filter_stars, 
-                           current_sort=sort_by)
+                           current_sort=sort_by,
+                           next_cursor=next_cursor,
+                           rating_summary=review_stats.summary())
+
+# --- INFINITE SCROLL API (next page of review cards) ---
+@app.route('/api/reviews')
+@page_cache.cached(tags=('reviews',), args={'stars': 'all', 'sort': 'kudos', 'cursor': ''})
+def api_reviews():
+    filter_stars = request.args.get('stars')
+    sort_by = request.args.get('sort', 'kudos')
+    reviews_list, next_cursor = reviews_page(filter_stars, sort_by, request.args.get('cursor'))
+
+    html = ''.join(render_template('partials/review_card.html', review=review) for review in reviews_list)
+    next_url = url_for('api_reviews', sort=sort_by, stars=filter_stars, cursor=next_cursor) if next_cursor else None
+    return jsonify({'html': html, 'next_url': next_url})
+
+# --- SEARCH API (ranked, full-text; see search.py) ---
+@app.route('/api/search')
+def api_search():
+    query = request.args.get('q', '')[:100]
+    reviews = search.search_reviews(query, limit=app.config['SEARCH_RESULTS'])
+    works = search.search_works(query, limit=app.config['SEARCH_RESULTS'])
+    return jsonify({
+        'query': query,
+        'reviews': [{
+            'id': review.id,
+            'customer_name': review.customer_name,
+            'rating': review.rating,
+            'branch': review.branch,
+            'snippet': str(snippet),
+        } for review, snippet in reviews],
+        'works': [{
+            'id': work.id,
+            'title': work.title,
+            'hair_type': work.hair_type,
+            'image': upload_url('after', work.after_image),
+        } for work in works],
+    })
 
 # --- KUDOS API ROUTE ---
 @app.route('/reviews/like/<int:review_id>', methods=['POST'])
 def like_review(review_id):
-    review = Review.query.get_or_404(review_id)
-    review.kudos += 1
-    db.session.commit()
-    return jsonify({'kudos': review.kudos})
+    # Read-only here: the click is buffered and written in a batch by kudos.py
+    row = db.session.query(Review.kudos).filter_by(id=review_id).first()
+    if row is None:
+        abort(404)
+
+    client = kudos.client_key(request.remote_addr, request.headers.get('User-Agent', ''))
+    result = kudos.add(app, client, review_id)
+    if result == 'limited':
+        return jsonify({'error': 'Too many kudos, slow down!'}), 429
+
+    return jsonify({'kudos': (row.kudos or 0) + kudos.pending_for(review_id), 'counted': result == 'counted'})
+
+# --- UPLOADED PHOTOS ---
+@app.route('/media/<subfolder>/<path:filename>')
+def media(subfolder, filename):
+    """
+    Serves an upload. Names are random uuids and a file is never rewritten
+    under the same name, so the name itself is a strong ETag and the response
+    can be cached forever. Range and If-None-Match are handled by send_file.
+    """
+    if subfolder not in app.config['UPLOAD_SUBFOLDERS']:
+        abort(404)
+    path = safe_join(os.path.abspath(app.config['UPLOAD_FOLDER']), subfolder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    etag = os.path.basename(filename).rsplit('.', 1)[0]
+    mode = app.config['UPLOAD_SERVE_MODE']
+
+    if mode == 'x-accel':
+        # Empty body: nginx streams the file (and handles Range) itself
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{app.config['UPLOAD_ACCEL_PREFIX']}{subfolder}/{filename}"
+        response.set_etag(etag)
+        response = response.make_conditional(request)
+    else:
+        response = send_file(path, conditional=True, etag=etag, max_age=31536000)
+
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 # ==========================================
 # 4. ADMIN AUTHENTICATION
@@ -280,17 +735,23 @@ def dashboard():
     if not session.get('admin'): return redirect(url_for('admin_login'))
     return render_template('admin/dashboard.html')
 
+@app.route('/admin/jobs/status')
+def image_job_status():
+    if not session.get('admin'): return redirect(url_for('admin_login'))
+    return jsonify(jobs.status_summary())
+
 @app.route('/admin/transformations')
 def transformations_log():
     if not session.get('admin'): return redirect(url_for('admin_login'))
-    works = Work.query.order_by(Work.created_at.desc()).all()
-    return render_template('admin/transformations_log.html', works=works)
+    works = Work.query.options(*WORK_ADMIN_ROW_OPTIONS).order_by(Work.created_at.desc()).all()
+    failed_work_ids = {job.target_id for job in ImageJob.query.filter_by(target_type='work', status='failed')}
+    return render_template('admin/transformations_log.html', works=works, failed_work_ids=failed_work_ids)
 
 @app.route('/admin/reviews_log')
 def reviews_log():
     if not session.get('admin'): return redirect(url_for('admin_login'))
-    pending_reviews = Review.query.filter_by(is_approved=False).all()
-    approved_reviews = Review.query.filter_by(is_approved=True).order_by(Review.created_at.desc()).all()
+    pending_reviews = Review.query.options(raiseload('*')).filter_by(is_approved=False).all()
+    approved_reviews = Review.query.options(raiseload('*')).filter_by(is_approved=True).order_by(Review.created_at.desc()).all()
     return render_template('admin/reviews_log.html', pending_reviews=pending_reviews, approved_reviews=approved_reviews)
 
 @app.route('/admin/appointments_log')
@@ -306,66 +767,65 @@ def view_appointments():
 def view_clients():
     if not session.get('admin'): return redirect(url_for('admin_login'))
     
-    all_apts = Appointment.query.order_by(Appointment.created_at.desc()).all()
-    all_reviews = Review.query.all()
-    clients_data = {}
-    
-    for apt in all_apts:
-        if not apt.is_confirmed:
-            continue
-            
-        phone = apt.phone_number
-        if phone not in clients_data:
-            clients_data[phone] = {
-                'name': apt.customer_name, 
-                'phone': phone, 
-                'appointments': [], 
-                'reviews': [], 
-                'avg_rating': 0, 
-                'review_count': 0
-            }
-        clients_data[phone]['appointments'].append(apt)
-        clients_data[phone]['name'] = apt.customer_name
-
-    for rev in all_reviews:
-        phone = rev.phone_number
-        if phone:
-            if phone not in clients_data:
-                clients_data[phone] = {'name': rev.customer_name, 'phone': phone, 'appointments': [], 'reviews': [], 'avg_rating': 0, 'review_count': 0}
-            clients_data[phone]['reviews'].append(rev)
-
-    for phone, data in clients_data.items():
-        reviews = data['reviews']
-        if reviews:
-            total_stars = sum([r.rating for r in reviews])
-            data['avg_rating'] = round(total_stars / len(reviews), 1)
-            data['review_count'] = len(reviews)
-        else:
-            data['avg_rating'] = "-"
-            data['review_count'] = 0
+    client_list, next_cursor = clients_page()
+    return render_template('admin/clients.html', clients=client_list, next_cursor=next_cursor)
+
+# --- INFINITE SCROLL API (next page of client cards) ---
+@app.route('/admin/api/clients')
+def api_clients():
+    if not session.get('admin'): return redirect(url_for('admin_login'))
 
-    return render_template('admin/clients.html', clients=clients_data)
+    client_list, next_cursor = clients_page(request.args.get('cursor'))
+    html = ''.join(render_template('partials/client_card.html', client=client) for client in client_list)
+    next_url = url_for('api_clients', cursor=next_cursor) if next_cursor else None
+    return jsonify({'html': html, 'next_url': next_url})
 
 @app.route('/admin/client/<path:phone>')
 def client_profile(phone):
     if not session.get('admin'): return redirect(url_for('admin_login'))
     
-    appointments = Appointment.query.filter_by(phone_number=phone).order_by(Appointment.created_at.desc()).all()
-    reviews = Review.query.filter_by(phone_number=phone).order_by(Review.created_at.desc()).all()
-    
-    if not appointments and not reviews:
+    # Any spelling of the number finds the same client
+    e164 = clients.normalize_phone(phone)
+    client = Client.query.filter_by(phone=e164).first() if e164 else None
+    if client is None:
         flash("Client not found.")
         return redirect(url_for('view_clients'))
-    
-    name = appointments[0].customer_name if appointments else reviews[0].customer_name
-    confirmed_count = len([a for a in appointments if a.is_confirmed])
+
+    appointments = Appointment.query.filter_by(client_id=client.id).order_by(Appointment.created_at.desc()).all()
+    archived_appointments = (ArchivedAppointment.query.filter_by(client_id=client.id)
+                             .order_by(ArchivedAppointment.created_at.desc()).all())
+    reviews = Review.query.options(raiseload('*')).filter_by(client_id=client.id).order_by(Review.created_at.desc()).all()
     
     return render_template('admin/client_profile.html', 
-                           name=name, 
-                           phone=phone, 
+                           name=client.name, 
+                           phone=client.phone, 
                            appointments=appointments, 
+                           archived_appointments=archived_appointments,
                            reviews=reviews,
-                           confirmed_count=confirmed_count)
+                           confirmed_count=client.visit_count)
+
+# --- DATA EXPORT (streamed, see exports.py) ---
+@app.route('/admin/export/<dataset>.<fmt>')
+def export_data(dataset, fmt):
+    if not session.get('admin'): return redirect(url_for('admin_login'))
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        abort(404)
+
+    filename = f"curlartist-{dataset}-{datetime.now():%Y%m%d}.{fmt}"
+    return Response(stream_with_context(exports.stream(dataset, fmt, app.config['EXPORT_BATCH_SIZE'])),
+                    mimetype=exports.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store'})
+
+@app.route('/admin/search')
+def admin_search():
+    if not session.get('admin'): return redirect(url_for('admin_login'))
+
+    query = request.args.get('q', '').strip()[:100]
+    # Pending reviews and still-processing posts are searchable here too
+    reviews = search.search_reviews(query, limit=50, approved_only=False)
+    works = search.search_works(query, limit=24, include_pending=True)
+    return render_template('admin/search.html', query=query, reviews=reviews, works=works)
 
 # ==========================================
 # 6. ADMIN ACTIONS
@@ -381,26 +841,45 @@ def upload_work():
     reel_url = request.form.get('reel_link')
     before_file = request.files.get('before_image')
     after_file = request.files.get('after_image')
+    poster_file = request.files.get('reel_poster')
 
     if before_file and after_file and allowed_file(before_file.filename) and allowed_file(after_file.filename):
-        # Uses updated helper to handle HEIC
-        b_filename = save_image(before_file, 'before')
-        a_filename = save_image(after_file, 'after')
+        # Staged only; the worker converts HEIC and fills in the image columns
+        staged_before = stage_image(before_file, 'before')
+        staged_after = stage_image(after_file, 'after')
+
+        if not staged_before or not staged_after:
+            for staged in (staged_before, staged_after):
+                if staged: os.remove(staged[0])
+            flash(f"Upload rejected: images must be JPG, PNG, WebP or HEIC and under {app.config['MAX_UPLOAD_PIXELS'] // 1000000} megapixels.")
+            return redirect(url_for('transformations_log'))
 
         embed_link = convert_reel_to_embed(reel_url)
+        # Still frame shown on the reel's click-to-load card
+        staged_poster = stage_reel_poster(poster_file) if embed_link else None
         
         new_work = Work(
             title=title, 
             hair_type=hair_type,
             cost=cost,
-            before_image=b_filename, 
-            after_image=a_filename, 
+            before_image=PENDING_IMAGE, 
+            after_image=PENDING_IMAGE, 
             reel_link=embed_link
         )
         
         db.session.add(new_work)
+        db.session.flush()
+
+        jobs.enqueue(new_work, 'before_image', 'before', staged_before)
+        jobs.enqueue(new_work, 'after_image', 'after', staged_after)
+        if staged_poster:
+            jobs.enqueue(new_work, 'reel_poster', 'reels', staged_poster)
+
         db.session.commit()
-        flash("Transformation Uploaded!")
+        jobs.notify()
+        flash("Transformation Uploaded! Images are processing and will go live in a moment.")
+        if embed_link and poster_file and poster_file.filename and not staged_poster:
+            flash("The reel poster couldn't be used (needs an image, or an MP4/MOV clip with ffmpeg on the server).")
     
     return redirect(url_for('transformations_log'))
 
@@ -409,53 +888,38 @@ def delete_work(id):
     if not session.get('admin'): return redirect(url_for('admin_login'))
     work = Work.query.get_or_404(id)
     
-    # --- DELETE IMAGES ---
-    if work.before_image:
-        try:
-            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], 'before', work.before_image))
-        except Exception as e:
-            print(f"Failed to delete before image: {e}")
-            
-    if work.after_image:
-        try:
-            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], 'after', work.after_image))
-        except Exception as e:
-            print(f"Failed to delete after image: {e}")
+    # --- DELETE IMAGES (+ RESIZED COPIES) ---
+    # Released with the row; the files go only once the delete is committed.
+    # Files shared with other rows (identical uploads, see dedupe.py) are kept.
+    doomed = storage.release_uploads(app.config['UPLOAD_FOLDER'], [
+        ('before', work.before_image, work.variants),
+        ('after', work.after_image, work.variants),
+        ('reels', work.reel_poster, work.variants),
+    ])
             
     db.session.delete(work)
     db.session.commit()
+    storage.remove_files(doomed)
+    page_cache.invalidate('works')
     flash("Work deleted")
     return redirect(url_for('transformations_log'))
 
 @app.route('/admin/approve_review/<int:id>')
 def approve_review(id):
     if not session.get('admin'): return redirect(url_for('admin_login'))
-    review = Review.query.get_or_404(id)
-    review.is_approved = True
-    db.session.commit()
+    Review.query.get_or_404(id)
+    if moderation.approve_reviews([id]):
+        page_cache.invalidate('reviews')
     return redirect(url_for('reviews_log'))
 
 @app.route('/admin/delete_review/<int:id>')
 def delete_review(id):
     if not session.get('admin'): return redirect(url_for('admin_login'))
     
-    review_to_delete = Review.query.get_or_404(id)
-    
-    # --- DELETE IMAGES IF THEY EXIST ---
-    if review_to_delete.image_back:
-        try:
-            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], 'reviews', review_to_delete.image_back))
-        except Exception as e:
-            print(f"Failed to delete review back image: {e}")
-
-    if review_to_delete.image_front:
-        try:
-            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], 'reviews', review_to_delete.image_front))
-        except Exception as e:
-            print(f"Failed to delete review front image: {e}")
-            
-    db.session.delete(review_to_delete)
-    db.session.commit()
+    Review.query.get_or_404(id)
+    # Photos (+ resized copies), rating / client counters and duplicate flags
+    moderation.delete_reviews([id])
+    page_cache.invalidate('reviews')
     
     flash("Review deleted permanently.")
     if request.referrer:
@@ -468,8 +932,8 @@ def toggle_feature(id):
     if not session.get('admin'): return redirect(url_for('admin_login'))
     
     review = Review.query.get_or_404(id)
-    review.is_featured = not review.is_featured
-    db.session.commit()
+    moderation.feature_reviews([id], not review.is_featured)
+    page_cache.invalidate('reviews')
     
     if request.referrer:
         return redirect(request.referrer)
@@ -479,21 +943,53 @@ def toggle_feature(id):
 @app.route('/admin/confirm_appointment/<int:id>')
 def confirm_appointment(id):
     if not session.get('admin'): return redirect(url_for('admin_login'))
-    apt = Appointment.query.get_or_404(id)
-    apt.is_confirmed = True
-    db.session.commit()
+    Appointment.query.get_or_404(id)
+    moderation.confirm_appointments([id])
     flash("Appointment Confirmed! Added to Client Database.")
     return redirect(url_for('view_appointments'))
 
 @app.route('/admin/delete_appointment/<int:id>')
 def delete_appointment(id):
     if not session.get('admin'): return redirect(url_for('admin_login'))
-    apt = Appointment.query.get_or_404(id)
-    db.session.delete(apt)
-    db.session.commit()
+    Appointment.query.get_or_404(id)
+    moderation.delete_appointments([id])
     flash("Appointment removed.")
     return redirect(url_for('view_appointments'))
 
+# --- BULK MODERATION API (the admin logs update in place) ---
+def read_bulk_request(actions):
+    """
+    (action, ids) from a JSON body like {"action": "approve", "ids": [3, 5, 8]}.
+    A malformed body, an unknown action or more than BULK_MODERATION_MAX_IDS
+    ids is a 400. Only JSON is accepted, which a cross-site form can't send.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400)
+    action, ids = data.get('action'), data.get('ids')
+    if action not in actions or not isinstance(ids, list) or \
+       not 0 < len(ids) <= app.config['BULK_MODERATION_MAX_IDS'] or \
+       not all(type(item_id) is int for item_id in ids):
+        abort(400)
+    return action, list(dict.fromkeys(ids))
+
+@app.route('/admin/reviews/bulk', methods=['POST'])
+def bulk_reviews():
+    if not session.get('admin'): abort(401)
+
+    action, ids = read_bulk_request(moderation.REVIEW_ACTIONS)
+    changed = moderation.apply_to_reviews(action, ids)
+    if changed:
+        page_cache.invalidate('reviews')
+    return jsonify({'action': action, 'ids': changed})
+
+@app.route('/admin/appointments/bulk', methods=['POST'])
+def bulk_appointments():
+    if not session.get('admin'): abort(401)
+
+    action, ids = read_bulk_request(moderation.APPOINTMENT_ACTIONS)
+    return jsonify({'action': action, 'ids': moderation.apply_to_appointments(action, ids)})
+
 # ==========================================
 # 7. ERROR HANDLERS
 # ==========================================
@@ -527,6 +1023,12 @@ def method_not_allowed(e):
 def request_entity_too_large(e):
     return render_template('error/413.html'), 413
 
+@app.errorhandler(429)
+def too_many_requests(e):
+    retry_after = getattr(e, 'retry_after', None)
+    headers = {'Retry-After': str(retry_after)} if retry_after else {}
+    return render_template('error/429.html', retry_minutes=math.ceil((retry_after or 60) / 60)), 429, headers
+
 # ==========================================
 # 8. HEALTH AND CREDITS
 # ==========================================
@@ -535,6 +1037,15 @@ def request_entity_too_large(e):
 def health_check():
     return "OK", 200
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target: admin session or the METRICS_TOKEN bearer token."""
+    token = app.config['METRICS_TOKEN']
+    sent = request.headers.get('Authorization', '')
+    if not session.get('admin') and not (token and hmac.compare_digest(sent, f"Bearer {token}")):
+        abort(401)
+    return Response(metrics.render(app), mimetype='text/plain; version=0.0.4')
+
 @app.route('/credits')
 def credits():
     return render_template_string("""
@@ -556,7 +1067,134 @@ def credits():
     """)
     
 # ==========================================
-# 9. APP ENTRY POINT
+# 9. CLI COMMANDS
 # ==========================================
+
+@app.cli.command('generate-variants')
+def generate_variants_command():
+    """Builds missing responsive copies for uploads saved before srcset support."""
+    def backfill(row, subfolder, filename):
+        variants = dict(row.variants or {})
+        if not filename or variants.get(filename):
+            return False
+        save_dir = os.path.join(app.config['UPLOAD_FOLDER'], subfolder)
+        try:
+            variants[filename] = images.build_variants(os.path.join(save_dir, filename), save_dir, filename)
+        except Exception as e:
+            print(f"❌ {subfolder}/{filename}: {e}")
+            return False
+        row.variants = variants
+        return True
+
+    updated = 0
+    for work in Work.query.all():
+        updated += backfill(work, 'before', work.before_image)
+        updated += backfill(work, 'after', work.after_image)
+    for review in Review.query.all():
+        updated += backfill(review, 'reviews', review.image_back)
+        updated += backfill(review, 'reviews', review.image_front)
+
+    db.session.commit()
+    print(f"✅ Generated variants for {updated} image(s)")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fails if any listing route falls back to a full table scan or runs too many queries."""
+    upgrade_schema()
+    problems = query_plans.check(app, query_plans.listing_urls(encode_cursor))
+
+    for url, sql, detail in problems:
+        print(f"❌ {url}\n   {detail}\n   {sql}")
+    if problems:
+        sys.exit(1)
+    print("✅ Every listing query is index-backed and within QUERY_BUDGET")
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Creates the upload folders and creates / upgrades the database schema (run on every deploy)."""
+    init_db()
+    print("✅ Database ready")
+
+@app.cli.command('rebuild-review-stats')
+def rebuild_review_stats_command():
+    """Recomputes the rating summary from the review table (after manual DB edits)."""
+    counted = review_stats.rebuild()
+    page_cache.invalidate('reviews')
+    print(f"✅ Rating summary rebuilt from {counted} approved reviews")
+
+@app.cli.command('rebuild-clients')
+def rebuild_clients_command():
+    """Links unlinked bookings/reviews to clients (merging phone formats) and recounts every client."""
+    linked, skipped = clients.rebuild()
+    print(f"✅ {linked} bookings/reviews linked to clients, {skipped} unusable phone numbers left unlinked")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Refills the full-text search tables from the review and work tables."""
+    search.rebuild()
+    print("✅ Search index rebuilt")
+
+@app.cli.command('gc-uploads')
+@click.option('--dry-run', is_flag=True, help="Only report what would be collected.")
+@click.option('--delete', is_flag=True, help="Delete orphans outright instead of quarantining them.")
+@click.option('--reshard', is_flag=True, help="First move flat-named uploads into shard directories (their old URLs stop working).")
+def gc_uploads_command(dry_run, delete, reshard):
+    """Quarantines uploads and staged files no row refers to, and reports the space reclaimed (cron-safe)."""
+    if reshard and not dry_run:
+        moved = storage.reshard(app)
+        page_cache.invalidate('works', 'reviews')
+        print(f"✅ Moved {moved} image(s) into shard directories")
+
+    result = storage.collect(app, dry_run=dry_run, delete=delete)
+    for folder, (count, size) in sorted(result['by_folder'].items()):
+        print(f"   {folder:<8} {count:>6} file(s)  {size / 1024 / 1024:8.1f}MB")
+
+    verb = 'Would reclaim' if dry_run else 'Reclaimed'
+    print(f"✅ {verb} {result['bytes'] / 1024 / 1024:.1f}MB from {result['orphans']} orphaned file(s) "
+          f"out of {result['scanned']} scanned")
+    if result['quarantine'] and result['orphans']:
+        print(f"   Quarantined in {result['quarantine']}")
+    if result['purged_bytes']:
+        print(f"✅ Purged {result['purged_bytes'] / 1024 / 1024:.1f}MB of expired quarantine")
+
+@app.cli.command('index-uploads')
+def index_uploads_command():
+    """Hashes uploads stored before duplicate detection existed and flags duplicate reviews."""
+    indexed, flagged = dedupe.index_existing(app.config['UPLOAD_GC_BATCH_SIZE'])
+    print(f"✅ Indexed {indexed} stored image(s); {flagged} review(s) flagged as possible duplicates")
+
+@app.cli.command('strip-upload-metadata')
+def strip_upload_metadata_command():
+    """Removes EXIF/XMP (GPS position included) from uploads stored before it was stripped on upload."""
+    stripped = storage.strip_existing(app)
+    page_cache.invalidate('works', 'reviews')
+    print(f"✅ Stripped metadata from {stripped} stored image(s)")
+
+@app.cli.command('archive-appointments')
+@click.option('--days', type=int, default=None, help="Archive bookings older than this (default APPOINTMENT_ARCHIVE_DAYS).")
+@click.option('--dry-run', is_flag=True, help="Only report how many bookings would be archived.")
+def archive_appointments_command(days, dry_run):
+    """Moves old bookings into the archive table so the appointment log stays small (cron-safe)."""
+    days = app.config['APPOINTMENT_ARCHIVE_DAYS'] if days is None else days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    if dry_run:
+        print(f"✅ Would archive {archive.count_due(cutoff)} booking(s) made before {cutoff:%Y-%m-%d}")
+        return
+    moved = archive.archive_appointments(cutoff, app.config['APPOINTMENT_ARCHIVE_BATCH_SIZE'])
+    print(f"✅ Archived {moved} booking(s) made before {cutoff:%Y-%m-%d}")
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprints and pre-compresses static assets (run at deploy so workers start warm)."""
+    manifest = assets.build(app)
+    print(f"✅ Built {len(manifest)} assets into {app.config['ASSETS_BUILD_FOLDER']}")
+
+# ==========================================
+# 10. APP ENTRY POINT
+# ==========================================
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED   # reported by create_app()
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    with app.app_context():
+        init_db()
+    create_app().run(debug=True)
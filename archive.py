@@ -0,0 +1,74 @@
+"""
+Archival of old appointments (`flask archive-appointments`).
+
+Bookings pile up forever, and the admin appointment log reads the whole
+table. Appointments created more than APPOINTMENT_ARCHIVE_DAYS ago are
+moved, ids and all, into the archived_appointment table: each batch is one
+INSERT ... SELECT plus one DELETE in a single commit, so a row is always in
+exactly one of the two tables and an interrupted run just resumes. Booking
+ids are AUTOINCREMENT, so an archived id is never given to a new booking.
+
+Client counters are untouched: an archived booking still counts as a
+booking (and a visit, if it was confirmed), and clients.rebuild() counts
+both tables. Client profiles and exports show archived bookings too.
+
+Meant to run from cron, e.g. weekly:
+    flask --app app archive-appointments
+"""
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, literal, select, text
+
+from models import db, Appointment, ArchivedAppointment
+
+# Columns copied as they are; archived_at is set on the way
+COPIED_COLUMNS = ('id', 'customer_name', 'phone_number', 'service', 'date_requested',
+                  'branch', 'is_confirmed', 'created_at', 'client_id')
+
+
+def ensure_built():
+    """
+    Moves the appointment id sequence past every archived id. Databases
+    archived before ids were AUTOINCREMENT can have it behind the archive.
+    """
+    archived = db.session.query(func.max(ArchivedAppointment.id)).scalar()
+    if archived is None:
+        return
+    params = {'seq': archived}
+    db.session.execute(text("""INSERT INTO sqlite_sequence (name, seq) SELECT 'appointment', :seq
+                               WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'appointment')"""), params)
+    db.session.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'appointment' AND seq < :seq"), params)
+    db.session.commit()
+
+
+def _due(cutoff):
+    """Appointments created before cutoff."""
+    return db.session.query(Appointment.id).filter(Appointment.created_at < cutoff)
+
+
+def count_due(cutoff):
+    """How many appointments archive_appointments(cutoff) would move."""
+    return _due(cutoff).count()
+
+
+def archive_appointments(cutoff, batch_size):
+    """Moves appointments created before `cutoff` to the archive, one batch per commit. Returns the number moved."""
+    now = datetime.utcnow()
+    source = [getattr(Appointment, name) for name in COPIED_COLUMNS]
+    moved = 0
+
+    while True:
+        ids = [row.id for row in _due(cutoff).order_by(Appointment.created_at).limit(batch_size)]
+        if not ids:
+            break
+        db.session.execute(
+            insert(ArchivedAppointment).from_select(
+                list(COPIED_COLUMNS) + ['archived_at'],
+                select(*source, literal(now)).where(Appointment.id.in_(ids))
+            )
+        )
+        db.session.execute(delete(Appointment).where(Appointment.id.in_(ids)),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+        moved += len(ids)
+    return moved
@@ -0,0 +1,180 @@
+"""
+Static asset pipeline.
+
+At startup (or with `flask build-assets` during deploy) every file under
+static/css, static/js and static/asset is copied into ASSETS_BUILD_FOLDER
+under a content-hashed name (css/base.css -> css/base.3f2a9c1d0e4b.css),
+with url(...) references inside CSS rewritten to the hashed names too.
+Text assets also get pre-compressed .gz (and .br when the `brotli` package
+is installed) siblings.
+
+url_for('static', filename='css/base.css') then builds the hashed URL
+automatically, and those URLs are served with a one-year immutable
+Cache-Control and whichever pre-compressed copy the browser accepts. A new
+deploy changes the hash, so nothing ever needs revalidating. Anything that is
+not part of the pipeline (uploads) still goes through Flask's static handler.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import request, send_file
+from markupsafe import Markup
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SOURCE_DIRS = ('css', 'js', 'asset')
+
+# Worth compressing; images and fonts are already compressed
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+MIN_COMPRESS_SIZE = 512
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _hashed_name(rel_path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, ext = posixpath.splitext(rel_path)
+    return f"{stem}.{digest}{ext}"
+
+
+def _write_atomic(path, content):
+    # Several workers may build at once; never expose a half-written file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _rewrite_css(rel_path, content, manifest, url_prefix):
+    """Points url(...) references at other pipeline assets to their hashed URLs."""
+    base = posixpath.dirname(rel_path)
+
+    def replace(match):
+        ref = match.group(2).strip()
+        if ref.startswith(('data:', 'http:', 'https:', '//', '#', '/')):
+            return match.group(0)
+        path = ref.split('?', 1)[0]
+        target = posixpath.normpath(posixpath.join(base, path))
+        if target not in manifest:
+            return match.group(0)
+        # Absolute, so the same CSS also works when inlined into a page
+        return f'url("{url_prefix}/{manifest[target]}")'
+
+    return CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def build(app):
+    """
+    Fingerprints and pre-compresses every pipeline asset. Files that already
+    exist in the build folder are content-addressed, so they are left alone.
+    Returns the manifest {source path: hashed path}.
+    """
+    static_dir = app.static_folder
+    build_dir = app.config['ASSETS_BUILD_FOLDER']
+    url_prefix = app.static_url_path
+
+    sources = []
+    for top in SOURCE_DIRS:
+        for root, _, files in os.walk(os.path.join(static_dir, top)):
+            for name in files:
+                full = os.path.join(root, name)
+                sources.append(os.path.relpath(full, static_dir).replace(os.sep, '/'))
+
+    # CSS last: its content (and so its hash) depends on the assets it references
+    sources.sort(key=lambda rel: (rel.endswith('.css'), rel))
+
+    manifest = {}
+    for rel in sources:
+        with open(os.path.join(static_dir, rel), 'rb') as f:
+            content = f.read()
+        if rel.endswith('.css'):
+            content = _rewrite_css(rel, content, manifest, url_prefix)
+
+        hashed = _hashed_name(rel, content)
+        manifest[rel] = hashed
+
+        out = os.path.join(build_dir, hashed)
+        if os.path.exists(out):
+            continue
+        _write_atomic(out, content)
+
+        if posixpath.splitext(rel)[1] in COMPRESSIBLE and len(content) >= MIN_COMPRESS_SIZE:
+            _write_atomic(out + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write_atomic(out + '.br', brotli.compress(content, quality=11))
+
+    _write_atomic(os.path.join(build_dir, 'manifest.json'), json.dumps(manifest, indent=1).encode())
+    return manifest
+
+
+def init_app(app):
+    """Builds the assets and routes url_for('static') / the static endpoint through them."""
+    if not app.config['ASSETS_FINGERPRINT']:
+        return
+
+    manifest = build(app)
+    build_dir = app.config['ASSETS_BUILD_FOLDER']
+    app.extensions['assets'] = manifest
+    send_static = app.view_functions['static']
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def serve_static(filename):
+        # Hashed names from any build (so pages cached before a deploy keep working)
+        path = safe_join(build_dir, filename)
+        if path is None or filename.endswith(('.gz', '.br')) or not os.path.isfile(path):
+            return send_static(filename=filename)
+        return _send_built(path)
+
+    app.view_functions['static'] = serve_static
+
+
+def _send_built(path):
+    """Sends a built asset, pre-compressed when the client allows it."""
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    accepted = request.accept_encodings
+
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[candidate] and os.path.isfile(path + suffix):
+            encoding, path = candidate, path + suffix
+            break
+
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def inline_css(app, rel_path):
+    """
+    Built contents of a stylesheet for inlining as critical CSS, or None when
+    inlining is off (the page then links the stylesheet as usual). Only built
+    CSS can be inlined: its url(...) references have been made absolute.
+    """
+    manifest = app.extensions.get('assets')
+    if not app.config['ASSETS_INLINE_CRITICAL_CSS'] or not manifest or rel_path not in manifest:
+        return None
+
+    cache = app.extensions.setdefault('assets_inline', {})
+    if rel_path not in cache:
+        with open(os.path.join(app.config['ASSETS_BUILD_FOLDER'], manifest[rel_path]), encoding='utf-8') as f:
+            cache[rel_path] = Markup(f.read())
+    return cache[rel_path]
@@ -0,0 +1,385 @@
+"""
+Latency / throughput benchmark against a real server process.
+
+    python bench/seed.py --scale 100000
+    python bench/run.py --mode waitress:4 --mode waitress:8 --mode gunicorn:4
+    python bench/run.py --scenario home --scenario like --duration 30 --concurrency 16
+    python bench/run.py --out baseline.json
+    python bench/run.py --compare baseline.json      # exits 1 on a p95 regression
+
+Each mode starts the app the way production does (run_waitress.py with
+THREADS=n, or boot.sh with WORKERS=n) against the bench database, then hits
+one scenario at a time from --concurrency keep-alive clients for --duration
+seconds and reports p50/p95/p99 latency, requests per second, errors and the
+server's peak resident memory (all its processes, Linux only).
+
+The server writes uploads and its page cache into a temporary folder, so
+nothing under static/ or instance/ besides the bench database is touched.
+Standard library only, apart from Pillow / pillow_heif (already app
+dependencies) to build the HEIC upload.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = '127.0.0.1'
+
+
+# ==========================================
+# 1. SCENARIOS
+# ==========================================
+# Each returns (method, path, body, headers) for one request
+
+def heic_upload_body():
+    """A 12MP HEIC photo, built once, like the ones iPhones send."""
+    from PIL import Image
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+
+    rng = random.Random(7)
+    img = Image.effect_noise((4032, 3024), 40).convert('RGB')
+    img = Image.merge('RGB', [band.point(lambda v, k=k: (v + k) % 256) for k, band in
+                              enumerate(img.split(), start=rng.randint(0, 80))])
+    buf = io.BytesIO()
+    img.save(buf, format='HEIF', quality=60)
+    return buf.getvalue()
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    out = io.BytesIO()
+    for name, value in fields.items():
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, content_type) in files.items():
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                  f'Content-Type: {content_type}\r\n\r\n'.encode())
+        out.write(content)
+        out.write(b'\r\n')
+    out.write(f'--{boundary}--\r\n'.encode())
+    return out.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+def build_scenarios(review_ids):
+    heic = {}
+
+    def home(rng):
+        hair = rng.choice(['all', 'all', 'Curly', 'Wavy', 'Coily'])
+        return 'GET', f'/?hair={hair}', None, {}
+
+    def reviews(rng):
+        query = urlencode({'sort': rng.choice(['kudos', 'newest']), 'stars': rng.choice(['all', '5', '4'])})
+        return 'GET', f'/reviews?{query}', None, {}
+
+    def about(rng):
+        return 'GET', '/about-me', None, {}
+
+    def like(rng):
+        # A fresh User-Agent per click: measures the normal path, not the per-client rate limit
+        headers = {'User-Agent': f'bench-{rng.getrandbits(48):x}', 'Content-Length': '0'}
+        return 'POST', f'/reviews/like/{rng.choice(review_ids)}', b'', headers
+
+    def appointment(rng):
+        body = urlencode({
+            'name': 'Bench Client', 'phone': f'9{rng.randrange(10 ** 9):09d}', 'branch': 'Jaipur',
+            'service': 'Curly Cut', 'date': '2030-01-01',
+        }).encode()
+        return 'POST', '/appointment', body, {'Content-Type': 'application/x-www-form-urlencoded'}
+
+    def upload(rng):
+        if 'body' not in heic:
+            heic['body'] = heic_upload_body()
+        body, content_type = multipart(
+            {'name': 'Bench', 'phone': f'9{rng.randrange(10 ** 9):09d}', 'branch': 'Jaipur',
+             'rating': '5', 'content': 'Benchmark review'},
+            {'image_back': ('IMG_0001.HEIC', heic['body'], 'image/heic')}
+        )
+        return 'POST', '/reviews', body, {'Content-Type': content_type}
+
+    return {'home': home, 'reviews': reviews, 'about': about, 'like': like,
+            'appointment': appointment, 'upload': upload}
+
+
+# ==========================================
+# 2. SERVER PROCESS
+# ==========================================
+
+def start_server(mode, size, port, db_path, scratch, page_cache):
+    env = dict(os.environ,
+               DATABASE_PATH=db_path, PORT=str(port),
+               UPLOAD_FOLDER=os.path.join(scratch, 'uploads'),
+               PAGE_CACHE_PATH=os.path.join(scratch, 'page_cache.db'),
+               METRICS_DIR=os.path.join(scratch, 'metrics'),
+               THROTTLE_PATH=os.path.join(scratch, 'throttle.db'),
+               # One client hammering the forms is the point of a benchmark
+               THROTTLE_ENABLED='0')
+    for sub in ('before', 'after', 'reviews', 'reels'):
+        os.makedirs(os.path.join(scratch, 'uploads', sub), exist_ok=True)
+    if page_cache:
+        env['PAGE_CACHE_BACKEND'] = page_cache
+
+    if mode == 'waitress':
+        env['THREADS'] = str(size)
+        command = [sys.executable, 'run_waitress.py']
+    elif mode == 'gunicorn':
+        env['WORKERS'] = str(size)
+        command = ['bash', 'boot.sh']
+    else:
+        raise SystemExit(f"Unknown mode {mode!r} (use waitress:N or gunicorn:N)")
+
+    log = open(os.path.join(scratch, f'{mode}-{size}.log'), 'wb')
+    proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{mode}:{size} exited during startup, see {log.name}")
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.3)
+    stop_server(proc)
+    raise SystemExit(f"{mode}:{size} did not answer /health within 60s, see {log.name}")
+
+
+def stop_server(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+def tree_rss_kb(root_pid):
+    """Resident memory of a process and all its descendants, from /proc (None elsewhere)."""
+    if not os.path.isdir('/proc'):
+        return None
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+
+    pids, frontier = {root_pid}, [root_pid]
+    while frontier:
+        pid = frontier.pop()
+        children = [child for child, parent in parents.items() if parent == pid]
+        pids.update(children)
+        frontier.extend(children)
+
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+# ==========================================
+# 3. LOAD GENERATOR
+# ==========================================
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def drive(port, scenario, concurrency, duration, warmup, seed):
+    latencies, errors, statuses = [], [0], {}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def client(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        conn = http.client.HTTPConnection(HOST, port, timeout=60)
+        local = []
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            method, path, body, headers = scenario(rng)
+            began = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(HOST, port, timeout=60)
+                status = 'error'
+            elapsed = time.perf_counter() - began
+
+            if began >= measure_from:
+                local.append(elapsed)
+                with lock:
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if status == 'error' or status >= 500:
+                        errors[0] += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        'errors': errors[0],
+        'statuses': {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+
+
+def sample_rss(proc, stop, peak):
+    while not stop.is_set():
+        rss = tree_rss_kb(proc.pid)
+        if rss is not None:
+            peak[0] = max(peak[0] or 0, rss)
+        stop.wait(0.5)
+
+
+def review_ids_from(db_path, limit=5000):
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    try:
+        ids = [row[0] for row in conn.execute('SELECT id FROM review WHERE is_approved = 1 LIMIT ?', (limit,))]
+    finally:
+        conn.close()
+    if not ids:
+        raise SystemExit(f"No approved reviews in {db_path}; run bench/seed.py first")
+    return ids
+
+
+# ==========================================
+# 4. ENTRY POINT
+# ==========================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default=os.path.join(ROOT, 'instance', 'bench.db'))
+    parser.add_argument('--mode', action='append', help='waitress:N or gunicorn:N (repeatable, default waitress:4)')
+    parser.add_argument('--scenario', action='append',
+                        help='home, reviews, about, like, appointment, upload (repeatable, default all)')
+    parser.add_argument('--duration', type=float, default=10, help='measured seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=2, help='unmeasured seconds before each scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--page-cache', choices=['memory', 'sqlite', 'none'],
+                        help="server's PAGE_CACHE_BACKEND (default: what the mode uses in production)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write results as JSON')
+    parser.add_argument('--compare', help='baseline JSON from --out; exit 1 if any p95 regresses')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='allowed p95 growth (0.2 = +20%%)')
+    return parser.parse_args()
+
+
+def print_table(results):
+    header = f"{'mode':<12} {'scenario':<12} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'peak RSS MB':>12}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        rss = f"{r['peak_rss_kb'] / 1024:.0f}" if r['peak_rss_kb'] else '-'
+        print(f"{r['mode']:<12} {r['scenario']:<12} {r['rps']:>8} {r['p50_ms'] or '-':>8} {r['p95_ms'] or '-':>8} "
+              f"{r['p99_ms'] or '-':>8} {r['errors']:>7} {rss:>12}")
+
+
+def compare(results, baseline_path, max_regression):
+    with open(baseline_path) as f:
+        baseline = {(r['mode'], r['scenario']): r for r in json.load(f)['results']}
+
+    regressions = []
+    for r in results:
+        before = baseline.get((r['mode'], r['scenario']))
+        if not before or not before['p95_ms'] or not r['p95_ms']:
+            continue
+        if r['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{r['mode']} {r['scenario']}: p95 {before['p95_ms']}ms -> {r['p95_ms']}ms")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    db_path = os.path.abspath(args.db)
+    if not os.path.exists(db_path):
+        raise SystemExit(f"{db_path} does not exist; run bench/seed.py first")
+
+    scenarios = build_scenarios(review_ids_from(db_path))
+    names = args.scenario or list(scenarios)
+    unknown = set(names) - set(scenarios)
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    results = []
+    for spec in args.mode or ['waitress:4']:
+        mode, _, size = spec.partition(':')
+        size = int(size or 4)
+        scratch = tempfile.mkdtemp(prefix='curl-bench-')
+        proc = start_server(mode, size, args.port, db_path, scratch, args.page_cache)
+        try:
+            for name in names:
+                stop, peak = threading.Event(), [None]
+                sampler = threading.Thread(target=sample_rss, args=(proc, stop, peak), daemon=True)
+                sampler.start()
+                stats = drive(args.port, scenarios[name], args.concurrency, args.duration, args.warmup, args.seed)
+                stop.set()
+                sampler.join()
+                results.append({'mode': spec, 'scenario': name, 'concurrency': args.concurrency,
+                                'peak_rss_kb': peak[0], **stats})
+                print(f"   {spec} {name}: {stats['rps']} req/s, p95 {stats['p95_ms']} ms", flush=True)
+        finally:
+            stop_server(proc)
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    print()
+    print_table(results)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'db': db_path, 'duration': args.duration, 'results': results}, f, indent=1)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No p95 regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Seeds a benchmark database with synthetic works, reviews and appointments.
+
+    python bench/seed.py --scale 100000            # -> instance/bench.db
+    python bench/seed.py --scale 1000000 --reset
+    python bench/seed.py --db instance/database.db --scale 1000 --force
+
+--scale is the number of reviews; works get a tenth of that and
+appointments the same number, spread over --clients distinct phone numbers.
+Rows reference image file names that don't exist on disk: page rendering
+never reads the files, only their names and variant widths.
+
+Writes to a separate database by default so the real one is never touched.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HAIR_TYPES = ['Curly', 'Wavy', 'Coily', 'Straight', 'Color']
+BRANCHES = ['Jaipur', 'Udaipur', 'Delhi']
+SERVICES = ['Curly Cut', 'Hydration Treatment', 'Color', 'Consultation']
+NAMES = ['Aanya', 'Riya', 'Kabir', 'Ishaan', 'Meera', 'Zoya', 'Arjun', 'Tara', 'Neel', 'Sara']
+WORDS = ('curls love cut amazing bouncy frizz gone defined hydrated best salon '
+         'arpit knows texture waves coils soft shiny happy again finally').split()
+RATINGS = [5] * 14 + [4] * 4 + [3, 2, 1]
+WIDTHS = [320, 640, 1280]
+BATCH = 10000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default=os.path.join(ROOT, 'instance', 'bench.db'))
+    parser.add_argument('--scale', type=int, default=10000, help='number of reviews (1k-1M)')
+    parser.add_argument('--works', type=int, help='default: scale / 10')
+    parser.add_argument('--appointments', type=int, help='default: scale')
+    parser.add_argument('--clients', type=int, help='distinct phone numbers, default: scale / 5')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='delete the database file first')
+    parser.add_argument('--force', action='store_true', help='allow seeding instance/database.db')
+    return parser.parse_args()
+
+
+def random_time(rng, now):
+    return now - timedelta(seconds=rng.randint(0, 2 * 365 * 24 * 3600))
+
+
+def batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    args = parse_args()
+    db_path = os.path.abspath(args.db)
+    if db_path == os.path.join(ROOT, 'instance', 'database.db') and not args.force:
+        sys.exit("Refusing to seed the real database without --force")
+    if args.reset:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    # Point the app at the bench database before it is imported
+    os.environ['DATABASE_PATH'] = db_path
+    os.environ.setdefault('PAGE_CACHE_BACKEND', 'none')
+    os.chdir(ROOT)
+
+    from sqlalchemy import insert
+    from app import app, init_db
+    from models import db, Work, Review, Appointment
+    import clients
+    import review_stats
+
+    works = args.works if args.works is not None else max(1, args.scale // 10)
+    appointments = args.appointments if args.appointments is not None else args.scale
+    phones = [f"9{n:09d}" for n in random.Random(args.seed).sample(range(10 ** 9), max(1, args.clients or args.scale // 5))]
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+
+    def image(prefix, i):
+        name = f"{prefix}{i:07d}.jpg"
+        return name, {name: WIDTHS}
+
+    def work_rows():
+        for i in range(works):
+            before, before_variants = image('benchb', i)
+            after, after_variants = image('bencha', i)
+            yield {
+                'title': f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} Transformation",
+                'hair_type': rng.choice(HAIR_TYPES),
+                'cost': str(rng.randrange(1500, 6000, 100)),
+                'before_image': before,
+                'after_image': after,
+                'reel_link': 'https://www.instagram.com/reel/bench/embed' if rng.random() < 0.3 else None,
+                'created_at': random_time(rng, now),
+                'variants': {**before_variants, **after_variants},
+            }
+
+    def review_rows():
+        for i in range(args.scale):
+            has_photo = rng.random() < 0.2
+            photo, variants = image('benchr', i)
+            yield {
+                'customer_name': rng.choice(NAMES),
+                'phone_number': rng.choice(phones),
+                'branch': rng.choice(BRANCHES),
+                'image_back': photo if has_photo else None,
+                'variants': variants if has_photo else None,
+                'kudos': int(rng.paretovariate(1.5)) - 1,
+                'rating': rng.choice(RATINGS),
+                'content': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 40))),
+                'is_approved': rng.random() < 0.9,
+                'is_featured': i < 3,
+                'created_at': random_time(rng, now),
+            }
+
+    def appointment_rows():
+        for _ in range(appointments):
+            yield {
+                'customer_name': rng.choice(NAMES),
+                'phone_number': rng.choice(phones),
+                'service': rng.choice(SERVICES),
+                'date_requested': (now + timedelta(days=rng.randint(1, 60))).strftime('%Y-%m-%d'),
+                'branch': rng.choice(BRANCHES),
+                'is_confirmed': rng.random() < 0.7,
+                'created_at': random_time(rng, now),
+            }
+
+    with app.app_context():
+        init_db()
+        for model, rows, count in ((Work, work_rows(), works),
+                                   (Review, review_rows(), args.scale),
+                                   (Appointment, appointment_rows(), appointments)):
+            started = time.perf_counter()
+            for batch in batches(rows):
+                db.session.execute(insert(model), batch)
+                db.session.commit()
+            print(f"✅ {count} {model.__tablename__} rows in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        review_stats.rebuild()
+        linked, _ = clients.rebuild()
+        print(f"✅ Rating summary and {linked} client links rebuilt in {time.perf_counter() - started:.1f}s")
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+    print(f"✅ Seeded {db_path}")
+
+
+if __name__ == '__main__':
+    main()
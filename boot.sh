@@ -1,7 +1,16 @@
 #!/bin/bash
 
-# This script activates Gunicorn with 4 workers
+# This script activates Gunicorn with 4 workers (WORKERS / PORT override)
 # It binds to 0.0.0.0 so the internet can see it
 
+# One request at a time per worker: size the DB connection pool for that
+export SERVER_MODE=${SERVER_MODE:-gunicorn}
+
+# Schema upgrades run once here, not in every worker
+echo "Preparing database..."
+flask --app app init-db || exit 1
+
+# --preload: the app is set up once in the master and the workers are forked
+# from it ready to serve (each opens its own DB connections after the fork)
 echo "Starting Gunicorn..."
-exec gunicorn -w 4 -b 0.0.0.0:8000 app:app
\ No newline at end of file
+exec gunicorn --preload -w ${WORKERS:-4} -b 0.0.0.0:${PORT:-8000} 'app:create_app()'
\ No newline at end of file
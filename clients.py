@@ -0,0 +1,225 @@
+"""
+Client records for the admin CRM.
+
+Every appointment and review is linked to a Client keyed by its phone number
+in E.164 form, so the same person typing "+91 70147 90175", "07014790175" or
+"7014790175" ends up as one client. The per-client counters (bookings,
+confirmed visits, reviews, rating total) are denormalized onto the Client row
+and adjusted with atomic UPDATEs in the same transaction as the change, so
+the client list never has to touch the appointment or review tables.
+"""
+import re
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, text, update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Client, Appointment, ArchivedAppointment, Review
+
+
+def normalize_phone(raw, default_country=None):
+    """
+    E.164 form of a phone number ('+917014790175'), or None if it can't be one.
+    Numbers without a country code get PHONE_DEFAULT_COUNTRY (India).
+    """
+    if not raw:
+        return None
+    if default_country is None:
+        default_country = current_app.config['PHONE_DEFAULT_COUNTRY']
+
+    raw = raw.strip()
+    digits = re.sub(r'\D', '', raw)
+
+    if raw.startswith('+'):
+        pass                                        # already international
+    elif digits.startswith('00'):
+        digits = digits[2:]                         # 00 international prefix
+    elif len(digits) == 11 and digits.startswith('0'):
+        digits = default_country + digits[1:]       # national trunk prefix: 07014790175
+    elif len(digits) == 10:
+        digits = default_country + digits           # plain local mobile number
+    # Anything else is taken to already carry its country code (917014790175)
+
+    if not 8 <= len(digits) <= 15 or digits.startswith('0'):
+        return None
+    return '+' + digits
+
+
+def _client_for(phone, name):
+    """Finds or creates the client for a raw phone number; None if it isn't a valid number."""
+    e164 = normalize_phone(phone)
+    if e164 is None:
+        return None
+    # Insert-or-ignore: two workers may book the same new number at once
+    db.session.execute(
+        insert(Client)
+        .values(phone=e164, name=name, created_at=datetime.utcnow(), last_seen_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=[Client.phone])
+    )
+    return Client.query.filter_by(phone=e164).one()
+
+
+def _bump(client_id, touch_name=None, **deltas):
+    values = {column: getattr(Client, column) + delta for column, delta in deltas.items()}
+    if touch_name:
+        # New activity: latest name wins and the client moves to the top of the list
+        values.update(name=touch_name, last_seen_at=datetime.utcnow())
+    db.session.execute(update(Client).where(Client.id == client_id).values(**values))
+
+
+def _bump_many(deltas):
+    """
+    _bump() for many clients in one executemany, {client_id: {column: delta}}.
+    Every row carries every column, a client without a change in one adding 0.
+    """
+    if not deltas:
+        return
+    columns = sorted({column for client in deltas.values() for column in client})
+    table = Client.__table__
+    db.session.connection().execute(
+        update(table).where(table.c.id == bindparam('client_id'))
+        .values({column: table.c[column] + bindparam(f'd_{column}') for column in columns}),
+        [{'client_id': client_id, **{f'd_{column}': client.get(column, 0) for column in columns}}
+         for client_id, client in deltas.items()]
+    )
+
+
+# ==========================================
+# 1. COUNTER UPKEEP (the caller commits)
+# ==========================================
+
+def record_appointment(apt, delta):
+    """+1 for a new booking (linking it to its client first), -1 when it is deleted."""
+    if delta > 0:
+        client = _client_for(apt.phone_number, apt.customer_name)
+        apt.client_id = client.id if client else None
+    if apt.client_id is None:
+        return
+
+    deltas = {'appointment_count': delta}
+    if apt.is_confirmed:
+        deltas['visit_count'] = delta
+    _bump(apt.client_id, touch_name=apt.customer_name if delta > 0 else None, **deltas)
+
+
+def record_confirmation(apt):
+    """An appointment went from pending to confirmed."""
+    if apt.client_id is not None:
+        _bump(apt.client_id, visit_count=1)
+
+
+def record_review(review, delta):
+    """+1 for a new review (linking it to its client first), -1 when it is deleted."""
+    if delta > 0:
+        client = _client_for(review.phone_number, review.customer_name)
+        review.client_id = client.id if client else None
+    if review.client_id is None:
+        return
+
+    _bump(review.client_id, touch_name=review.customer_name if delta > 0 else None,
+          review_count=delta, rating_sum=delta * review.rating)
+
+
+def record_confirmations(appointments):
+    """record_confirmation() for many appointments at once, in one executemany."""
+    confirmed = Counter(apt.client_id for apt in appointments if apt.client_id is not None)
+    _bump_many({client_id: {'visit_count': count} for client_id, count in confirmed.items()})
+
+
+def record_removed(appointments=(), reviews=()):
+    """
+    record_appointment() / record_review() with -1 for many rows being
+    deleted at once (bulk moderation), in one executemany over the clients.
+    """
+    deltas = {}
+    for apt in appointments:
+        if apt.client_id is not None:
+            client = deltas.setdefault(apt.client_id, Counter())
+            client['appointment_count'] -= 1
+            if apt.is_confirmed:
+                client['visit_count'] -= 1
+    for review in reviews:
+        if review.client_id is not None:
+            client = deltas.setdefault(review.client_id, Counter())
+            client['review_count'] -= 1
+            client['rating_sum'] -= review.rating
+
+    _bump_many(deltas)
+
+
+# ==========================================
+# 2. BACKFILL / REPAIR
+# ==========================================
+
+# Archived bookings (see archive.py) still count
+RECOUNT_SQL = """
+    UPDATE client SET
+        appointment_count = (SELECT count(*) FROM appointment WHERE client_id = client.id)
+                          + (SELECT count(*) FROM archived_appointment WHERE client_id = client.id),
+        visit_count = (SELECT count(*) FROM appointment WHERE client_id = client.id AND is_confirmed = 1)
+                    + (SELECT count(*) FROM archived_appointment WHERE client_id = client.id AND is_confirmed = 1),
+        review_count = (SELECT count(*) FROM review WHERE client_id = client.id),
+        rating_sum = (SELECT coalesce(sum(rating), 0) FROM review WHERE client_id = client.id),
+        last_seen_at = max(
+            coalesce((SELECT max(created_at) FROM appointment WHERE client_id = client.id), created_at),
+            coalesce((SELECT max(created_at) FROM archived_appointment WHERE client_id = client.id), created_at),
+            coalesce((SELECT max(created_at) FROM review WHERE client_id = client.id), created_at)
+        )
+"""
+
+
+def rebuild(batch_size=1000):
+    """
+    Links every unlinked appointment / review to its client (creating and
+    merging clients by normalized phone), then recomputes every client's
+    counters from scratch. Returns (rows linked, unusable phone numbers).
+    """
+    by_phone = {client.phone: client for client in Client.query.all()}
+    latest_name = {}   # phone -> (created_at, name) of the newest row seen
+    linked = skipped = 0
+
+    for model in (Appointment, ArchivedAppointment, Review):
+        rows = (db.session.query(model.id, model.phone_number, model.customer_name, model.created_at)
+                .filter(model.client_id.is_(None), model.phone_number.isnot(None))
+                .all())
+
+        links = []
+        for row_id, phone, name, created_at in rows:
+            e164 = normalize_phone(phone)
+            if e164 is None:
+                skipped += 1
+                continue
+
+            client = by_phone.get(e164)
+            if client is None:
+                client = by_phone[e164] = Client(phone=e164, name=name, created_at=created_at)
+                db.session.add(client)
+                db.session.flush()
+            if created_at and created_at >= latest_name.get(e164, (created_at, None))[0]:
+                latest_name[e164] = (created_at, name)
+            links.append({'id': row_id, 'client_id': client.id})
+
+            if len(links) >= batch_size:
+                db.session.execute(update(model), links)
+                linked += len(links)
+                links = []
+
+        if links:
+            db.session.execute(update(model), links)
+            linked += len(links)
+
+    for e164, (_, name) in latest_name.items():
+        by_phone[e164].name = name
+    db.session.execute(text(RECOUNT_SQL))
+    db.session.commit()
+    return linked, skipped
+
+
+def ensure_built():
+    """Creates the client records on first boot after upgrading, when the table is still empty."""
+    if Client.query.first() is None and (Appointment.query.first() is not None or
+                                         Review.query.filter(Review.phone_number.isnot(None)).first() is not None):
+        linked, skipped = rebuild()
+        print(f"✅ Client records built: {linked} bookings/reviews linked, {skipped} unusable phone numbers.")
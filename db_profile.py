@@ -0,0 +1,108 @@
+"""
+SQLite tuning profile.
+
+Every pooled connection gets the same pragmas the moment it is opened:
+- journal_mode=WAL: readers never block the writer and vice versa.
+- synchronous=NORMAL: safe with WAL (a power cut can lose the last commits,
+  never corrupt the file) and far fewer fsyncs than FULL.
+- busy_timeout: a writer waits for the lock instead of failing straight away
+  with "database is locked" when two bookings land at the same moment.
+- cache_size / mmap_size: keep the hot pages in memory.
+
+Pool sizes depend on how the app is served (SERVER_MODE): a gunicorn sync
+worker only ever runs one request at a time, waitress runs a thread pool in a
+single process, and each process also has the image dispatcher and kudos
+flusher threads.
+"""
+import os
+
+from sqlalchemy import event
+
+from models import db
+
+# SERVER_MODE -> SQLAlchemy pool settings
+POOL_PROFILES = {
+    'gunicorn': {'pool_size': 3, 'max_overflow': 2},    # 1 request thread + background threads
+    'waitress': {'pool_size': 6, 'max_overflow': 4},    # 4 request threads + background threads
+    'dev': {'pool_size': 5, 'max_overflow': 10},        # SQLAlchemy defaults
+}
+
+SYNCHRONOUS_NAMES = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured server mode."""
+    mode = config['SERVER_MODE']
+    if mode not in POOL_PROFILES:
+        raise ValueError(f"Unknown SERVER_MODE: {mode!r}")
+
+    options = dict(POOL_PROFILES[mode])
+    options['pool_timeout'] = 10
+    # Python's sqlite3 busy handler, in seconds (kept in step with the pragma below)
+    options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+    return options
+
+
+def pragmas(config):
+    """Pragma statements run on every new connection, in order."""
+    return [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        # Negative cache_size means KiB rather than pages
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def init_app(app):
+    """Applies the pragmas to every connection the engine opens. Call after db.init_app()."""
+    statements = pragmas(app.config)
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    with app.app_context():
+        engine = db.engine
+        event.listen(engine, 'connect', on_connect)
+
+    # gunicorn --preload forks workers from a master that may already hold
+    # pooled connections: a child must open its own, never reuse the parent's
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+
+def active_settings():
+    """What a pooled connection actually reports, for the startup check. Needs an app context."""
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        settings = {}
+        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size'):
+            settings[name] = cursor.execute(f'PRAGMA {name}').fetchone()[0]
+        return settings
+    finally:
+        conn.close()
+
+
+def report(app):
+    """Prints the active profile and warns when SQLite didn't accept part of it."""
+    settings = active_settings()
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    synchronous = SYNCHRONOUS_NAMES.get(settings['synchronous'], settings['synchronous'])
+    print(f"✅ SQLite profile ({app.config['SERVER_MODE']}): "
+          f"journal={settings['journal_mode']} synchronous={synchronous} "
+          f"busy_timeout={settings['busy_timeout']}ms cache={settings['cache_size']} "
+          f"mmap={settings['mmap_size']} pool={options['pool_size']}+{options['max_overflow']}")
+
+    # WAL can be refused (e.g. on some network filesystems) and mmap disabled at compile time
+    if settings['journal_mode'].lower() != app.config['SQLITE_JOURNAL_MODE'].lower():
+        print(f"❌ SQLite refused journal_mode={app.config['SQLITE_JOURNAL_MODE']}, running in {settings['journal_mode']}")
+    if int(app.config['SQLITE_MMAP_SIZE']) and not settings['mmap_size']:
+        print("❌ SQLite mmap is unavailable on this build, mmap_size ignored")
+    return settings
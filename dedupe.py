@@ -0,0 +1,388 @@
+"""
+Duplicate uploads: exact copies are stored once, near copies are flagged.
+
+Exact copies: an ImageBlob's sha256 is the hash of the stored file (after
+any HEIC conversion), unique per subfolder. When a converted upload is
+finalized, claim() inserts its blob on that key; if the same bytes were
+stored meanwhile (two identical uploads converted at the same time), the
+row points at the existing file instead and the new copy is deleted. As a
+shortcut, the dispatcher also hashes the staged upload before converting:
+if those raw bytes were seen before (upload_sha256), the job reuses the
+stored file without converting anything. So a photo resubmitted on ten
+reviews is stored, and converted, once. ImageBlob.refcount counts the image
+columns sharing the file; release_many() only gives it up when the last one
+goes.
+
+Near copies (a re-save, screenshot or resize of the same photo): every
+stored image also gets a 64-bit difference hash (images.dhash). Comparing
+it against every stored image would be a scan, so the hash is split into
+four 16-bit bands, each one indexed. Two hashes at most 3 bits apart always
+share a band (four bands, three differing bits), and 4 bits apart almost
+always do, so the candidates come from four index lookups and only they are
+compared bit by bit.
+
+When a review's photo is ready, flag_review() sets
+Review.possible_duplicate_of to the earlier review sharing a same or
+near-identical photo, shown as a flag in the admin review log. Run
+`flask index-uploads` once to hash uploads stored before this existed.
+"""
+import os
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, delete, func, or_, text, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+
+import images
+from models import db, ImageBlob, Review, PENDING_IMAGE
+
+BANDS = 4
+BAND_BITS = 16
+
+# A near-duplicate search never looks at more candidates than this
+MAX_CANDIDATES = 500
+
+# Created by ensure_built() rather than declared on the model: databases
+# from before it may hold the same file twice, merged first
+UNIQUE_SHA_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS ux_image_blob_sha ON image_blob (subfolder, sha256)"
+
+# Flat images (blank, one colour, pure black) hash to almost all 0 bits and
+# would all "match" each other; hashes with less detail than this are skipped
+MIN_DETAIL_BITS = 8
+
+
+def bands(dhash):
+    """The hash's BANDS slices as integers, most significant first."""
+    value = int(dhash, 16)
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * (BANDS - 1 - i))) & mask for i in range(BANDS)]
+
+
+def distance(a, b):
+    """Number of differing bits between two hex hashes."""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+# ==========================================
+# 1. EXACT COPIES (content-addressed storage)
+# ==========================================
+
+def find_stored(subfolder, upload_sha256):
+    """The stored file converted from exactly these upload bytes, or None."""
+    candidates = ImageBlob.query.filter_by(subfolder=subfolder, upload_sha256=upload_sha256).order_by(ImageBlob.id)
+    for blob in candidates:
+        # The file may have been removed by hand or by gc-uploads
+        if os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], subfolder, blob.filename)):
+            return blob
+    return None
+
+
+def add_reference(blob):
+    """
+    Counts one more row using a stored file. Atomic, and False if the last
+    reference was released in the meantime (the file is gone then).
+    """
+    return db.session.execute(
+        update(ImageBlob)
+        .where(ImageBlob.id == blob.id, ImageBlob.refcount > 0)
+        .values(refcount=ImageBlob.refcount + 1)
+    ).rowcount == 1
+
+
+def _blob_values(subfolder, filename, sha256, upload_sha256, widths, dhash):
+    values = dict(subfolder=subfolder, filename=filename, sha256=sha256, upload_sha256=upload_sha256,
+                  widths=widths, refcount=1, dhash=dhash, created_at=datetime.utcnow())
+    if dhash:
+        values['band0'], values['band1'], values['band2'], values['band3'] = bands(dhash)
+    return values
+
+
+def record(subfolder, filename, sha256, widths, dhash):
+    """Registers a stored upload whose raw bytes are unknown, used by one row so far."""
+    blob = ImageBlob(**_blob_values(subfolder, filename, sha256, sha256, widths, dhash))
+    db.session.add(blob)
+    return blob
+
+
+def claim(subfolder, filename, sha256, upload_sha256, widths, dhash):
+    """
+    Registers a freshly converted upload on its (subfolder, sha256) key.
+    If the same bytes are already stored (an identical upload finished
+    first), takes a reference on that file instead. Returns the blob the row
+    should point at: when its filename isn't `filename`, the caller deletes
+    its own copy once it has committed.
+    """
+    db.session.execute(
+        insert(ImageBlob)
+        .values(**_blob_values(subfolder, filename, sha256, upload_sha256, widths, dhash))
+        .on_conflict_do_nothing(index_elements=[ImageBlob.subfolder, ImageBlob.sha256])
+    )
+    blob = ImageBlob.query.filter_by(subfolder=subfolder, sha256=sha256).one()
+    if blob.filename != filename:
+        # Never fails: the insert holds the write lock, and a blob whose last
+        # reference went is deleted in that same commit
+        add_reference(blob)
+    return blob
+
+
+def release_many(uploads):
+    """
+    Drops one reference per (subfolder, filename) pair (a pair listed twice
+    drops two), in the caller's transaction and a fixed handful of
+    statements. Returns the set of pairs nothing uses any more, whose files
+    should be deleted once the caller commits (always the case for files
+    stored before blobs were tracked).
+    """
+    counts = Counter(uploads)
+    blobs = {(subfolder, filename): blob_id for blob_id, subfolder, filename in
+             db.session.query(ImageBlob.id, ImageBlob.subfolder, ImageBlob.filename)
+             .filter(tuple_(ImageBlob.subfolder, ImageBlob.filename).in_(list(counts)))}
+    unused = {upload for upload in counts if upload not in blobs}
+    if not blobs:
+        return unused
+
+    # Relative decrements in one executemany: a concurrent add_reference() is never lost
+    table = ImageBlob.__table__
+    db.session.connection().execute(
+        update(table).where(table.c.id == bindparam('blob_id'))
+        .values(refcount=table.c.refcount - bindparam('released')),
+        [{'blob_id': blob_id, 'released': counts[upload]} for upload, blob_id in blobs.items()]
+    )
+    gone = (db.session.query(ImageBlob.id, ImageBlob.subfolder, ImageBlob.filename)
+            .filter(ImageBlob.id.in_(blobs.values()), ImageBlob.refcount <= 0)
+            .all())
+    if gone:
+        db.session.execute(delete(ImageBlob).where(ImageBlob.id.in_([blob_id for blob_id, _, _ in gone])))
+    return unused | {(subfolder, filename) for _, subfolder, filename in gone}
+
+
+# ==========================================
+# 2. NEAR COPIES (perceptual hash)
+# ==========================================
+
+def near_duplicates(subfolder, dhash, max_distance, exclude_id=None):
+    """[(distance, blob)] of stored images within max_distance bits of dhash, closest first."""
+    if not MIN_DETAIL_BITS <= bin(int(dhash, 16)).count('1') <= 64 - MIN_DETAIL_BITS:
+        return []
+
+    # subfolder is repeated in every branch so each one is a (subfolder, bandN) index search
+    b = bands(dhash)
+    candidates = (ImageBlob.query
+                  .filter(or_(*[and_(ImageBlob.subfolder == subfolder, band == value)
+                                for band, value in zip((ImageBlob.band0, ImageBlob.band1,
+                                                        ImageBlob.band2, ImageBlob.band3), b)]))
+                  .limit(MAX_CANDIDATES))
+
+    matches = []
+    for blob in candidates:
+        if blob.id == exclude_id:
+            continue
+        bits = distance(dhash, blob.dhash)
+        if bits <= max_distance:
+            matches.append((bits, blob))
+    return sorted(matches, key=lambda match: (match[0], match[1].id))
+
+
+def flag_review(review):
+    """
+    Points review.possible_duplicate_of at the earliest other review that
+    shows the same or a near-identical photo. If the only matches are newer
+    (their photos were processed first), the oldest of them is flagged
+    instead. The caller commits.
+    """
+    filenames = [name for name in (review.image_back, review.image_front) if name]
+    if not filenames:
+        return
+
+    max_distance = current_app.config['DUPLICATE_MAX_DISTANCE']
+    similar = set(filenames)
+    for blob in ImageBlob.query.filter(ImageBlob.subfolder == 'reviews', ImageBlob.filename.in_(filenames)):
+        if blob.dhash:
+            similar.update(match.filename for _, match in
+                           near_duplicates('reviews', blob.dhash, max_distance, exclude_id=blob.id))
+
+    others = [row.id for row in (db.session.query(Review.id)
+                                 .filter(Review.id != review.id,
+                                         or_(Review.image_back.in_(similar), Review.image_front.in_(similar)))
+                                 .order_by(Review.id)
+                                 .limit(20))]
+    if not others:
+        return
+    if others[0] < review.id:
+        review.possible_duplicate_of = others[0]
+    else:
+        db.session.execute(update(Review)
+                           .where(Review.id == others[0], Review.possible_duplicate_of.is_(None))
+                           .values(possible_duplicate_of=review.id))
+
+
+def forget_review(review_id):
+    """Clears the flags pointing at a review that is being deleted."""
+    forget_reviews([review_id])
+
+
+def forget_reviews(review_ids):
+    """forget_review() for many reviews deleted at once, in one UPDATE."""
+    db.session.execute(update(Review)
+                       .where(Review.possible_duplicate_of.in_(review_ids))
+                       .values(possible_duplicate_of=None))
+
+
+# ==========================================
+# 3. BACKFILL AND MIGRATION
+# ==========================================
+
+def _repoint(subfolder, old, new, widths):
+    """Points every image column using file `old` at `new` (the same bytes stored under another name)."""
+    from storage import UPLOAD_COLUMNS
+
+    for column in UPLOAD_COLUMNS[subfolder]:
+        for row in column.class_.query.filter(column == old):
+            setattr(row, column.key, new)
+            variants = dict(row.variants or {})
+            variants.pop(old, None)
+            variants[new] = widths
+            row.variants = variants
+
+
+def _fold(keeper, filename, widths, references):
+    """
+    Moves `references` rows from `filename`, a second copy of keeper's
+    bytes, onto keeper's file. Returns the copy's paths, to delete once the
+    caller has committed.
+    """
+    _repoint(keeper.subfolder, filename, keeper.filename, keeper.widths or [])
+    db.session.execute(update(ImageBlob).where(ImageBlob.id == keeper.id)
+                       .values(refcount=ImageBlob.refcount + references))
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], keeper.subfolder)
+    return [os.path.join(folder, name) for name in [filename] + images.variant_files(filename, widths or [])]
+
+
+def replace_file(subfolder, old, new, sha256, widths):
+    """
+    Moves the rows and blob of stored file `old` onto `new`, a cleaned copy
+    of it under a new name whose bytes hash to `sha256` (see
+    storage.strip_existing). If another file already holds exactly those
+    bytes, the rows go onto that one and `new` is dropped. Returns the paths
+    to delete once the caller has committed: `old` and its resized copies.
+    """
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], subfolder)
+    blob = ImageBlob.query.filter_by(subfolder=subfolder, filename=old).first()
+    keeper = None
+    if blob is not None:
+        keeper = (ImageBlob.query
+                  .filter(ImageBlob.subfolder == subfolder, ImageBlob.sha256 == sha256, ImageBlob.id != blob.id)
+                  .first())
+    if keeper is not None:
+        db.session.delete(blob)
+        return (_fold(keeper, old, widths, blob.refcount) +
+                [os.path.join(folder, name) for name in [new] + images.variant_files(new, widths)])
+
+    _repoint(subfolder, old, new, widths)
+    if blob is not None:
+        blob.filename, blob.sha256 = new, sha256
+    return [os.path.join(folder, name) for name in [old] + images.variant_files(old, widths)]
+
+
+def ensure_built():
+    """
+    Creates the unique (subfolder, sha256) index, first merging files stored
+    twice before it existed (identical uploads converted at the same time):
+    rows move to the oldest copy still on disk and the others are deleted.
+    Needs an app context.
+    """
+    from storage import remove_files
+
+    db.session.execute(text("DROP INDEX IF EXISTS ix_image_blob_sha"))
+    # Blobs recorded before upload_sha256 existed hashed the raw upload
+    db.session.execute(update(ImageBlob).where(ImageBlob.upload_sha256.is_(None))
+                       .values(upload_sha256=ImageBlob.sha256))
+
+    doomed, merged = [], 0
+    groups = (db.session.query(ImageBlob.subfolder, ImageBlob.sha256)
+              .filter(ImageBlob.sha256.isnot(None))
+              .group_by(ImageBlob.subfolder, ImageBlob.sha256)
+              .having(func.count(ImageBlob.id) > 1)
+              .all())
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for subfolder, sha256 in groups:
+        blobs = ImageBlob.query.filter_by(subfolder=subfolder, sha256=sha256).order_by(ImageBlob.id).all()
+        on_disk = [blob for blob in blobs if os.path.exists(os.path.join(upload_folder, subfolder, blob.filename))]
+        keeper = (on_disk or blobs)[0]
+        for blob in blobs:
+            if blob is not keeper:
+                doomed += _fold(keeper, blob.filename, blob.widths, blob.refcount)
+                db.session.delete(blob)
+                merged += 1
+    db.session.flush()
+    db.session.execute(text(UNIQUE_SHA_INDEX))
+    db.session.commit()
+
+    remove_files(doomed)
+    if merged:
+        print(f"✅ Merged {merged} duplicate copies of stored uploads")
+
+
+def index_existing(batch_size):
+    """
+    Registers every stored upload that has no ImageBlob yet (stored before
+    dedupe existed), hashing its file, then flags duplicate reviews. An
+    upload whose bytes are already stored under another name is folded into
+    that file. Returns (images indexed, reviews flagged). Needs an app context.
+    """
+    from storage import UPLOAD_COLUMNS, remove_files
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    known = set(db.session.query(ImageBlob.subfolder, ImageBlob.filename))
+    references, widths = Counter(), {}
+    for subfolder, columns in UPLOAD_COLUMNS.items():
+        model = columns[0].class_
+        for variants, *names in db.session.query(model.variants, *columns).yield_per(batch_size):
+            for name in names:
+                if name and name != PENDING_IMAGE and (subfolder, name) not in known:
+                    references[(subfolder, name)] += 1
+                    widths[(subfolder, name)] = (variants or {}).get(name, [])
+
+    indexed, doomed = 0, []
+    for (subfolder, name), count in references.items():
+        path = os.path.join(upload_folder, subfolder, name)
+        if not os.path.exists(path):
+            continue
+        sha256 = images.file_sha256(path)
+        keeper = ImageBlob.query.filter_by(subfolder=subfolder, sha256=sha256).first()
+        if keeper is not None:
+            doomed += _fold(keeper, name, widths[(subfolder, name)], count)
+        else:
+            try:
+                dhash = images.dhash(path)
+            except Exception as e:
+                print(f"❌ {subfolder}/{name}: {e}")
+                dhash = None
+            blob = record(subfolder, name, sha256, widths[(subfolder, name)], dhash)
+            blob.refcount = count
+        indexed += 1
+        if indexed % batch_size == 0:
+            db.session.commit()
+            remove_files(doomed)
+            doomed = []
+    db.session.commit()
+    remove_files(doomed)
+
+    last_id = 0
+    while True:
+        batch = (Review.query
+                 .filter(Review.id > last_id, or_(Review.image_back.isnot(None), Review.image_front.isnot(None)))
+                 .order_by(Review.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+        for review in batch:
+            flag_review(review)
+        db.session.commit()
+        last_id = batch[-1].id
+        db.session.expunge_all()
+
+    flagged = db.session.query(db.func.count(Review.id)).filter(Review.possible_duplicate_of.isnot(None)).scalar()
+    return indexed, flagged
@@ -0,0 +1,85 @@
+"""
+Streaming data exports for the admin hub: appointments (archived ones
+included), reviews and clients, as CSV or JSON Lines.
+
+stream() is a generator: rows are read with yield_per in batches of
+EXPORT_BATCH_SIZE and written out line by line, so an export of any size
+holds one batch in memory and the download starts straight away instead of
+after the whole file is built. The route wraps it in stream_with_context.
+"""
+import csv
+import io
+import json
+import re
+from datetime import datetime
+
+from sqlalchemy import null
+
+from models import db, Appointment, ArchivedAppointment, Review, Client
+
+# dataset -> (columns, models read one after the other). A column a model
+# doesn't have is exported empty (archived_at of a live appointment).
+DATASETS = {
+    'appointments': (
+        ('id', 'customer_name', 'phone_number', 'service', 'date_requested', 'branch',
+         'is_confirmed', 'created_at', 'client_id', 'archived_at'),
+        (Appointment, ArchivedAppointment),
+    ),
+    'reviews': (
+        ('id', 'customer_name', 'phone_number', 'branch', 'rating', 'content', 'kudos', 'is_approved',
+         'is_featured', 'image_back', 'image_front', 'created_at', 'work_id', 'client_id'),
+        (Review,),
+    ),
+    'clients': (
+        ('id', 'phone', 'name', 'appointment_count', 'visit_count', 'review_count', 'rating_sum',
+         'last_seen_at', 'created_at'),
+        (Client,),
+    ),
+}
+
+# format -> mimetype
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# A cell a spreadsheet would run as a formula ('=HYPERLINK(...)', '@SUM(...)',
+# '+cmd|...'); phone numbers like '+9170...' are left alone
+FORMULA_START = re.compile(r'^(?:[=@\t\r]|[+-](?![\d\s]))')
+
+
+def _rows(dataset, batch_size):
+    """Yields every row of a dataset as a tuple of values, in id order per model."""
+    columns, models = DATASETS[dataset]
+    for model in models:
+        selected = [getattr(model, name) if hasattr(model, name) else null().label(name) for name in columns]
+        yield from db.session.query(*selected).order_by(model.id).yield_per(batch_size)
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_cell(value):
+    value = _plain(value)
+    if isinstance(value, str) and FORMULA_START.match(value):
+        return "'" + value
+    return value
+
+
+def stream(dataset, fmt, batch_size):
+    """Yields the export of `dataset` ('appointments', 'reviews', 'clients') as 'csv' or 'jsonl' text chunks."""
+    columns, _ = DATASETS[dataset]
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+
+    for count, row in enumerate(_rows(dataset, batch_size), 1):
+        if fmt == 'csv':
+            writer.writerow([_csv_cell(value) for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False) + '\n')
+        # One chunk per batch rather than per line: fewer, fuller writes to the socket
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,358 @@
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+
+# ==========================================
+# RESPONSIVE VARIANT SETTINGS
+# ==========================================
+# Widths (px) generated for every upload. The browser picks one via srcset.
+VARIANT_WIDTHS = (320, 640, 1280)
+
+# Extension -> (Pillow format, save options)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+HEIC_EXTENSIONS = {'heic', 'heif'}
+
+# ISO-BMFF brands (bytes 8-12 of the 'ftyp' box) that pillow_heif can open
+HEIF_BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1'}
+
+# Short video clips a reel poster frame can be pulled from (needs ffmpeg)
+VIDEO_EXTENSIONS = {'mp4', 'mov'}
+VIDEO_BRANDS = {b'isom': 'mp4', b'iso2': 'mp4', b'mp41': 'mp4', b'mp42': 'mp4',
+                b'avc1': 'mp4', b'M4V ': 'mp4', b'qt  ': 'mov'}
+FFMPEG = shutil.which('ffmpeg')
+
+# JPEG APPn segments a stored original keeps (everything else, and COM, is
+# dropped): marker -> payload prefix. JFIF header, ICC colour profile, Adobe
+# colour transform. Everything after the start of scan is copied untouched.
+JPEG_KEPT_SEGMENTS = {0xE0: b'JFIF\0', 0xE2: b'ICC_PROFILE\0', 0xEE: b'Adobe'}
+EXIF_ORIENTATION = 0x0112
+
+# Pillow info keys holding PNG / WebP metadata
+IMAGE_METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'Raw profile type exif', 'comment')
+
+# Hard ceiling for any image we decode. Pillow refuses anything beyond
+# twice this as a decompression bomb, and check_dimensions() rejects
+# uploads above the (usually lower) configured limit before decoding.
+MAX_IMAGE_PIXELS = 64 * 1000 * 1000
+
+
+@functools.lru_cache(maxsize=None)
+def pillow():
+    """
+    (Image, ImageOps), imported on first use rather than at app import, so web
+    workers boot without loading Pillow and libheif until an upload needs them.
+    """
+    from PIL import Image, ImageOps
+    import pillow_heif
+
+    # Register HEIC opener so Pillow can handle .heic files
+    pillow_heif.register_heif_opener()
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    return Image, ImageOps
+
+
+def sniff_extension(head):
+    """
+    Detects the real image format from the first bytes of a file.
+    Returns the canonical extension ('jpg', 'png', 'webp', 'heic') or None.
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp' and head[8:12] in HEIF_BRANDS:
+        return 'heic'
+    return None
+
+
+def sniff_video(head):
+    """Detects an MP4 / QuickTime clip from its first bytes. Returns 'mp4', 'mov' or None."""
+    if head[4:8] == b'ftyp':
+        return VIDEO_BRANDS.get(head[8:12])
+    return None
+
+
+def check_dimensions(path, max_pixels):
+    """
+    Reads only the image header (no pixel decoding) and returns (width, height).
+    Raises ValueError if the file can't be parsed or is larger than max_pixels.
+    """
+    Image, _ = pillow()
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+    except Exception as e:
+        raise ValueError(f"unreadable image: {e}")
+
+    if width * height > max_pixels:
+        raise ValueError(f"image is {width}x{height}, over the {max_pixels} pixel limit")
+    return width, height
+
+
+def stored_extension(original_ext):
+    """Extension an upload ends up with on disk (HEIC is always converted to JPG)."""
+    return 'jpg' if original_ext in HEIC_EXTENSIONS else original_ext
+
+
+def sharded_name(filename, chars):
+    """
+    Stored name of a new upload, inside a subdirectory named after the first
+    `chars` characters of its random name, so no directory grows past a few
+    hundred files. 'abc123.jpg' -> 'ab/abc123.jpg' (unchanged if chars is 0).
+    """
+    return f"{filename[:chars]}/{filename}" if chars else filename
+
+
+def variant_name(filename, width, ext):
+    """
+    Name of a resized copy of an upload.
+    'abc123.jpg' -> 'abc123_640w.webp', 'ab/abc123.jpg' -> 'ab/abc123_640w.webp'
+    """
+    stem = filename.rsplit('.', 1)[0]
+    return f"{stem}_{width}w.{ext}"
+
+
+def target_widths(original_width):
+    """
+    Widths to generate for an image that is `original_width` px wide.
+    Never upscales: sizes wider than the original are replaced by
+    the original width itself.
+    """
+    widths = []
+    for width in VARIANT_WIDTHS:
+        if width >= original_width:
+            widths.append(original_width)
+            break
+        widths.append(width)
+    return widths
+
+
+def convert_heic(source, save_path):
+    """Decodes a HEIC/HEIF upload and writes it out as a high-quality JPG."""
+    Image, _ = pillow()
+    with Image.open(source) as img:
+        # Convert to RGB (HEIC handles transparency differently, standard JPG doesn't).
+        # Skipped when already RGB so we don't hold two full-size copies.
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(save_path, "JPEG", quality=90)
+
+
+def extract_poster(clip_path, save_path):
+    """
+    Grabs one frame of a video clip as a JPG with ffmpeg: one second in,
+    or the very first frame if the clip is shorter than that.
+    """
+    if FFMPEG is None:
+        raise RuntimeError("ffmpeg is not installed")
+
+    for offset in ('1', '0'):
+        subprocess.run(
+            [FFMPEG, '-v', 'error', '-y', '-ss', offset, '-i', clip_path,
+             '-frames:v', '1', '-vf', "scale='min(1280,iw)':-2", '-q:v', '3', save_path],
+            check=True, timeout=120, stdin=subprocess.DEVNULL
+        )
+        if os.path.exists(save_path) and os.path.getsize(save_path):
+            return
+    raise RuntimeError("no video frame could be extracted")
+
+
+def _strip_jpeg(path, dest, orientation):
+    """
+    Writes a JPEG to `dest` without its EXIF, XMP, IPTC and comment segments,
+    copying the compressed image data as is (no re-encoding). A rotated photo
+    gets back a minimal EXIF block holding only its orientation.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    kept, pos = [data[:2]], 2
+    while True:
+        if pos + 4 > len(data) or data[pos] != 0xFF:
+            return False   # not a JPEG we understand: leave it alone
+        marker = data[pos + 1]
+        if marker == 0xDA:   # start of scan: the rest is image data
+            kept.append(data[pos:])
+            break
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+        segment = data[pos:end]
+        if 0xE0 <= marker <= 0xEF or marker == 0xFE:
+            prefix = JPEG_KEPT_SEGMENTS.get(marker)
+            if prefix is None or not segment[4:].startswith(prefix):
+                pos = end
+                continue
+        kept.append(segment)
+        pos = end
+
+    if orientation not in (None, 1):
+        Image, _ = pillow()
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        payload = exif.tobytes()
+        # After the JFIF header, which has to come first if there is one
+        at = 2 if len(kept) > 2 and kept[1][:2] == b'\xff\xe0' else 1
+        kept.insert(at, b'\xff\xe1' + (len(payload) + 2).to_bytes(2, 'big') + payload)
+
+    stripped = b''.join(kept)
+    if stripped == data:
+        return False
+    with open(dest + '.tmp', 'wb') as f:
+        f.write(stripped)
+    os.replace(dest + '.tmp', dest)
+    return True
+
+
+def strip_metadata(path, dest=None):
+    """
+    Removes EXIF (GPS position, camera, timestamps), XMP and comments from a
+    stored original, which is served as is: in place, or into a new file
+    `dest`. JPEGs are rewritten losslessly and keep their orientation; PNG /
+    WebP are re-saved with the orientation applied. Animated images are left
+    alone. Returns False, writing nothing, if there was nothing to remove.
+    """
+    dest = dest or path
+    Image, ImageOps = pillow()
+    with Image.open(path) as img:
+        fmt = img.format
+        orientation = img.getexif().get(EXIF_ORIENTATION)
+        if fmt == 'JPEG':
+            pass
+        elif getattr(img, 'is_animated', False) or not any(key in img.info for key in IMAGE_METADATA_KEYS):
+            return False
+        else:
+            icc_profile = img.info.get('icc_profile')
+            clean = ImageOps.exif_transpose(img)
+            for key in IMAGE_METADATA_KEYS:
+                clean.info.pop(key, None)
+            options = {'optimize': True} if fmt == 'PNG' else {'quality': 90}
+            clean.save(dest + '.tmp', fmt, icc_profile=icc_profile, **options)
+
+    if fmt == 'JPEG':
+        return _strip_jpeg(path, dest, orientation)
+    os.replace(dest + '.tmp', dest)
+    return True
+
+
+def build_variants(source_path, dest_dir, filename):
+    """
+    Generates the resized WebP + JPG copies of an uploaded image.
+    - Applies the EXIF orientation, then drops EXIF (GPS, camera info) entirely.
+    - Writes every width in both formats next to the original.
+    Returns the list of widths that were written.
+    """
+    Image, ImageOps = pillow()
+    with Image.open(source_path) as original:
+        # JPEG only: let libjpeg decode at 1/2, 1/4 or 1/8 scale while staying
+        # at least as big as the largest variant, so a 48MP photo never gets
+        # fully decoded. Other formats ignore this.
+        largest = VARIANT_WIDTHS[-1]
+        original.draft('RGB', (largest, largest))
+
+        img = ImageOps.exif_transpose(original)
+        icc_profile = original.info.get('icc_profile')
+
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        widths = target_widths(img.width)
+
+        # Largest first, so every smaller size is resampled from an already reduced copy
+        current = img
+        for width in reversed(widths):
+            if width != current.width:
+                height = max(1, round(current.height * width / current.width))
+                current = current.resize((width, height), Image.LANCZOS)
+
+            for ext, (fmt, options) in VARIANT_FORMATS.items():
+                save_path = os.path.join(dest_dir, variant_name(filename, width, ext))
+                current.save(save_path, fmt, icc_profile=icc_profile, **options)
+
+    return widths
+
+
+def variant_files(filename, widths):
+    """Every file name produced by build_variants() for this upload."""
+    return [variant_name(filename, width, ext) for width in widths for ext in VARIANT_FORMATS]
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's bytes, read in 1MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dhash(path):
+    """
+    64-bit difference hash of an image, as 16 hex digits: the image shrunk to
+    9x8 grey pixels, one bit per pair of horizontal neighbours (is the left
+    one brighter?). Re-saved, resized or recompressed copies of a photo land
+    within a few bits of each other; different photos about 32 bits apart.
+    """
+    Image, ImageOps = pillow()
+    with Image.open(path) as img:
+        img.draft('L', (64, 64))   # JPEG: decode at 1/8 scale, it's about to become 9x8
+        small = ImageOps.exif_transpose(img).convert('L').resize((9, 8), Image.LANCZOS)
+
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def process_upload(staged_path, dest_dir, filename):
+    """
+    Turns a staged raw upload into its stored form. Runs inside a worker process.
+    - IF HEIC: Converts to JPG.
+    - IF VIDEO CLIP: Saves a poster frame as JPG (the clip itself is not kept).
+    - IF OTHER: Moves the file into place.
+    Then strips the stored file's metadata (it is served publicly) and builds
+    the responsive copies. Returns (variant widths, dhash, sha256 of the
+    stored file): the widths are empty if the copies could not be built (the
+    original is still served then), the dhash None if the image could not be
+    hashed.
+    Safe to re-run after a crash: a file already moved into place is reused.
+    """
+    save_path = os.path.join(dest_dir, filename)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+
+    if os.path.exists(staged_path):
+        staged_ext = staged_path.rsplit('.', 1)[-1].lower()
+        if staged_ext in HEIC_EXTENSIONS:
+            convert_heic(staged_path, save_path)
+            os.remove(staged_path)
+        elif staged_ext in VIDEO_EXTENSIONS:
+            extract_poster(staged_path, save_path)
+            os.remove(staged_path)
+        else:
+            shutil.move(staged_path, save_path)
+
+    # Outside the move, so a run interrupted in between still strips it
+    strip_metadata(save_path)
+
+    try:
+        widths = build_variants(save_path, dest_dir, filename)
+    except Exception as e:
+        print(f"❌ Variant Generation Failed: {e}")
+        widths = []
+
+    try:
+        perceptual = dhash(save_path)
+    except Exception as e:
+        print(f"❌ Perceptual hash failed: {e}")
+        perceptual = None
+    return widths, perceptual, file_sha256(save_path)
@@ -0,0 +1,302 @@
+"""
+Background image processing.
+
+Uploads are staged to disk by the request handler, recorded as ImageJob rows
+in the same commit as their Work/Review, and converted here by a process pool
+so HEIC decoding never blocks a web thread. Every process (each gunicorn
+worker, or the single waitress process) runs one dispatcher thread that claims
+pending rows from the DB, so jobs are shared between workers and anything
+left behind by a crash or restart is picked up again. An upload whose exact
+bytes were converted before skips conversion and reuses the file, and one
+that converts to a file already stored is folded into it (dedupe.py).
+"""
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+import dedupe
+import images
+import metrics
+import page_cache
+from models import db, ImageJob, Work, Review
+
+# Which model a job's target_type points at, and the page-cache tag it affects
+TARGETS = {'work': Work, 'review': Review}
+CACHE_TAGS = {'work': 'works', 'review': 'reviews'}
+
+_state = {'pid': None, 'app': None, 'pool': None, 'wake': None, 'in_flight': 0}
+_lock = threading.Lock()
+
+
+def _owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner):
+    """True if the process that claimed a job is still running (only checkable on this host)."""
+    if not owner or ':' not in owner:
+        return False
+    host, pid = owner.rsplit(':', 1)
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+# ==========================================
+# 1. PRODUCER SIDE (called from request handlers)
+# ==========================================
+
+def enqueue(target, field, subfolder, staged):
+    """
+    Records a staged upload for conversion. `staged` is the (staged_path, filename)
+    pair returned by stage_image(). The caller commits, then calls notify().
+    """
+    staged_path, filename = staged
+    job = ImageJob(
+        target_type=target.__tablename__,
+        target_id=target.id,
+        field=field,
+        subfolder=subfolder,
+        staged_path=staged_path,
+        filename=filename,
+        status='pending'
+    )
+    db.session.add(job)
+    return job
+
+
+def notify():
+    """Wakes this process's dispatcher so freshly committed jobs start right away."""
+    if _state['wake'] is not None:
+        _state['wake'].set()
+
+
+def status_summary(limit=20):
+    """Counts per status plus every unfinished job and the latest failures, for the admin dashboard."""
+    counts = dict(
+        db.session.query(ImageJob.status, db.func.count(ImageJob.id)).group_by(ImageJob.status).all()
+    )
+    # Both lookups ride the status index; unfinished jobs are few by nature
+    unfinished = ImageJob.query.filter(ImageJob.status.in_(['pending', 'running'])).all()
+    failed = ImageJob.query.filter_by(status='failed').order_by(ImageJob.id.desc()).limit(limit).all()
+    recent = sorted(unfinished, key=lambda job: job.id, reverse=True) + failed
+    return {
+        'pending': counts.get('pending', 0),
+        'running': counts.get('running', 0),
+        'failed': counts.get('failed', 0),
+        'done': counts.get('done', 0),
+        'jobs': [{
+            'id': job.id,
+            'target': job.target_type,
+            'target_id': job.target_id,
+            'field': job.field,
+            'status': job.status,
+            'attempts': job.attempts,
+            'error': job.error,
+        } for job in recent],
+    }
+
+
+# ==========================================
+# 2. DISPATCHER (one thread per process)
+# ==========================================
+
+def start(app):
+    """
+    Starts the dispatcher thread and process pool for the current process.
+    Safe to call on every request: it only does work once per PID, so it
+    also behaves correctly after gunicorn forks its workers.
+    """
+    if _state['pid'] == os.getpid():
+        return
+
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        _state['app'] = app
+        # Not fork: this process already runs the dispatcher, kudos, metrics and
+        # outbox threads, and a child forked while one holds a lock (logging,
+        # sqlite, the connection pool) can deadlock. Workers start clean from
+        # a forkserver; images.process_upload pickles by name.
+        _state['pool'] = ProcessPoolExecutor(max_workers=app.config['IMAGE_WORKERS'],
+                                             mp_context=multiprocessing.get_context('forkserver'))
+        _state['wake'] = threading.Event()
+        _state['in_flight'] = 0
+
+        thread = threading.Thread(target=_dispatch_loop, name='image-dispatcher', daemon=True)
+        thread.start()
+
+
+def _dispatch_loop():
+    app = _state['app']
+    wake = _state['wake']
+
+    while True:
+        try:
+            with app.app_context():
+                _reclaim_stale(app)
+                _claim_and_submit(app)
+        except Exception:
+            traceback.print_exc()
+
+        # New uploads in this process wake us immediately; jobs from other
+        # processes (or left over from a restart) are found by the poll.
+        wake.wait(app.config['IMAGE_JOB_POLL_SECONDS'])
+        wake.clear()
+
+
+def _reclaim_stale(app):
+    """Puts 'running' jobs whose process died (or that hung) back in the queue."""
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['IMAGE_JOB_TIMEOUT'])
+    for job in ImageJob.query.filter_by(status='running').all():
+        if job.updated_at < cutoff or not _owner_alive(job.claimed_by):
+            job.status = 'pending'
+            job.claimed_by = None
+    db.session.commit()
+
+
+def _claim_and_submit(app):
+    capacity = app.config['IMAGE_WORKERS'] * 2 - _state['in_flight']
+    if capacity <= 0:
+        return
+
+    candidate_ids = [row.id for row in (ImageJob.query
+                                        .with_entities(ImageJob.id)
+                                        .filter_by(status='pending')
+                                        .order_by(ImageJob.id)
+                                        .limit(capacity))]
+    for job_id in candidate_ids:
+        # Atomic claim: another process may be racing us for the same row
+        claimed = db.session.execute(
+            update(ImageJob)
+            .where(ImageJob.id == job_id, ImageJob.status == 'pending')
+            .values(status='running', claimed_by=_owner_id(),
+                    attempts=ImageJob.attempts + 1, updated_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            continue
+
+        job = db.session.get(ImageJob, job_id)
+        if _reuse_stored(job):
+            continue
+        dest_dir = os.path.join(app.config['UPLOAD_FOLDER'], job.subfolder)
+
+        with _lock:
+            _state['in_flight'] += 1
+        future = _state['pool'].submit(images.process_upload, job.staged_path, dest_dir, job.filename)
+        future.add_done_callback(lambda f, job_id=job_id, target=job.target_type, started=time.perf_counter():
+                                 _on_done(job_id, f, target, started))
+
+
+def _reuse_stored(job):
+    """
+    Finishes a job without converting anything when the same upload bytes
+    were stored before: the row just points at the existing file. Returns False
+    (after noting the upload's SHA-256 on the job) if it has to be converted.
+    """
+    if not os.path.exists(job.staged_path):
+        return False   # a retry: the upload was already moved into place
+    started = time.perf_counter()
+    job.sha256 = images.file_sha256(job.staged_path)
+    target = db.session.get(TARGETS[job.target_type], job.target_id)
+    blob = dedupe.find_stored(job.subfolder, job.sha256) if target is not None else None
+    if blob is None or not dedupe.add_reference(blob):
+        db.session.commit()
+        return False
+
+    job.filename = blob.filename
+    _attach(target, job.field, blob.filename, blob.widths or [])
+    if job.target_type == 'review':
+        dedupe.flag_review(target)
+    job.status = 'done'
+    job.error = None
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+
+    os.remove(job.staged_path)
+    metrics.observe('image_job_seconds', time.perf_counter() - started, target=job.target_type, outcome='reused')
+    page_cache.invalidate(CACHE_TAGS[job.target_type])
+    return True
+
+
+def _attach(target, field, filename, widths):
+    setattr(target, field, filename)
+    variants = dict(target.variants or {})
+    variants[filename] = widths
+    target.variants = variants
+
+
+def _on_done(job_id, future, target, started):
+    app = _state['app']
+    with _lock:
+        _state['in_flight'] -= 1
+    metrics.observe('image_job_seconds', time.perf_counter() - started,
+                    target=target, outcome='failed' if future.exception() else 'done')
+
+    try:
+        with app.app_context():
+            _finalize(app, job_id, future)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        # A slot just freed up
+        notify()
+
+
+def _finalize(app, job_id, future):
+    job = db.session.get(ImageJob, job_id)
+    job.updated_at = datetime.utcnow()
+
+    error = future.exception()
+    if error is not None:
+        print(f"❌ Image job {job_id} failed: {error}")
+        job.error = str(error)
+        job.status = 'pending' if job.attempts < app.config['IMAGE_JOB_MAX_ATTEMPTS'] else 'failed'
+        job.claimed_by = None
+        db.session.commit()
+        return
+
+    widths, dhash, sha256 = future.result()
+    target = db.session.get(TARGETS[job.target_type], job.target_id)
+    converted = [job.filename] + images.variant_files(job.filename, widths)
+    unused = []
+
+    if target is None:
+        # Deleted while we were converting: don't leave the files behind
+        unused = converted
+    else:
+        blob = dedupe.claim(job.subfolder, job.filename, sha256, job.sha256, widths, dhash)
+        if blob.filename != job.filename:
+            # An identical upload was stored first: use its file, drop ours
+            unused = converted
+            job.filename, widths = blob.filename, blob.widths or []
+        _attach(target, job.field, job.filename, widths)
+        if job.target_type == 'review':
+            dedupe.flag_review(target)
+
+    job.status = 'done'
+    job.error = None
+    db.session.commit()
+
+    dest_dir = os.path.join(app.config['UPLOAD_FOLDER'], job.subfolder)
+    for name in unused:
+        try:
+            os.remove(os.path.join(dest_dir, name))
+        except OSError:
+            pass
+
+    # The image is live now: cached gallery / review pages must show it
+    page_cache.invalidate(CACHE_TAGS[job.target_type])
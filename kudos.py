@@ -0,0 +1,142 @@
+"""
+Batched kudos counter.
+
+A click never writes to the database directly. It is checked against a
+per-client dedupe window and rate limit, then added to an in-memory tally.
+A flusher thread writes the tally every few seconds as atomic
+`kudos = kudos + n` UPDATEs in one transaction, so a viral review costs one
+short write every KUDOS_FLUSH_SECONDS instead of one per click, and there
+is no read-modify-write race between gunicorn workers.
+
+Trade-off: clicks still sitting in memory when a worker is killed with
+SIGKILL are lost (a normal shutdown flushes them).
+"""
+import atexit
+import hashlib
+import os
+import threading
+import time
+import traceback
+from collections import Counter, OrderedDict, deque
+
+from sqlalchemy import update
+
+import page_cache
+from models import db, Review
+
+_state = {'pid': None, 'app': None}
+_lock = threading.Lock()
+_pending = Counter()           # review_id -> clicks not yet written
+_seen = OrderedDict()          # (client, review_id) -> time of the counted click
+_recent = OrderedDict()        # client -> deque of recent click times, least recently active first
+
+
+def client_key(remote_addr, user_agent):
+    """Stable, anonymous id for dedupe and rate limiting (IP + browser)."""
+    return hashlib.sha1(f"{remote_addr}|{user_agent}".encode()).hexdigest()[:16]
+
+
+def add(app, client, review_id):
+    """
+    Counts one click. Returns 'counted', 'duplicate' (this client already
+    liked this review inside the dedupe window) or 'limited' (too many
+    clicks from this client in the last minute).
+    """
+    now = time.time()
+    with _lock:
+        # 1. Rate limit: sliding one-minute window per client
+        recent = _recent.setdefault(client, deque())
+        _recent.move_to_end(client)
+        while recent and recent[0] < now - 60:
+            recent.popleft()
+        if len(recent) >= app.config['KUDOS_RATE_PER_MINUTE']:
+            return 'limited'
+        recent.append(now)
+
+        # 2. Dedupe: one kudos per client per review per window
+        key = (client, review_id)
+        seen_at = _seen.get(key)
+        if seen_at is not None and seen_at > now - app.config['KUDOS_DEDUPE_SECONDS']:
+            return 'duplicate'
+        _seen[key] = now
+        _seen.move_to_end(key)
+        # Keep memory bounded under a flood of distinct clients. The least
+        # recently active go first: a client clicking right now is never
+        # forgotten, so it can't reset its own limit.
+        while len(_seen) > app.config['KUDOS_DEDUPE_MAX_CLIENTS']:
+            _seen.popitem(last=False)
+        while len(_recent) > app.config['KUDOS_DEDUPE_MAX_CLIENTS']:
+            _recent.popitem(last=False)
+
+        _pending[review_id] += 1
+        return 'counted'
+
+
+def pending_for(review_id):
+    """Clicks on this review accepted by this process but not flushed yet."""
+    with _lock:
+        return _pending.get(review_id, 0)
+
+
+def flush():
+    """Writes every buffered click in a single transaction. Needs an app context."""
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+    if not batch:
+        return 0
+
+    try:
+        for review_id, count in batch.items():
+            db.session.execute(
+                update(Review).where(Review.id == review_id).values(kudos=Review.kudos + count)
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Put the clicks back so the next flush retries them
+        with _lock:
+            _pending.update(batch)
+        raise
+
+    page_cache.invalidate('reviews')
+    return sum(batch.values())
+
+
+def start(app):
+    """Starts this process's flusher thread (once per PID, so fork-safe)."""
+    if _state['pid'] == os.getpid():
+        return
+
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        # Clicks inherited through fork belong to the parent
+        _pending.clear()
+        _state['pid'] = os.getpid()
+        _state['app'] = app
+
+        thread = threading.Thread(target=_flush_loop, name='kudos-flusher', daemon=True)
+        thread.start()
+        atexit.register(_flush_at_exit)
+
+
+def _flush_loop():
+    app = _state['app']
+    while True:
+        time.sleep(app.config['KUDOS_FLUSH_SECONDS'])
+        try:
+            with app.app_context():
+                flush()
+        except Exception:
+            traceback.print_exc()
+
+
+def _flush_at_exit():
+    if _state['pid'] != os.getpid():
+        return
+    try:
+        with _state['app'].app_context():
+            flush()
+    except Exception:
+        traceback.print_exc()
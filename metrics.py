@@ -0,0 +1,332 @@
+"""
+Request metrics in Prometheus format.
+
+Every request is timed end to end, and while it runs we also count its SQL
+statements and their time (SQLAlchemy engine events), time each
+render_template() (Flask's template signals) and time any named block
+wrapped in timer(), such as staging an upload. The numbers go into
+histograms, served as Prometheus text by /metrics.
+
+Each process keeps its own histograms in memory and a flusher thread writes
+them to METRICS_DIR/<pid>.json every METRICS_FLUSH_SECONDS. /metrics adds up
+every process's file, so a scrape that lands on any one gunicorn worker still
+sees the whole server. Files left by processes that no longer exist are
+removed when a new process starts (Prometheus treats the drop as a counter
+reset).
+
+A request slower than METRICS_SLOW_REQUEST_MS prints a trace: where the time
+went, and its SQL grouped by statement, so an N+1 shows up as one statement
+run dozens of times. In testing mode a request that runs more than
+QUERY_BUDGET statements fails outright with the same trace.
+"""
+import atexit
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+import traceback
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+from models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+IMAGE_JOB_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# name -> (help, label names, buckets)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Time from the first before_request hook to the response',
+                                      ('endpoint', 'method', 'status'), LATENCY_BUCKETS),
+    'http_request_db_queries': ('SQL statements run by one request', ('endpoint',), QUERY_COUNT_BUCKETS),
+    'http_request_db_seconds': ('Time one request spent in SQL', ('endpoint',), LATENCY_BUCKETS),
+    'template_render_seconds': ('Time spent in render_template()', ('template',), LATENCY_BUCKETS),
+    'image_stage_seconds': ('Time a request spent parking and checking an upload', ('subfolder',), LATENCY_BUCKETS),
+    'image_job_seconds': ('Background image conversion, from submit to result', ('target', 'outcome'), IMAGE_JOB_BUCKETS),
+}
+
+# name -> (help, label names)
+COUNTERS = {
+    'http_slow_requests_total': ('Requests slower than METRICS_SLOW_REQUEST_MS', ('endpoint',)),
+    'outbox_messages_total': ('Notification delivery attempts by outcome (sent / retry / failed)', ('kind', 'outcome')),
+    'throttle_checks_total': ('Form rate-limit checks by outcome (allowed / limited / error)', ('action', 'scope', 'outcome')),
+}
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more SQL statements than QUERY_BUDGET allows (testing mode only)."""
+
+
+_state = {'pid': None, 'app': None}
+_lock = threading.Lock()
+_histograms = {}   # (name, label values) -> [bucket counts..., sum, count]
+_counters = {}     # (name, label values) -> value
+
+
+# ==========================================
+# 1. RECORDING
+# ==========================================
+
+def observe(name, value, **labels):
+    """Adds one observation to a histogram declared in HISTOGRAMS."""
+    _, label_names, buckets = HISTOGRAMS[name]
+    key = (name, tuple(str(labels[label]) for label in label_names))
+    with _lock:
+        row = _histograms.get(key)
+        if row is None:
+            row = _histograms[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+
+def inc(name, amount=1, **labels):
+    """Adds to a counter declared in COUNTERS."""
+    _, label_names = COUNTERS[name]
+    key = (name, tuple(str(labels[label]) for label in label_names))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    """Times a block into a histogram; inside a request it also shows up in the slow-request trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe(name, elapsed, **labels)
+        trace = _current_trace()
+        if trace is not None:
+            trace['phases'][name] = trace['phases'].get(name, 0.0) + elapsed
+
+
+def _current_trace():
+    if has_request_context():
+        return g.get('metrics_trace')
+    return None
+
+
+# ==========================================
+# 2. HOOKS
+# ==========================================
+
+def init_app(app):
+    """Registers the request, SQL and template hooks. Call after db.init_app() and before other before_request hooks."""
+    @app.before_request
+    def start_trace():
+        g.metrics_trace = {'started': time.perf_counter(), 'db_count': 0, 'db_seconds': 0.0,
+                           'templates': 0.0, 'phases': {}, 'sql': {}}
+
+    @app.after_request
+    def finish_trace(response):
+        trace = g.pop('metrics_trace', None)
+        if trace is not None:
+            _record_request(app, trace, response)
+        return response
+
+    def before_cursor(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.metrics_started = time.perf_counter()
+
+    def after_cursor(conn, cursor, statement, parameters, context, executemany):
+        trace = _current_trace()
+        if trace is None or context is None or not hasattr(context, 'metrics_started'):
+            return
+        elapsed = time.perf_counter() - context.metrics_started
+        trace['db_count'] += 1
+        trace['db_seconds'] += elapsed
+        seen = trace['sql'].setdefault(statement, [0, 0.0])
+        seen[0] += 1
+        seen[1] += elapsed
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_cursor)
+        event.listen(db.engine, 'after_cursor_execute', after_cursor)
+
+    def template_started(sender, template, context, **extra):
+        trace = _current_trace()
+        if trace is not None:
+            trace.setdefault('template_stack', []).append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        trace = _current_trace()
+        if trace is None or not trace.get('template_stack'):
+            return
+        elapsed = time.perf_counter() - trace['template_stack'].pop()
+        trace['templates'] += elapsed
+        observe('template_render_seconds', elapsed, template=template.name or '<string>')
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+
+def _record_request(app, trace, response):
+    elapsed = time.perf_counter() - trace['started']
+    endpoint = request.endpoint or 'none'
+
+    observe('http_request_duration_seconds', elapsed,
+            endpoint=endpoint, method=request.method, status=response.status_code)
+    observe('http_request_db_queries', trace['db_count'], endpoint=endpoint)
+    observe('http_request_db_seconds', trace['db_seconds'], endpoint=endpoint)
+
+    if elapsed * 1000 >= app.config['METRICS_SLOW_REQUEST_MS']:
+        inc('http_slow_requests_total', endpoint=endpoint)
+        print(_report('Slow request', request, response, elapsed, trace))
+
+    budget = app.config.get('QUERY_BUDGET')
+    if app.testing and budget is not None and trace['db_count'] > budget:
+        raise QueryBudgetExceeded(_report(f'Over QUERY_BUDGET={budget}', request, response, elapsed, trace))
+
+
+def _report(title, request, response, elapsed, trace):
+    lines = [f"❌ {title}: {request.method} {request.full_path.rstrip('?')} -> {response.status_code} "
+             f"in {elapsed * 1000:.0f}ms (SQL: {trace['db_count']} queries, {trace['db_seconds'] * 1000:.0f}ms; "
+             f"templates: {trace['templates'] * 1000:.0f}ms"
+             + ''.join(f"; {name}: {seconds * 1000:.0f}ms" for name, seconds in trace['phases'].items())
+             + ")"]
+    # Slowest statements first; the count exposes N+1 loops
+    for statement, (count, seconds) in sorted(trace['sql'].items(), key=lambda item: -item[1][1])[:10]:
+        lines.append(f"   {count:>4}x {seconds * 1000:8.1f}ms  {' '.join(statement.split())[:300]}")
+    return '\n'.join(lines)
+
+
+# ==========================================
+# 3. SHARING BETWEEN PROCESSES
+# ==========================================
+
+def _pid_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def flush():
+    """Writes this process's metrics to its file in METRICS_DIR."""
+    app = _state['app']
+    if app is None:
+        return
+    with _lock:
+        snapshot = {
+            'histograms': [[name, list(labels), row] for (name, labels), row in _histograms.items()],
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+        }
+    path = os.path.join(app.config['METRICS_DIR'], f"{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def start(app):
+    """Starts this process's flusher thread (once per PID, so fork-safe)."""
+    if _state['pid'] == os.getpid():
+        return
+
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        # Numbers inherited through fork belong to the parent's file
+        _histograms.clear()
+        _counters.clear()
+        _state['pid'] = os.getpid()
+        _state['app'] = app
+
+    os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+    for path in glob.glob(os.path.join(app.config['METRICS_DIR'], '*.json')):
+        if not _pid_alive(os.path.basename(path)[:-len('.json')]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass   # another worker starting at the same time got there first
+    flush()
+    thread = threading.Thread(target=_flush_loop, name='metrics-flusher', daemon=True)
+    thread.start()
+    atexit.register(_flush_at_exit)
+
+
+def _flush_loop():
+    app = _state['app']
+    while True:
+        time.sleep(app.config['METRICS_FLUSH_SECONDS'])
+        try:
+            flush()
+        except Exception:
+            traceback.print_exc()
+
+
+def _flush_at_exit():
+    if _state['pid'] == os.getpid():
+        flush()
+
+
+# ==========================================
+# 4. EXPOSITION
+# ==========================================
+
+def _collect(app):
+    """Every process's numbers, added up."""
+    histograms, counters = {}, {}
+    for path in glob.glob(os.path.join(app.config['METRICS_DIR'], '*.json')):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue   # removed or replaced mid-read
+
+        for name, labels, row in snapshot['histograms']:
+            if name not in HISTOGRAMS:
+                continue
+            total = histograms.setdefault((name, tuple(labels)), [0] * len(row))
+            for i, value in enumerate(row):
+                total[i] += value
+        for name, labels, value in snapshot['counters']:
+            if name in COUNTERS:
+                key = (name, tuple(labels))
+                counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+def render(app):
+    """Prometheus text exposition (format 0.0.4) of every process's metrics."""
+    flush()
+    histograms, counters = _collect(app)
+    out = []
+
+    for name, (help_text, label_names, buckets) in HISTOGRAMS.items():
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} histogram")
+        for (row_name, values), row in sorted(histograms.items()):
+            if row_name != name:
+                continue
+            # Bucket counts are already cumulative: observe() adds to every bound >= value
+            for bound, count in zip(buckets, row):
+                out.append(f"{name}_bucket{_labels(label_names, values, [('le', bound)])} {count}")
+            out.append(f"{name}_bucket{_labels(label_names, values, [('le', '+Inf')])} {row[-1]}")
+            out.append(f"{name}_sum{_labels(label_names, values)} {row[-2]}")
+            out.append(f"{name}_count{_labels(label_names, values)} {row[-1]}")
+
+    for name, (help_text, label_names) in COUNTERS.items():
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} counter")
+        for (row_name, values), value in sorted(counters.items()):
+            if row_name == name:
+                out.append(f"{name}{_labels(label_names, values)} {value}")
+
+    return '\n'.join(out) + '\n'
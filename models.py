@@ -1,9 +1,51 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from datetime import datetime
 
 db = SQLAlchemy()
 
+# Work.before_image / after_image are NOT NULL, so this marks an image
+# that the background worker has not finished converting yet
+PENDING_IMAGE = ''
+
+# Clients shown in the admin CRM: anyone with a confirmed visit or a review.
+# Used verbatim both as the partial index predicate and as the list filter,
+# because SQLite only picks a partial index when the query repeats its WHERE.
+LISTED_CLIENT = 'visit_count > 0 OR review_count > 0'
+
+class Client(db.Model):
+    """
+    One customer, keyed by their phone number in E.164 form (+917014790175),
+    so "+91 70147 90175" and "7014790175" are the same person. The counters
+    are denormalized and kept up to date by clients.py on every booking,
+    confirmation, review and delete.
+    """
+    __table_args__ = (
+        # Admin client list: most recently active first
+        db.Index('ix_client_listed_seen', 'last_seen_at', 'id', sqlite_where=db.text(LISTED_CLIENT)),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    phone = db.Column(db.String(20), unique=True, nullable=False)
+    name = db.Column(db.String(80), nullable=False)                 # name used on their latest booking / review
+    appointment_count = db.Column(db.Integer, nullable=False, default=0)
+    visit_count = db.Column(db.Integer, nullable=False, default=0)  # confirmed appointments
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def avg_rating(self):
+        return round(self.rating_sum / self.review_count, 1) if self.review_count else None
+
 class Work(db.Model):
+    __table_args__ = (
+        # Gallery: newest first, optionally filtered by hair type (case-insensitive)
+        db.Index('ix_work_created', 'created_at'),
+        db.Index('ix_work_hair_created', db.text('hair_type COLLATE NOCASE'), 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     hair_type = db.Column(db.String(50), nullable=True) 
@@ -12,11 +54,31 @@ class Work(db.Model):
     before_image = db.Column(db.String(120), nullable=False)
     after_image = db.Column(db.String(120), nullable=False)
     reel_link = db.Column(db.String(255), nullable=True)
+    reel_poster = db.Column(db.String(120), nullable=True)   # still for the reel's click-to-load card
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Responsive copies per image: {"<filename>": [320, 640, 1280]}
+    variants = db.Column(db.JSON, nullable=True)
     
     reviews = db.relationship('Review', backref='work', lazy=True)
 
 class Review(db.Model):
+    __table_args__ = (
+        # Reviews wall: approved only, 'Most Loved' or 'Newest', optionally by star rating
+        db.Index('ix_review_approved_kudos', 'is_approved', 'kudos', 'created_at'),
+        db.Index('ix_review_approved_created', 'is_approved', 'created_at'),
+        db.Index('ix_review_approved_rating_kudos', 'is_approved', 'rating', 'kudos', 'created_at'),
+        db.Index('ix_review_approved_rating_created', 'is_approved', 'rating', 'created_at'),
+        # Homepage / About: the handful of featured reviews (partial index, stays tiny)
+        db.Index('ix_review_featured', 'created_at', sqlite_where=db.text('is_featured = 1')),
+        # Client profile lookups
+        db.Index('ix_review_phone', 'phone_number', 'created_at'),
+        db.Index('ix_review_client', 'client_id', 'created_at'),
+        # Which reviews show a given stored image (duplicate lookups, see dedupe.py)
+        db.Index('ix_review_image_back', 'image_back'),
+        db.Index('ix_review_image_front', 'image_front'),
+        db.Index('ix_review_duplicate_of', 'possible_duplicate_of', sqlite_where=db.text('possible_duplicate_of IS NOT NULL')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(80), nullable=False)
     phone_number = db.Column(db.String(20), nullable=True)
@@ -30,8 +92,26 @@ class Review(db.Model):
     is_featured = db.Column(db.Boolean, default=False) 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     work_id = db.Column(db.Integer, db.ForeignKey('work.id'), nullable=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=True)
+    # Responsive copies per image: {"<filename>": [320, 640, 1280]}
+    variants = db.Column(db.JSON, nullable=True)
+    # Earlier review with the same or a near-identical photo, flagged for moderation
+    possible_duplicate_of = db.Column(db.Integer, nullable=True)
 
 class Appointment(db.Model):
+    __table_args__ = (
+        # Appointment log (pending / confirmed tabs) and client list
+        db.Index('ix_appointment_confirmed_created', 'is_confirmed', 'created_at'),
+        # Archival: the oldest bookings first (see archive.py)
+        db.Index('ix_appointment_created', 'created_at'),
+        # Client profile lookups
+        db.Index('ix_appointment_phone', 'phone_number', 'created_at'),
+        db.Index('ix_appointment_client', 'client_id', 'created_at'),
+        # Ids are never handed out twice, even once the newest booking is
+        # deleted or archived (outbox keys, archive.py)
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(80), nullable=False)
     phone_number = db.Column(db.String(20), nullable=False)
@@ -39,4 +119,169 @@ class Appointment(db.Model):
     date_requested = db.Column(db.String(50), nullable=False)
     branch = db.Column(db.String(50), nullable=False) 
     is_confirmed = db.Column(db.Boolean, default=False) 
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=True)
+
+class ArchivedAppointment(db.Model):
+    """
+    An appointment older than APPOINTMENT_ARCHIVE_DAYS, moved out of the
+    appointment table by `flask archive-appointments` (see archive.py) so
+    the admin log only scans recent bookings. Same columns and ids; the
+    client counters still include it.
+    """
+    __table_args__ = (
+        db.Index('ix_archived_appointment_client', 'client_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_name = db.Column(db.String(80), nullable=False)
+    phone_number = db.Column(db.String(20), nullable=False)
+    service = db.Column(db.String(100), nullable=False)
+    date_requested = db.Column(db.String(50), nullable=False)
+    branch = db.Column(db.String(50), nullable=False)
+    is_confirmed = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ReviewStat(db.Model):
+    """
+    Approved-review histogram: how many approved reviews each (branch, star
+    rating) pair has. Kept in step with approve/delete in the same transaction
+    (see review_stats.py), so rating summaries never scan the review table.
+    """
+    branch = db.Column(db.String(50), primary_key=True)   # '' for reviews without a branch
+    rating = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class ImageJob(db.Model):
+    """
+    One uploaded image waiting to be converted by the background worker pool.
+    Rows survive restarts: anything still pending is picked up again on boot.
+    """
+    __table_args__ = (
+        db.Index('ix_image_job_status', 'status'),
+        db.Index('ix_image_job_target', 'target_type', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    target_type = db.Column(db.String(20), nullable=False)   # 'work' or 'review'
+    target_id = db.Column(db.Integer, nullable=False)
+    field = db.Column(db.String(30), nullable=False)         # e.g. 'before_image', 'image_back'
+    subfolder = db.Column(db.String(20), nullable=False)
+    staged_path = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(120), nullable=False)     # final name under static/uploads/<subfolder>
+    sha256 = db.Column(db.String(64), nullable=True)         # of the raw upload, set when claimed
+    status = db.Column(db.String(20), default='pending')     # pending / running / done / failed
+    attempts = db.Column(db.Integer, default=0)
+    claimed_by = db.Column(db.String(80), nullable=True)     # "<host>:<pid>" of the process running it
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ImageBlob(db.Model):
+    """
+    One stored upload file (see dedupe.py). Uploads with the same bytes reuse
+    it instead of being converted and stored again, so `refcount` counts the
+    image columns pointing at `filename`. `sha256` is the hash of the stored
+    file and unique per subfolder (ux_image_blob_sha, created by
+    dedupe.ensure_built() once older duplicates are merged); `upload_sha256`
+    is that of the raw upload it came from, to skip converting a repeat.
+    The perceptual hash is split into four indexed 16-bit bands to find
+    near-identical photos without a scan.
+    """
+    __table_args__ = (
+        db.Index('ix_image_blob_upload', 'subfolder', 'upload_sha256'),
+        db.Index('ix_image_blob_file', 'subfolder', 'filename'),
+        db.Index('ix_image_blob_band0', 'subfolder', 'band0'),
+        db.Index('ix_image_blob_band1', 'subfolder', 'band1'),
+        db.Index('ix_image_blob_band2', 'subfolder', 'band2'),
+        db.Index('ix_image_blob_band3', 'subfolder', 'band3'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    subfolder = db.Column(db.String(20), nullable=False)
+    filename = db.Column(db.String(120), nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True)         # of the stored file
+    upload_sha256 = db.Column(db.String(64), nullable=True)  # of the raw upload
+    widths = db.Column(db.JSON, nullable=True)               # responsive copies, as in Work/Review.variants
+    refcount = db.Column(db.Integer, nullable=False, default=1)
+    dhash = db.Column(db.String(16), nullable=True)          # 64-bit difference hash, hex
+    band0 = db.Column(db.Integer, nullable=True)
+    band1 = db.Column(db.Integer, nullable=True)
+    band2 = db.Column(db.Integer, nullable=True)
+    band3 = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class OutboxMessage(db.Model):
+    """
+    A notification waiting to go out (see outbox.py). Written in the same
+    commit as the change it announces, so a booking is never saved without
+    its notification or the other way round.
+    """
+    __table_args__ = (
+        db.Index('ix_outbox_status_next', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)                   # e.g. 'appointment.created'
+    idempotency_key = db.Column(db.String(80), unique=True, nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), default='pending')              # pending / sending / sent / failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(80), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+
+def _add_autoincrement(conn, table):
+    """
+    SQLite can't turn AUTOINCREMENT on for an existing table, so the table is
+    recreated under its name and its rows copied over, ids and all.
+    """
+    columns = ', '.join(col['name'] for col in inspect(conn).get_columns(table.name) if col['name'] in table.c)
+    for index in table.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    conn.execute(text(f"ALTER TABLE {table.name} RENAME TO _{table.name}_old"))
+    table.create(bind=conn)
+    conn.execute(text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM _{table.name}_old"))
+    conn.execute(text(f"DROP TABLE _{table.name}_old"))
+
+
+def upgrade_schema():
+    """
+    Brings an existing database up to date with the models.
+    db.create_all() only creates missing tables, so columns and indexes
+    added to an existing model later are patched in here, and tables that
+    became AUTOINCREMENT are rebuilt.
+    """
+    db.create_all()
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not table.dialect_options['sqlite']['autoincrement']:
+                continue
+            sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                               {'name': table.name}).scalar()
+            if 'AUTOINCREMENT' not in sql.upper():
+                _add_autoincrement(conn, table)
+
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
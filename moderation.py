@@ -0,0 +1,130 @@
+"""
+Admin moderation actions on many reviews / appointments at once.
+
+Every function takes a list of ids and applies its action to all of them in
+one transaction, keeping the same bookkeeping as a single-row change: the
+rating counters (review_stats), the per-client counters (clients) and the
+duplicate flags (dedupe) are adjusted in that same commit. Each action is a
+fixed handful of statements however many ids it gets: the counter changes of
+all the rows go out as one executemany per table, well within QUERY_BUDGET.
+The search index follows on its own (triggers, see search.py).
+
+Photos of deleted reviews are released inside the transaction but only
+unlinked after it commits, in one pass, so a failed commit never leaves a
+review pointing at a missing file.
+
+Each function returns the ids it actually changed: ids that don't exist, or
+are already in the requested state, are skipped, so repeating a request (a
+double click, a retried fetch) is harmless. The caller invalidates caches.
+"""
+from flask import current_app
+from sqlalchemy import delete, update
+from sqlalchemy.orm import load_only
+
+import clients
+import dedupe
+import review_stats
+import storage
+from models import db, Review, Appointment
+
+# Columns the bookkeeping needs; a review's content is never loaded
+REVIEW_BOOKKEEPING = load_only(Review.id, Review.branch, Review.rating, Review.is_approved,
+                               Review.client_id, Review.image_back, Review.image_front, Review.variants)
+
+REVIEW_ACTIONS = ('approve', 'feature', 'unfeature', 'delete')
+APPOINTMENT_ACTIONS = ('confirm', 'delete')
+
+
+# ==========================================
+# 1. REVIEWS
+# ==========================================
+
+def approve_reviews(ids):
+    """Publishes the pending reviews among `ids`."""
+    reviews = Review.query.options(REVIEW_BOOKKEEPING).filter(Review.id.in_(ids), Review.is_approved == False).all()
+    approved = [review.id for review in reviews]
+    if approved:
+        db.session.execute(update(Review).where(Review.id.in_(approved)).values(is_approved=True))
+        review_stats.record_many(reviews, +1)
+    db.session.commit()
+    return approved
+
+
+def feature_reviews(ids, featured):
+    """Sets is_featured on every review in `ids`."""
+    changed = [row.id for row in (db.session.query(Review.id)
+                                  .filter(Review.id.in_(ids), Review.is_featured != featured))]
+    if changed:
+        db.session.execute(update(Review).where(Review.id.in_(changed)).values(is_featured=featured))
+    db.session.commit()
+    return changed
+
+
+def delete_reviews(ids):
+    """Deletes the reviews in `ids` along with their photos."""
+    reviews = Review.query.options(REVIEW_BOOKKEEPING).filter(Review.id.in_(ids)).all()
+    deleted = [review.id for review in reviews]
+    if not deleted:
+        return []
+
+    doomed = storage.release_uploads(current_app.config['UPLOAD_FOLDER'],
+                                     [('reviews', filename, review.variants) for review in reviews
+                                      for filename in (review.image_back, review.image_front)])
+
+    review_stats.record_many([review for review in reviews if review.is_approved], -1)
+    clients.record_removed(reviews=reviews)
+    dedupe.forget_reviews(deleted)
+    db.session.execute(delete(Review).where(Review.id.in_(deleted)), execution_options={'synchronize_session': False})
+    db.session.commit()
+
+    storage.remove_files(doomed)
+    return deleted
+
+
+def apply_to_reviews(action, ids):
+    """Runs one of REVIEW_ACTIONS. Returns the ids changed."""
+    if action == 'approve':
+        return approve_reviews(ids)
+    if action in ('feature', 'unfeature'):
+        return feature_reviews(ids, action == 'feature')
+    return delete_reviews(ids)
+
+
+# ==========================================
+# 2. APPOINTMENTS
+# ==========================================
+
+def confirm_appointments(ids):
+    """Confirms the pending appointments among `ids`, counting a visit for each client."""
+    appointments = (Appointment.query
+                    .options(load_only(Appointment.id, Appointment.client_id, Appointment.is_confirmed))
+                    .filter(Appointment.id.in_(ids), Appointment.is_confirmed == False)
+                    .all())
+    confirmed = [apt.id for apt in appointments]
+    if confirmed:
+        db.session.execute(update(Appointment).where(Appointment.id.in_(confirmed)).values(is_confirmed=True))
+        clients.record_confirmations(appointments)
+    db.session.commit()
+    return confirmed
+
+
+def delete_appointments(ids):
+    """Deletes the appointments in `ids`."""
+    appointments = (Appointment.query
+                    .options(load_only(Appointment.id, Appointment.client_id, Appointment.is_confirmed))
+                    .filter(Appointment.id.in_(ids))
+                    .all())
+    deleted = [apt.id for apt in appointments]
+    if deleted:
+        clients.record_removed(appointments=appointments)
+        db.session.execute(delete(Appointment).where(Appointment.id.in_(deleted)),
+                           execution_options={'synchronize_session': False})
+    db.session.commit()
+    return deleted
+
+
+def apply_to_appointments(action, ids):
+    """Runs one of APPOINTMENT_ACTIONS. Returns the ids changed."""
+    if action == 'confirm':
+        return confirm_appointments(ids)
+    return delete_appointments(ids)
@@ -0,0 +1,221 @@
+"""
+Transactional outbox for notifications.
+
+A booking writes an OutboxMessage row in the same commit as the Appointment,
+then returns straight away; nothing talks to the outside world inside the
+request. One dispatcher thread per process claims due messages in batches,
+hands them to the configured transport and marks them sent, or schedules a
+retry with exponential backoff (and gives up after OUTBOX_MAX_ATTEMPTS).
+
+Delivery is at-least-once: a process can die after the provider accepted a
+batch but before it was marked sent, and the batch goes out again. Every
+message carries its idempotency key (e.g. 'appointment-42-created';
+appointment ids are never reused) so the receiving end can drop the repeat.
+
+Transports (OUTBOX_TRANSPORT):
+- 'log': prints the message and keeps the last few in memory. For local
+  development and tests; nothing leaves the machine.
+- 'webhook': POSTs the batch as JSON to OUTBOX_WEBHOOK_URL (a Zapier /
+  Make / WhatsApp Business bridge), signed with OUTBOX_WEBHOOK_SECRET.
+"""
+import hashlib
+import hmac
+import json
+import os
+import random
+import socket
+import threading
+import traceback
+import urllib.error
+import urllib.request
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+import metrics
+from models import db, OutboxMessage
+
+_state = {'pid': None, 'app': None, 'wake': None, 'transport': None}
+_lock = threading.Lock()
+
+
+def _owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ==========================================
+# 1. TRANSPORTS
+# ==========================================
+
+class LogTransport:
+    """Prints each message; the last 100 are kept in `sent` for tests to inspect."""
+    sent = deque(maxlen=100)
+
+    def __init__(self, app):
+        pass
+
+    def send(self, messages):
+        for message in messages:
+            print(f"✅ Notification {message['idempotency_key']}: {message['payload'].get('text', message['kind'])}")
+            self.sent.append(message)
+
+
+class WebhookTransport:
+    """One POST per batch; any non-2xx answer or network error fails the whole batch."""
+
+    def __init__(self, app):
+        self.url = app.config['OUTBOX_WEBHOOK_URL']
+        self.secret = app.config['OUTBOX_WEBHOOK_SECRET']
+        self.timeout = app.config['OUTBOX_HTTP_TIMEOUT']
+        if not self.url:
+            raise ValueError("OUTBOX_TRANSPORT=webhook needs OUTBOX_WEBHOOK_URL")
+
+    def send(self, messages):
+        body = json.dumps({'messages': messages}, default=str).encode()
+        headers = {'Content-Type': 'application/json', 'User-Agent': 'curl-artist-outbox'}
+        if self.secret:
+            digest = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            headers['X-Signature-256'] = f"sha256={digest}"
+
+        req = urllib.request.Request(self.url, data=body, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"webhook answered HTTP {e.code}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise RuntimeError(f"webhook unreachable: {e}") from e
+
+
+TRANSPORTS = {'log': LogTransport, 'webhook': WebhookTransport}
+
+
+# ==========================================
+# 2. PRODUCER SIDE (called from request handlers)
+# ==========================================
+
+def enqueue(kind, key, payload):
+    """
+    Adds a message to the current transaction. The caller commits, then calls
+    notify(). Enqueuing the same key twice is a bug, and the commit fails on
+    the unique constraint.
+    """
+    message = OutboxMessage(kind=kind, idempotency_key=key, payload=payload,
+                            status='pending', next_attempt_at=datetime.utcnow())
+    db.session.add(message)
+    return message
+
+
+def notify():
+    """Wakes this process's dispatcher so a fresh message goes out right away."""
+    if _state['wake'] is not None:
+        _state['wake'].set()
+
+
+# ==========================================
+# 3. DISPATCHER (one thread per process)
+# ==========================================
+
+def start(app):
+    """Starts the dispatcher thread for the current process (once per PID, so fork-safe)."""
+    if _state['pid'] == os.getpid():
+        return
+
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        transport = app.config['OUTBOX_TRANSPORT']
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown OUTBOX_TRANSPORT: {transport!r}")
+        _state['pid'] = os.getpid()
+        _state['app'] = app
+        _state['wake'] = threading.Event()
+        _state['transport'] = TRANSPORTS[transport](app)
+
+        thread = threading.Thread(target=_dispatch_loop, name='outbox-dispatcher', daemon=True)
+        thread.start()
+
+
+def _dispatch_loop():
+    app = _state['app']
+    wake = _state['wake']
+
+    while True:
+        try:
+            with app.app_context():
+                # Keep going while full batches come back: there is a backlog
+                while dispatch_once(app, _state['transport']) >= app.config['OUTBOX_BATCH_SIZE']:
+                    pass
+        except Exception:
+            traceback.print_exc()
+
+        wake.wait(app.config['OUTBOX_POLL_SECONDS'])
+        wake.clear()
+
+
+def dispatch_once(app, transport):
+    """Claims one batch of due messages and sends it. Returns how many were claimed. Needs an app context."""
+    now = datetime.utcnow()
+    owner = _owner_id()
+
+    # A batch whose sender died mid-send goes back in the queue
+    db.session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.status == 'sending',
+               OutboxMessage.claimed_at < now - timedelta(seconds=app.config['OUTBOX_SEND_TIMEOUT']))
+        .values(status='pending', claimed_by=None)
+    )
+
+    due_ids = (db.session.query(OutboxMessage.id)
+               .filter(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now)
+               .order_by(OutboxMessage.next_attempt_at)
+               .limit(app.config['OUTBOX_BATCH_SIZE'])
+               .subquery())
+    # Atomic claim: other workers' dispatchers race for the same rows
+    db.session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(db.select(due_ids.c.id)), OutboxMessage.status == 'pending')
+        .values(status='sending', claimed_by=owner, claimed_at=now, attempts=OutboxMessage.attempts + 1),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+
+    batch = (OutboxMessage.query
+             .filter_by(status='sending', claimed_by=owner)
+             .order_by(OutboxMessage.id)
+             .all())
+    if not batch:
+        return 0
+
+    try:
+        transport.send([{'idempotency_key': m.idempotency_key, 'kind': m.kind, 'payload': m.payload,
+                         'created_at': m.created_at.isoformat()} for m in batch])
+    except Exception as e:
+        print(f"❌ Notification batch of {len(batch)} failed: {e}")
+        for message in batch:
+            _schedule_retry(app, message, str(e), now)
+    else:
+        for message in batch:
+            message.status = 'sent'
+            message.sent_at = datetime.utcnow()
+            message.last_error = None
+            metrics.inc('outbox_messages_total', kind=message.kind, outcome='sent')
+    db.session.commit()
+    return len(batch)
+
+
+def _schedule_retry(app, message, error, now):
+    message.last_error = error
+    message.claimed_by = None
+    if message.attempts >= app.config['OUTBOX_MAX_ATTEMPTS']:
+        message.status = 'failed'
+        metrics.inc('outbox_messages_total', kind=message.kind, outcome='failed')
+        return
+
+    # Exponential backoff with jitter, so a provider outage isn't hammered in lockstep
+    delay = min(app.config['OUTBOX_RETRY_BASE_SECONDS'] * 2 ** (message.attempts - 1),
+                app.config['OUTBOX_RETRY_MAX_SECONDS'])
+    message.status = 'pending'
+    message.next_attempt_at = now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+    metrics.inc('outbox_messages_total', kind=message.kind, outcome='retry')
@@ -0,0 +1,244 @@
+"""
+Rendered-page cache for the public routes.
+
+Pages are cached per route + whitelisted query args. Invalidation is by tag:
+every cached page declares the tags it depends on ('works', 'reviews'), the
+current version of each tag is folded into the cache key, and invalidate()
+just bumps the version. Stale entries are never read again and age out of
+the LRU. The key also holds a build id (a hash of the code, templates and
+fingerprinted asset names), so after a deploy no page rendered by the
+previous build is served, even from the sqlite file that outlives it.
+
+Backends:
+- 'memory': per-process LRU. Fastest, but each gunicorn worker has its own
+  copy and only sees invalidations made in that same process, so only use it
+  with a single-process server (waitress / the dev server).
+- 'sqlite': one small SQLite file shared by every worker on the box.
+- 'none': caching disabled.
+"""
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, session, Response
+
+
+class MemoryBackend:
+    """In-process LRU bounded by entry count."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def tag_versions(self, tags):
+        with self.lock:
+            return [self.versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.versions[tag] = self.versions.get(tag, 0) + 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time() - self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1:]
+
+    def set(self, key, body, content_type):
+        with self.lock:
+            self.entries[key] = (time.time(), body, content_type)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class SQLiteBackend:
+    """
+    Cache shared by all processes through a separate SQLite file (so cache
+    writes never contend with the main database). LRU is approximate: an
+    entry's last-used time is only refreshed once a minute to keep hits read-only.
+    """
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.local = threading.local()
+
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS page (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                content_type TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_page_last_used ON page (last_used);
+            CREATE TABLE IF NOT EXISTS tag (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+        """)
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads; one per thread
+        # (and per process: a connection inherited through fork is unusable)
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def tag_versions(self, tags):
+        placeholders = ','.join('?' * len(tags))
+        rows = dict(self._conn().execute(
+            f'SELECT name, version FROM tag WHERE name IN ({placeholders})', tags
+        ).fetchall())
+        return [rows.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        conn = self._conn()
+        for tag in tags:
+            conn.execute(
+                'INSERT INTO tag (name, version) VALUES (?, 1) '
+                'ON CONFLICT(name) DO UPDATE SET version = version + 1', (tag,)
+            )
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT body, content_type, created_at, last_used FROM page WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        body, content_type, created_at, last_used = row
+        now = time.time()
+        if created_at < now - self.ttl:
+            return None
+        if last_used < now - self.TOUCH_INTERVAL:
+            conn.execute('UPDATE page SET last_used = ? WHERE key = ?', (now, key))
+        return body, content_type
+
+    def set(self, key, body, content_type):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO page (key, body, content_type, created_at, last_used) VALUES (?, ?, ?, ?, ?)',
+            (key, body, content_type, now, now)
+        )
+        # Evict least recently used entries beyond the bound
+        conn.execute(
+            'DELETE FROM page WHERE key IN ('
+            ' SELECT key FROM page ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (self.max_entries,)
+        )
+
+
+def build_id(app):
+    """
+    Short hash of everything that shapes a rendered page: the app's Python
+    modules, its templates and the asset manifest (hashed static URLs).
+    """
+    sources = [name for name in os.listdir(app.root_path) if name.endswith('.py')]
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    for root, _, files in os.walk(template_dir):
+        sources += [os.path.relpath(os.path.join(root, name), app.root_path) for name in files]
+
+    digest = hashlib.sha1()
+    for rel in sorted(sources):
+        digest.update(rel.encode())
+        with open(os.path.join(app.root_path, rel), 'rb') as f:
+            digest.update(f.read())
+    digest.update(json.dumps(app.extensions.get('assets') or {}, sort_keys=True).encode())
+    return digest.hexdigest()[:12]
+
+
+def init_app(app):
+    """
+    Creates the configured backend and stores it on the app, with the build
+    id its keys carry. Run it after assets.init_app(), whose manifest
+    is part of the build id.
+    """
+    backend = app.config['PAGE_CACHE_BACKEND']
+    max_entries = app.config['PAGE_CACHE_MAX_ENTRIES']
+    ttl = app.config['PAGE_CACHE_TTL']
+
+    if backend == 'memory':
+        app.extensions['page_cache'] = MemoryBackend(max_entries, ttl)
+    elif backend == 'sqlite':
+        app.extensions['page_cache'] = SQLiteBackend(app.config['PAGE_CACHE_PATH'], max_entries, ttl)
+    elif backend == 'none':
+        app.extensions['page_cache'] = None
+    else:
+        raise ValueError(f"Unknown PAGE_CACHE_BACKEND: {backend!r}")
+    app.extensions['page_cache_build'] = build_id(app)
+
+
+def invalidate(*tags):
+    """Drops every cached page that depends on any of these tags."""
+    if 'page_cache' not in current_app.extensions:
+        init_app(current_app)   # CLI commands run without create_app()
+    backend = current_app.extensions.get('page_cache')
+    if backend is not None:
+        backend.bump(list(tags))
+
+
+def cached(tags, args=None):
+    """
+    Caches a GET view's rendered body.
+    - tags: data the page depends on; see invalidate().
+    - args: {query arg: default} that change the page. Anything else in the
+      query string (utm_source, fbclid...) is ignored, and a missing arg is
+      treated like its default, so those variants share one entry.
+    Requests carrying flash messages bypass the cache, and only 200s are stored.
+    """
+    tags = list(tags)
+    args = args or {}
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*view_args, **view_kwargs):
+            backend = current_app.extensions.get('page_cache')
+            if backend is None or request.method != 'GET' or session.get('_flashes'):
+                return view(*view_args, **view_kwargs)
+
+            normalized = '&'.join(f"{name}={request.args.get(name) or default}" for name, default in sorted(args.items()))
+            versions = ','.join(str(v) for v in backend.tag_versions(tags))
+            build = current_app.extensions['page_cache_build']
+            raw_key = f"{build}|{request.endpoint}|{sorted(view_kwargs.items())}|{normalized}|{versions}"
+            key = hashlib.sha1(raw_key.encode()).hexdigest()
+
+            hit = backend.get(key)
+            if hit is not None:
+                body, content_type = hit
+                response = Response(body, content_type=content_type)
+                response.headers['X-Page-Cache'] = 'HIT'
+                return response
+
+            response = current_app.make_response(view(*view_args, **view_kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                backend.set(key, response.get_data(), response.content_type)
+                response.headers['X-Page-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+"""
+Query-plan regression check for the listing routes.
+
+Requests every public and admin listing page through the Flask test client,
+captures the SELECTs each one issues, and runs EXPLAIN QUERY PLAN on them.
+A plain "SCAN <table>" (full table scan) or a temp B-tree sort means an index
+is missing or a query stopped matching one. A page that runs more statements
+than QUERY_BUDGET (usually an N+1 loop in a template) fails the check too.
+Run it with `flask check-query-plans`; the test suite runs it as well
+(tests/test_query_plans.py).
+"""
+import re
+import threading
+from datetime import datetime
+
+from sqlalchemy import event
+
+from models import db, Work, Review, Client
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+# Summary tables that hold a handful of rows and are meant to be read whole
+SMALL_TABLES = {'review_stat'}
+
+
+def listing_urls(encode_cursor):
+    """Every listing URL worth checking, including a deep (cursor) page of each."""
+    far_future = datetime(9999, 1, 1)
+
+    class Row:
+        id = 2 ** 62
+        created_at = far_future
+        kudos = 2 ** 31
+        last_seen_at = far_future
+
+    work_cursor = encode_cursor(Row, [Work.created_at, Work.id])
+    newest_cursor = encode_cursor(Row, [Review.created_at, Review.id])
+    kudos_cursor = encode_cursor(Row, [Review.kudos, Review.created_at, Review.id])
+    client_cursor = encode_cursor(Row, [Client.last_seen_at, Client.id])
+
+    return [
+        '/',
+        '/?hair=Curly',
+        f'/api/works?cursor={work_cursor}',
+        f'/api/works?hair=Curly&cursor={work_cursor}',
+        '/about-me',
+        '/reviews',
+        '/reviews?sort=newest',
+        '/reviews?stars=5',
+        '/reviews?sort=newest&stars=5',
+        f'/api/reviews?cursor={kudos_cursor}',
+        f'/api/reviews?sort=newest&cursor={newest_cursor}',
+        f'/api/reviews?stars=5&cursor={kudos_cursor}',
+        f'/api/reviews?sort=newest&stars=5&cursor={newest_cursor}',
+        '/admin/transformations',
+        '/admin/reviews_log',
+        '/admin/appointments_log',
+        '/admin/clients',
+        f'/admin/api/clients?cursor={client_cursor}',
+        '/admin/client/7014790175',
+        '/admin/jobs/status',
+    ]
+
+
+def explain(statement, params):
+    """EXPLAIN QUERY PLAN rows (the 'detail' column) for one captured statement."""
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, params)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def check(app, urls):
+    """
+    Returns a list of (url, sql, plan detail) problems; empty means every
+    listing query is index-backed and every page stays within QUERY_BUDGET.
+    """
+    request_thread = threading.get_ident()
+    budget = app.config['QUERY_BUDGET']
+    captured = []
+    executed = [0]
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        # Ignore background threads (image dispatcher) sharing the engine
+        if threading.get_ident() != request_thread:
+            return
+        executed[0] += 1
+        if statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    problems = []
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin'] = True
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            for url in urls:
+                captured.clear()
+                executed[0] = 0
+                response = client.get(url)
+                if response.status_code >= 500:
+                    problems.append((url, '-', f'HTTP {response.status_code}'))
+                    continue
+                if executed[0] > budget:
+                    problems.append((url, '-', f'{executed[0]} SQL statements, over QUERY_BUDGET={budget}'))
+
+                for statement, params in list(captured):
+                    for detail in explain(statement, params):
+                        scan = FULL_SCAN.match(detail)
+                        if (scan and scan.group(1) not in SMALL_TABLES) or detail == TEMP_SORT:
+                            problems.append((url, ' '.join(statement.split()), detail))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+    return problems
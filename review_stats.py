@@ -0,0 +1,99 @@
+"""
+Precomputed rating aggregates.
+
+ReviewStat holds one counter per (branch, star rating) for approved reviews.
+Every change to the set of approved reviews calls record() inside the same
+transaction, so the counters can't drift from the reviews they describe.
+Averages, totals, the star histogram and the per-branch breakdown are all
+derived from those few rows, whatever the number of reviews.
+"""
+from collections import Counter
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Review, ReviewStat
+
+STARS = (5, 4, 3, 2, 1)
+
+
+def record(review, delta):
+    """
+    Adds `delta` (+1 on approve, -1 on delete / unapprove) to the review's
+    bucket. Only call it for approved reviews; the caller commits.
+    """
+    _add(review.branch or '', review.rating, delta)
+
+
+def record_many(reviews, delta):
+    """record() for many reviews at once: one executemany upsert over the buckets they fall in."""
+    buckets = Counter((review.branch or '', review.rating) for review in reviews)
+    if not buckets:
+        return
+    table = ReviewStat.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.branch, table.c.rating],
+        set_={'count': table.c.count + stmt.excluded.count}
+    )
+    db.session.connection().execute(stmt, [{'branch': branch, 'rating': rating, 'count': delta * count}
+                                           for (branch, rating), count in buckets.items()])
+
+
+def _add(branch, rating, delta):
+    stmt = insert(ReviewStat).values(branch=branch, rating=rating, count=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ReviewStat.branch, ReviewStat.rating],
+        set_={'count': ReviewStat.count + delta}
+    )
+    db.session.execute(stmt)
+
+
+def summary():
+    """
+    Overall count / average, the per-star histogram and the per-branch
+    breakdown. The average is None while there are no approved reviews.
+    """
+    histogram = {stars: 0 for stars in STARS}
+    branches = {}
+    total = score = 0
+
+    for row in ReviewStat.query.filter(ReviewStat.count > 0).all():
+        histogram[row.rating] = histogram.get(row.rating, 0) + row.count
+        total += row.count
+        score += row.rating * row.count
+
+        branch = branches.setdefault(row.branch, {'count': 0, 'score': 0})
+        branch['count'] += row.count
+        branch['score'] += row.rating * row.count
+
+    return {
+        'count': total,
+        'average': round(score / total, 1) if total else None,
+        'histogram': histogram,
+        'branches': {
+            name: {'count': data['count'], 'average': round(data['score'] / data['count'], 1)}
+            for name, data in sorted(branches.items())
+        },
+    }
+
+
+def rebuild():
+    """Recomputes every counter from the review table in one GROUP BY. Returns the number of reviews counted."""
+    rows = (db.session.query(func.coalesce(Review.branch, ''), Review.rating, func.count(Review.id))
+            .filter(Review.is_approved == True)
+            .group_by(func.coalesce(Review.branch, ''), Review.rating)
+            .all())
+
+    ReviewStat.query.delete()
+    for branch, rating, count in rows:
+        db.session.add(ReviewStat(branch=branch, rating=rating, count=count))
+    db.session.commit()
+    return sum(count for _, _, count in rows)
+
+
+def ensure_built():
+    """Fills the counters on first boot after upgrading, when the table is still empty."""
+    if ReviewStat.query.first() is None and Review.query.filter_by(is_approved=True).first() is not None:
+        counted = rebuild()
+        print(f"✅ Rating summary built from {counted} approved reviews.")
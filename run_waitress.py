@@ -1,16 +1,24 @@
 import os
+
+# Waitress is a single process, so the in-memory page cache is safe (and fastest) here
+os.environ.setdefault('PAGE_CACHE_BACKEND', 'memory')
+# Sizes the DB connection pool for the thread pool below (see db_profile.py)
+os.environ.setdefault('SERVER_MODE', 'waitress')
+
 from waitress import serve
-from app import app  # Imports your Flask app object
+from app import app, create_app, init_db  # Imports your Flask app object
 
 # Configuration
 HOST = '0.0.0.0'  # 0.0.0.0 allows access from other devices (like your phone)
-PORT = 8000       # The port the site will run on
-THREADS = 4       # How many requests to handle at once
+PORT = int(os.environ.get('PORT', 8000))        # The port the site will run on
+THREADS = int(os.environ.get('THREADS', 4))     # How many requests to handle at once
 
 if __name__ == "__main__":
     print(f" -> Starting Waitress server on http://localhost:{PORT}")
     print(f" -> Serving on all network interfaces (access via IP: {PORT})")
     print(f" -> Press Ctrl+C to stop")
     
-    # Run the server
-    serve(app, host=HOST, port=PORT, threads=THREADS)
\ No newline at end of file
+    # One process: bring the database up to date, then serve
+    with app.app_context():
+        init_db()
+    serve(create_app(), host=HOST, port=PORT, threads=THREADS)
\ No newline at end of file
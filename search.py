@@ -0,0 +1,141 @@
+"""
+Full-text search over reviews and transformations (SQLite FTS5).
+
+review_fts and work_fts are external-content FTS5 tables: they index
+review.content / customer_name / branch and work.title / hair_type without
+storing a second copy of the text. Triggers on the base tables keep them in
+sync on every insert, delete and edit, whoever makes the change (the app,
+a bulk import or a manual SQL fix). The update triggers only fire for the
+indexed columns, so the kudos flusher never touches the index.
+
+Queries are ranked with bm25, a name match weighing more than a match in
+the review text, and the last word typed matches as a prefix ("curl"
+finds "curly"). Run `flask rebuild-search-index` after restoring a backup
+taken without the FTS tables.
+"""
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from sqlalchemy.orm import raiseload
+
+from models import db, Work, Review, PENDING_IMAGE
+
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS review_fts USING fts5(
+        content, customer_name, branch,
+        content='review', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS review_fts_insert AFTER INSERT ON review BEGIN
+        INSERT INTO review_fts(rowid, content, customer_name, branch)
+        VALUES (new.id, new.content, new.customer_name, new.branch);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS review_fts_delete AFTER DELETE ON review BEGIN
+        INSERT INTO review_fts(review_fts, rowid, content, customer_name, branch)
+        VALUES ('delete', old.id, old.content, old.customer_name, old.branch);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS review_fts_update AFTER UPDATE OF content, customer_name, branch ON review BEGIN
+        INSERT INTO review_fts(review_fts, rowid, content, customer_name, branch)
+        VALUES ('delete', old.id, old.content, old.customer_name, old.branch);
+        INSERT INTO review_fts(rowid, content, customer_name, branch)
+        VALUES (new.id, new.content, new.customer_name, new.branch);
+    END""",
+
+    """CREATE VIRTUAL TABLE IF NOT EXISTS work_fts USING fts5(
+        title, hair_type,
+        content='work', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS work_fts_insert AFTER INSERT ON work BEGIN
+        INSERT INTO work_fts(rowid, title, hair_type) VALUES (new.id, new.title, new.hair_type);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS work_fts_delete AFTER DELETE ON work BEGIN
+        INSERT INTO work_fts(work_fts, rowid, title, hair_type) VALUES ('delete', old.id, old.title, old.hair_type);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS work_fts_update AFTER UPDATE OF title, hair_type ON work BEGIN
+        INSERT INTO work_fts(work_fts, rowid, title, hair_type) VALUES ('delete', old.id, old.title, old.hair_type);
+        INSERT INTO work_fts(rowid, title, hair_type) VALUES (new.id, new.title, new.hair_type);
+    END""",
+]
+
+# bm25 column weights, in column order: a hit on the name or title counts most
+REVIEW_WEIGHTS = (1.0, 4.0, 2.0)     # content, customer_name, branch
+WORK_WEIGHTS = (4.0, 2.0)            # title, hair_type
+
+MAX_TERMS = 8
+SNIPPET_WORDS = 16
+
+
+def ensure_built():
+    """Creates the FTS tables and triggers if missing, and fills them the first time."""
+    created = db.session.execute(
+        text("SELECT count(*) FROM sqlite_master WHERE name IN ('review_fts', 'work_fts')")
+    ).scalar() < 2
+    for statement in SCHEMA:
+        db.session.execute(text(statement))
+    db.session.commit()
+    if created:
+        rebuild()
+        print("✅ Search index built")
+
+
+def rebuild():
+    """Re-reads every review and work into the FTS tables."""
+    db.session.execute(text("INSERT INTO review_fts(review_fts) VALUES ('rebuild')"))
+    db.session.execute(text("INSERT INTO work_fts(work_fts) VALUES ('rebuild')"))
+    db.session.commit()
+
+
+def match_query(raw):
+    """
+    FTS5 MATCH expression for what a user typed, or None if there is nothing
+    to search for. Every word must match; the last one as a prefix. Words are
+    quoted, so FTS syntax (AND, NEAR, column:, quotes) in the input is inert.
+    """
+    terms = re.findall(r'\w+', (raw or '').lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def _snippet_markup(raw):
+    # snippet() marks hits with \x01...\x02; the text itself is user input, so escape it first
+    return Markup(str(escape(raw)).replace('\x01', '<mark>').replace('\x02', '</mark>'))
+
+
+def _in_rank_order(model, ids, options=()):
+    rows = {row.id: row for row in model.query.options(raiseload('*'), *options).filter(model.id.in_(ids))}
+    return [rows[i] for i in ids if i in rows]
+
+
+def search_reviews(raw, limit=20, approved_only=True):
+    """Best matching reviews as [(review, snippet markup)], best first."""
+    query = match_query(raw)
+    if query is None:
+        return []
+
+    hits = db.session.execute(text(f"""
+        SELECT review.id, snippet(review_fts, 0, char(1), char(2), '…', {SNIPPET_WORDS})
+        FROM review_fts JOIN review ON review.id = review_fts.rowid
+        WHERE review_fts MATCH :query {'AND review.is_approved = 1' if approved_only else ''}
+        ORDER BY bm25(review_fts, {', '.join(map(str, REVIEW_WEIGHTS))})
+        LIMIT :limit
+    """), {'query': query, 'limit': limit}).all()
+
+    snippets = {review_id: _snippet_markup(snippet) for review_id, snippet in hits}
+    reviews = _in_rank_order(Review, [review_id for review_id, _ in hits])
+    return [(review, snippets[review.id]) for review in reviews]
+
+
+def search_works(raw, limit=12, include_pending=False):
+    """Best matching transformations, best first."""
+    query = match_query(raw)
+    if query is None:
+        return []
+
+    ready = '' if include_pending else 'AND work.before_image != :pending AND work.after_image != :pending'
+    ids = db.session.execute(text(f"""
+        SELECT work.id
+        FROM work_fts JOIN work ON work.id = work_fts.rowid
+        WHERE work_fts MATCH :query {ready}
+        ORDER BY bm25(work_fts, {', '.join(map(str, WORK_WEIGHTS))})
+        LIMIT :limit
+    """), {'query': query, 'limit': limit, 'pending': PENDING_IMAGE}).scalars().all()
+    return _in_rank_order(Work, ids)
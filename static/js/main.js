@@ -7,9 +7,9 @@ document.addEventListener("DOMContentLoaded", function() {
     // Track which slider is currently being dragged
     let activeSlider = null;
 
-    const sliders = document.querySelectorAll('.ba-slider-container');
-
-    sliders.forEach(slider => {
+    // Wires up one slider. Called for every card on load and again for
+    // cards appended later by infinite scroll (section 4).
+    function initSlider(slider) {
         // Prevent default browser dragging for images (stops "ghost" images)
         const images = slider.querySelectorAll('img');
         images.forEach(img => {
@@ -33,7 +33,9 @@ document.addEventListener("DOMContentLoaded", function() {
             activeSlider = slider;
             updateSlider(e, slider);
         }, { passive: false });
-    });
+    }
+
+    document.querySelectorAll('.ba-slider-container').forEach(initSlider);
 
     // WINDOW LISTENERS (Handles the drag movement globally)
     // This ensures smooth dragging even if mouse leaves the box
@@ -100,17 +102,75 @@ document.addEventListener("DOMContentLoaded", function() {
             scrollContainer.scrollLeft += evt.deltaY;
         });
     }
+
+    // ==========================================
+    // 4. INFINITE SCROLL (Keyset Paginated Cards)
+    // ==========================================
+    // Any container with data-next-url fetches the next page of cards
+    // ({html, next_url}) when its end scrolls into view.
+    // data-infinite-root="self" marks a horizontally scrolling container.
+    document.querySelectorAll('[data-next-url]').forEach(container => {
+        const horizontal = container.dataset.infiniteRoot === 'self';
+        const sentinel = document.createElement('div');
+        sentinel.className = 'infinite-sentinel';
+        sentinel.style.cssText = 'width: 1px; height: 1px; flex-shrink: 0;';
+
+        if (horizontal) container.appendChild(sentinel);
+        else container.after(sentinel);
+
+        let loading = false;
+
+        const observer = new IntersectionObserver(entries => {
+            if (!entries.some(entry => entry.isIntersecting) || loading) return;
+
+            const url = container.dataset.nextUrl;
+            if (!url) return observer.disconnect();
+
+            loading = true;
+            fetch(url, { headers: { 'Accept': 'application/json' } })
+                .then(response => response.json())
+                .then(data => {
+                    const template = document.createElement('template');
+                    template.innerHTML = data.html;
+                    const cards = Array.from(template.content.children);
+
+                    cards.forEach(card => {
+                        if (horizontal) container.insertBefore(card, sentinel);
+                        else container.appendChild(card);
+                        card.querySelectorAll('.ba-slider-container').forEach(initSlider);
+                    });
+                    document.dispatchEvent(new CustomEvent('cards:appended', { detail: { container } }));
+
+                    if (data.next_url) {
+                        container.dataset.nextUrl = data.next_url;
+                        // Re-observe so a sentinel that is still visible fires again
+                        observer.unobserve(sentinel);
+                        observer.observe(sentinel);
+                    } else {
+                        delete container.dataset.nextUrl;
+                        observer.disconnect();
+                        sentinel.remove();
+                    }
+                })
+                .catch(err => console.error('Error loading more:', err))
+                .finally(() => { loading = false; });
+        }, {
+            root: horizontal ? container : null,
+            rootMargin: horizontal ? '0px 600px 0px 0px' : '0px 0px 600px 0px'
+        });
+
+        observer.observe(sentinel);
+    });
 });
 
 // ==========================================
 // 3. TOGGLE REEL LOGIC (Single Button Control)
 // ==========================================
 
-function toggleReel(button, link) {
+function toggleReel(button) {
     // 1. Find the card and the hidden layer
     const card = button.closest('.work-card');
     const reelLayer = card.querySelector('.reel-layer');
-    const iframe = reelLayer.querySelector('.reel-iframe');
 
     // 2. Check if it is currently visible
     const isVisible = reelLayer.style.display === 'flex';
@@ -118,18 +178,50 @@ function toggleReel(button, link) {
     if (isVisible) {
         // --- ACTION: CLOSE IT ---
         reelLayer.style.display = 'none';
-        iframe.src = ""; // Stop video playback
+
+        // Drop the iframe entirely (stops playback, frees Instagram's JS)
+        const iframe = reelLayer.querySelector('.reel-iframe');
+        if (iframe) iframe.remove();
+        reelLayer.querySelector('.reel-facade').style.display = '';
         
         // Reset Button UI to "Watch Reel"
         button.innerHTML = '<i class="fa-brands fa-instagram"></i> Watch Reel';
         button.classList.remove('active-reel-btn'); 
     } else {
-        // --- ACTION: OPEN IT ---
-        iframe.src = link;
+        // --- ACTION: OPEN IT (poster + play button; nothing loads from Instagram yet) ---
         reelLayer.style.display = 'flex';
+        preconnectInstagram();
+
+        // Without a poster there's nothing to preview: go straight to the reel
+        if (!reelLayer.querySelector('.reel-poster')) playReel(reelLayer.querySelector('.reel-facade'));
         
         // Change Button UI to "Close Reel"
         button.innerHTML = '<i class="fa-solid fa-xmark"></i> Close Reel';
         button.classList.add('active-reel-btn'); 
     }
+}
+
+function playReel(facade) {
+    // Only now is the third-party iframe created
+    const reelLayer = facade.closest('.reel-layer');
+    const iframe = document.createElement('iframe');
+    iframe.className = 'reel-iframe';
+    iframe.src = reelLayer.dataset.reelSrc;
+    iframe.setAttribute('frameborder', '0');
+    iframe.setAttribute('scrolling', 'no');
+    iframe.setAttribute('allowtransparency', 'true');
+    iframe.allow = 'autoplay; encrypted-media';
+
+    facade.style.display = 'none';
+    reelLayer.appendChild(iframe);
+}
+
+function preconnectInstagram() {
+    // Warm up DNS/TLS while the visitor looks at the poster (once per page)
+    if (document.querySelector('link[data-reel-preconnect]')) return;
+    const link = document.createElement('link');
+    link.rel = 'preconnect';
+    link.href = 'https://www.instagram.com';
+    link.dataset.reelPreconnect = '';
+    document.head.appendChild(link);
 }
\ No newline at end of file
@@ -0,0 +1,363 @@
+"""
+Upload storage: deleting uploads, orphan collection and sharding (`flask gc-uploads`),
+and stripping metadata from uploads stored before that was done on upload.
+
+Files under UPLOAD_FOLDER outlive their rows in a few ways: a delete whose
+os.remove failed, a conversion that finished after its review was deleted
+mid-flight, a crash between writing a file and committing. In the staging
+folder, raw uploads of failed jobs and the .part files of requests that died
+mid-upload pile up the same way. Nothing reads these files again, so
+collect() sweeps them:
+
+1. Streams the image columns of Work, Review and every unfinished ImageJob
+   in batches (yield_per) into a set of referenced names.
+2. Walks the upload tree with os.scandir, one directory at a time, and
+   treats a file as referenced if its name, or for a resized copy
+   ('abc_640w.webp') its original's name, is in that set.
+3. Moves everything else older than UPLOAD_GC_GRACE_SECONDS into
+   UPLOAD_QUARANTINE_FOLDER/<run>/, and deletes quarantine runs older than
+   UPLOAD_QUARANTINE_DAYS. A file quarantined by mistake is put back with a
+   plain `mv`.
+
+New uploads are sharded into <subfolder>/<2 chars>/ (images.sharded_name).
+reshard() moves uploads saved with flat names into shards as well. It is
+opt-in because the old URLs of those images stop working.
+
+Meant to run from cron while the site is up, e.g. nightly:
+    flask --app app gc-uploads
+"""
+import os
+import re
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+import dedupe
+import images
+from models import db, Work, Review, ImageJob, ImageBlob, PENDING_IMAGE
+
+# subfolder -> image columns stored in it
+UPLOAD_COLUMNS = {
+    'before': [Work.before_image],
+    'after': [Work.after_image],
+    'reels': [Work.reel_poster],
+    'reviews': [Review.image_back, Review.image_front],
+}
+
+# 'abc123_640w' -> 'abc123' (names produced by images.variant_name)
+VARIANT_STEM = re.compile(r'^(?P<stem>.+)_\d+w$')
+
+RUN_FORMAT = '%Y%m%d-%H%M%S'
+
+
+# ==========================================
+# 1. DELETING AN UPLOAD
+# ==========================================
+
+def release_uploads(upload_folder, uploads):
+    """
+    Drops the rows' claims on their uploads, given as (subfolder, filename,
+    variants) triples, in one dedupe.release_many(). Returns the paths of
+    the files and resized copies nothing uses any more: remove them with
+    remove_files() only after the rows' delete is committed, so a failed
+    commit never leaves a row pointing at a missing file.
+    """
+    uploads = [(subfolder, name, variants) for subfolder, name, variants in uploads
+               if name and name != PENDING_IMAGE]
+    unused = dedupe.release_many([(subfolder, name) for subfolder, name, _ in uploads]) if uploads else set()
+    paths = []
+    for subfolder, filename, variants in uploads:
+        if (subfolder, filename) in unused:
+            unused.discard((subfolder, filename))   # a file shared by two released rows is listed once
+            widths = (variants or {}).get(filename, [])
+            paths += [os.path.join(upload_folder, subfolder, name)
+                      for name in [filename] + images.variant_files(filename, widths)]
+    return paths
+
+
+def remove_files(paths):
+    """Best-effort delete: anything left behind is swept up by collect()."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"❌ Failed to delete upload {path}: {e}")
+
+
+# ==========================================
+# 2. WHAT IS STILL IN USE
+# ==========================================
+
+def _stem(name):
+    stem = name.rsplit('.', 1)[0]
+    variant = VARIANT_STEM.match(stem)
+    return variant.group('stem') if variant else stem
+
+
+def referenced(batch_size):
+    """
+    ({subfolder: set of referenced name stems}, set of staged paths still
+    queued). Stems rather than names, so every resized copy of an image
+    counts as referenced along with it.
+    """
+    stems = {subfolder: set() for subfolder in UPLOAD_COLUMNS}
+    for subfolder, columns in UPLOAD_COLUMNS.items():
+        for row in db.session.query(*columns).yield_per(batch_size):
+            stems[subfolder].update(_stem(name) for name in row if name and name != PENDING_IMAGE)
+
+    # Unfinished jobs: the worker may be writing their output right now
+    staged = set()
+    unfinished = (db.session.query(ImageJob.subfolder, ImageJob.filename, ImageJob.staged_path)
+                  .filter(ImageJob.status.in_(['pending', 'running'])))
+    for subfolder, filename, staged_path in unfinished.yield_per(batch_size):
+        stems.setdefault(subfolder, set()).add(_stem(filename))
+        staged.add(os.path.abspath(staged_path))
+    return stems, staged
+
+
+# ==========================================
+# 3. COLLECTION
+# ==========================================
+
+def _walk(root, rel=''):
+    """Yields (relative path, DirEntry) for every file under root, one directory listing at a time."""
+    try:
+        entries = os.scandir(os.path.join(root, rel))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            path = f"{rel}/{entry.name}" if rel else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(root, path)
+            elif entry.is_file(follow_symlinks=False):
+                yield path, entry
+
+
+def _remove_empty_dirs(root, cutoff):
+    """Drops shard directories left empty (but not ones just created for an upload in progress)."""
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+            try:
+                os.rmdir(entry.path)
+            except OSError:
+                pass   # not empty
+
+
+def collect(app, dry_run=False, delete=False):
+    """
+    Finds orphaned uploads and staged files, and quarantines them (or deletes
+    them with delete=True; dry_run only reports). Also purges expired
+    quarantine runs. Needs an app context.
+    Returns {'scanned', 'orphans', 'bytes', 'by_folder', 'purged_bytes', 'quarantine'}.
+    """
+    config = app.config
+    cutoff = time.time() - config['UPLOAD_GC_GRACE_SECONDS']
+    run_dir = os.path.join(config['UPLOAD_QUARANTINE_FOLDER'], datetime.now().strftime(RUN_FORMAT))
+    stems, staged = referenced(config['UPLOAD_GC_BATCH_SIZE'])
+    db.session.rollback()   # don't hold a read transaction open during the walk
+
+    result = {'scanned': 0, 'orphans': 0, 'bytes': 0, 'by_folder': {}, 'purged_bytes': 0,
+              'quarantine': None if dry_run or delete else run_dir}
+
+    def sweep(folder, root, is_orphan):
+        for rel, entry in _walk(root):
+            result['scanned'] += 1
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime >= cutoff or not is_orphan(rel, entry):
+                continue
+
+            result['orphans'] += 1
+            result['bytes'] += stat.st_size
+            count, size = result['by_folder'].get(folder, (0, 0))
+            result['by_folder'][folder] = (count + 1, size + stat.st_size)
+            if dry_run:
+                continue
+            try:
+                if delete:
+                    os.remove(entry.path)
+                else:
+                    target = os.path.join(run_dir, folder, rel)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.move(entry.path, target)
+            except FileNotFoundError:
+                pass   # deleted by the app while we were looking
+        if not dry_run:
+            _remove_empty_dirs(root, cutoff)
+
+    for subfolder in sorted(config['UPLOAD_SUBFOLDERS']):
+        in_use = stems.get(subfolder, set())
+        sweep(subfolder, os.path.join(config['UPLOAD_FOLDER'], subfolder),
+              lambda rel, entry: _stem(rel) not in in_use)
+
+    # Staging: raw uploads of failed / dropped jobs and abandoned .part files
+    sweep('staging', config['STAGING_FOLDER'],
+          lambda rel, entry: os.path.abspath(entry.path) not in staged)
+
+    if not dry_run:
+        result['purged_bytes'] = purge_quarantine(app)
+    return result
+
+
+def purge_quarantine(app):
+    """Deletes quarantine runs older than UPLOAD_QUARANTINE_DAYS. Returns the bytes freed."""
+    root = app.config['UPLOAD_QUARANTINE_FOLDER']
+    expired = datetime.now() - timedelta(days=app.config['UPLOAD_QUARANTINE_DAYS'])
+    freed = 0
+    try:
+        runs = list(os.scandir(root))
+    except FileNotFoundError:
+        return 0
+
+    for run in runs:
+        try:
+            run_time = datetime.strptime(run.name, RUN_FORMAT)
+        except ValueError:
+            continue   # not ours
+        if run_time < expired and run.is_dir(follow_symlinks=False):
+            freed += sum(entry.stat(follow_symlinks=False).st_size for _, entry in _walk(run.path))
+            shutil.rmtree(run.path, ignore_errors=True)
+    return freed
+
+
+# ==========================================
+# 4. SHARDING EXISTING UPLOADS
+# ==========================================
+
+def _reshard_row(app, row, subfolder, column, moved):
+    filename = getattr(row, column.key)
+    if not filename or filename == PENDING_IMAGE or '/' in filename:
+        return False
+
+    save_dir = os.path.join(app.config['UPLOAD_FOLDER'], subfolder)
+    new_name = images.sharded_name(filename, app.config['UPLOAD_SHARD_CHARS'])
+    if not os.path.exists(os.path.join(save_dir, filename)) and \
+       not os.path.exists(os.path.join(save_dir, new_name)):
+        return False   # missing already; nothing to move
+
+    widths = (row.variants or {}).get(filename, [])
+    for old, new in zip([filename] + images.variant_files(filename, widths),
+                        [new_name] + images.variant_files(new_name, widths)):
+        old_path, new_path = os.path.join(save_dir, old), os.path.join(save_dir, new)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        try:
+            # Link, not move: until the commit, the old name is still the live one
+            os.link(old_path, new_path)
+        except FileExistsError:
+            pass   # left by an interrupted run
+        except FileNotFoundError:
+            continue
+        moved.append(old_path)
+
+    setattr(row, column.key, new_name)
+    # Moved by an earlier row sharing the same file (dedupe.py) or by this one
+    db.session.execute(update(ImageBlob)
+                       .where(ImageBlob.subfolder == subfolder, ImageBlob.filename == filename)
+                       .values(filename=new_name))
+    variants = dict(row.variants or {})
+    if filename in variants:
+        variants[new_name] = variants.pop(filename)
+        row.variants = variants
+    return True
+
+
+def reshard(app):
+    """
+    Moves uploads stored under flat names into shard directories and renames
+    them in the DB, one batch per commit. Crash-safe: files are hard-linked
+    under the new name, the rows committed, and only then the old names
+    unlinked (an interrupted run leaves extra links that collect() removes).
+    Returns the number of images moved. Needs an app context.
+    """
+    batch_size = app.config['UPLOAD_GC_BATCH_SIZE']
+    total = 0
+
+    for model in (Work, Review):
+        columns = [(subfolder, column) for subfolder, cols in UPLOAD_COLUMNS.items()
+                   for column in cols if column.class_ is model]
+        last_id = 0
+        while True:
+            rows = model.query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            moved = []
+            for row in rows:
+                for subfolder, column in columns:
+                    total += _reshard_row(app, row, subfolder, column, moved)
+            db.session.commit()
+
+            for path in moved:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            last_id = rows[-1].id
+            db.session.expunge_all()
+    return total
+
+
+# ==========================================
+# 5. STRIPPING METADATA FROM EXISTING UPLOADS
+# ==========================================
+
+def strip_existing(app):
+    """
+    Removes EXIF / XMP (GPS position included) from every stored original,
+    which new uploads lose in images.process_upload(). Uploads are served
+    as immutable under their name, so a cleaned file gets a new random name
+    (its resized copies, already clean, are hard-linked under it): the rows
+    and ImageBlob move to it and the old files are deleted after the commit,
+    so no cache can keep serving the old bytes as current. A file that turns
+    out to hold the same bytes as another one is merged into it. Clean
+    files are left untouched, so it is safe to re-run; the new copies of an
+    interrupted run are collected as orphans. Returns the number of files
+    stripped. Needs an app context.
+    """
+    batch_size = app.config['UPLOAD_GC_BATCH_SIZE']
+    uploads = {}
+    for subfolder, columns in UPLOAD_COLUMNS.items():
+        model = columns[0].class_
+        for variants, *names in db.session.query(model.variants, *columns).yield_per(batch_size):
+            for name in names:
+                if name and name != PENDING_IMAGE:
+                    uploads.setdefault((subfolder, name), (variants or {}).get(name, []))
+
+    stripped, doomed = 0, []
+    for (subfolder, name), widths in sorted(uploads.items()):
+        folder = os.path.join(app.config['UPLOAD_FOLDER'], subfolder)
+        if not os.path.exists(os.path.join(folder, name)):
+            continue   # missing, or merged into another file by this run
+        new_name = images.sharded_name(f"{uuid.uuid4().hex}.{name.rsplit('.', 1)[-1]}",
+                                       app.config['UPLOAD_SHARD_CHARS'])
+        os.makedirs(os.path.dirname(os.path.join(folder, new_name)), exist_ok=True)
+        try:
+            if not images.strip_metadata(os.path.join(folder, name), os.path.join(folder, new_name)):
+                continue
+        except Exception as e:
+            print(f"❌ {subfolder}/{name}: {e}")
+            continue
+
+        for old, new in zip(images.variant_files(name, widths), images.variant_files(new_name, widths)):
+            try:
+                os.link(os.path.join(folder, old), os.path.join(folder, new))
+            except FileNotFoundError:
+                pass
+        sha256 = images.file_sha256(os.path.join(folder, new_name))
+        doomed += dedupe.replace_file(subfolder, name, new_name, sha256, widths)
+        stripped += 1
+        if stripped % batch_size == 0:
+            db.session.commit()
+            remove_files(doomed)
+            doomed = []
+    db.session.commit()
+    remove_files(doomed)
+    return stripped
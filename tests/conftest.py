@@ -0,0 +1,39 @@
+"""
+Shared test setup. Run from the repo root: python -m pytest -q tests
+
+The app reads its paths from the environment at import time, so everything
+(database, uploads, caches) is pointed at a scratch folder before importing it.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+SCRATCH = tempfile.mkdtemp(prefix='curlartist-test-')
+os.environ.update({
+    'DATABASE_PATH': os.path.join(SCRATCH, 'test.db'),
+    'UPLOAD_FOLDER': os.path.join(SCRATCH, 'uploads'),
+    'PAGE_CACHE_PATH': os.path.join(SCRATCH, 'page_cache.db'),
+    'PAGE_CACHE_BACKEND': 'memory',
+    'METRICS_DIR': os.path.join(SCRATCH, 'metrics'),
+    'THROTTLE_ENABLED': '0',
+    'THROTTLE_PATH': os.path.join(SCRATCH, 'throttle.db'),
+    'OUTBOX_TRANSPORT': 'log',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import page_cache             # noqa: E402
+from app import app, init_db  # noqa: E402
+from models import db         # noqa: E402
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        init_db()
+    # Every test starts with an empty page cache, as create_app() gives a server
+    page_cache.init_app(app)
+    return app.test_client()
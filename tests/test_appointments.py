@@ -0,0 +1,64 @@
+"""Booking regression tests."""
+from datetime import datetime, timedelta
+
+import archive
+from app import app
+from models import db, Appointment, ArchivedAppointment, Client, OutboxMessage
+
+
+def book(client, name, phone='7014790175'):
+    response = client.post('/appointment', data={
+        'name': name, 'phone': phone, 'branch': 'Delhi',
+        'service': 'Curly Cut', 'date': '2030-01-01',
+    })
+    assert response.status_code == 302
+    return response.headers['Location']
+
+
+def test_booking_after_deleting_newest_appointment(client):
+    """Deleting the newest booking must not let its id, or its outbox key, come back."""
+    assert book(client, 'First').startswith('https://wa.me/')
+    assert book(client, 'Second').startswith('https://wa.me/')
+
+    with client.session_transaction() as session:
+        session['admin'] = True
+    with app.app_context():
+        newest = db.session.query(db.func.max(Appointment.id)).scalar()
+    client.get(f'/admin/delete_appointment/{newest}')
+
+    for name in ('Third', 'Fourth', 'Fifth'):
+        assert book(client, name).startswith('https://wa.me/')
+
+    with app.app_context():
+        assert Appointment.query.count() == 4
+        keys = [message.idempotency_key for message in OutboxMessage.query]
+        assert len(keys) == len(set(keys)) == 5
+        assert {f'appointment-{apt.id}-created' for apt in Appointment.query} <= set(keys)
+
+
+def test_booking_with_unreadable_phone_is_accepted_without_a_client(client):
+    """A number normalize_phone() can't read still books; it just isn't linked to a client."""
+    assert book(client, 'Landline', phone='234 5678').startswith('https://wa.me/')
+
+    with app.app_context():
+        booking = Appointment.query.one()
+        assert booking.phone_number == '234 5678' and booking.client_id is None
+        assert Client.query.count() == 0
+
+
+def test_archived_ids_are_never_reused(client):
+    """Archiving every booking, the newest included, must never hand an archived id out again."""
+    for name in ('First', 'Second', 'Third'):
+        book(client, name)
+    with app.app_context():
+        assert archive.archive_appointments(datetime.utcnow() + timedelta(days=1), 500) == 3
+        assert Appointment.query.count() == 0
+
+    for name in ('Fourth', 'Fifth'):
+        book(client, name)
+
+    with app.app_context():
+        archived = {row.id for row in ArchivedAppointment.query}
+        live = {row.id for row in Appointment.query}
+        assert len(archived) == 3 and len(live) == 2
+        assert min(live) > max(archived)
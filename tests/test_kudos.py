@@ -0,0 +1,56 @@
+"""Kudos clicks: per-client dedupe and rate limit, then the batched flush to the database."""
+import pytest
+
+import kudos
+from app import app
+from models import db, Review
+
+
+@pytest.fixture
+def review_id(client):
+    def forget():
+        kudos._seen.clear()
+        kudos._recent.clear()
+        kudos._pending.clear()
+
+    forget()
+    with app.app_context():
+        review = Review(customer_name='Client', phone_number='7014790175', branch='Delhi', rating=5,
+                        content='Lovely', is_approved=True, kudos=0)
+        db.session.add(review)
+        db.session.commit()
+        review_id = review.id
+    yield review_id
+    forget()
+
+
+def test_a_client_counts_once_per_review_and_the_flush_writes_it(client, review_id):
+    # Through the route first: the first request starts the flusher, which drops inherited clicks
+    response = client.post(f'/reviews/like/{review_id}')
+    assert response.get_json() == {'kudos': 1, 'counted': True}
+    assert client.post(f'/reviews/like/{review_id}').get_json() == {'kudos': 1, 'counted': False}
+
+    assert kudos.add(app, 'alice', review_id) == 'counted'
+    assert kudos.add(app, 'alice', review_id) == 'duplicate'
+    assert kudos.add(app, 'bob', review_id) == 'counted'
+
+    with app.app_context():
+        kudos.flush()   # the flusher thread may have got there first; either way it is written once
+        assert db.session.get(Review, review_id).kudos == 3
+    assert kudos.pending_for(review_id) == 0
+
+
+def test_evicting_idle_clients_never_resets_an_active_one(client, review_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'KUDOS_RATE_PER_MINUTE', 3)
+    monkeypatch.setitem(app.config, 'KUDOS_DEDUPE_MAX_CLIENTS', 5)
+
+    for review in range(3):
+        assert kudos.add(app, 'spammer', review) == 'counted'
+    assert kudos.add(app, 'spammer', 99) == 'limited'
+
+    # A crowd of new clients pushes the tables past their bound...
+    for n in range(10):
+        kudos.add(app, f'visitor-{n}', review_id)
+        # ...while the spammer keeps clicking, and stays limited throughout
+        assert kudos.add(app, 'spammer', 100 + n) == 'limited'
+    assert len(kudos._recent) <= 5
@@ -0,0 +1,50 @@
+"""The /media route: partial and conditional responses, and nothing outside the upload folders."""
+import os
+import uuid
+
+from app import app
+
+
+def stored_upload(body):
+    """A file laid out like a processed upload: sharded directory, uuid name."""
+    name = uuid.uuid4().hex
+    relative = f"{name[:2]}/{name}.jpg"
+    path = os.path.join(app.config['UPLOAD_FOLDER'], 'reviews', relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(body)
+    return name, relative
+
+
+def test_a_bounded_range_returns_just_those_bytes(client):
+    body = bytes(range(256)) * 4
+    _, relative = stored_upload(body)
+
+    response = client.get(f'/media/reviews/{relative}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == body[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(body)}'
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_a_matching_etag_returns_304(client):
+    name, relative = stored_upload(b'photo')
+
+    response = client.get(f'/media/reviews/{relative}')
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{name}"'
+
+    response = client.get(f'/media/reviews/{relative}', headers={'If-None-Match': f'"{name}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_paths_outside_the_upload_folders_are_404(client):
+    stored_upload(b'photo')
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'secret.txt'), 'w') as f:
+        f.write('not an upload')
+
+    assert client.get('/media/reviews/../secret.txt').status_code == 404
+    assert client.get('/media/reviews/..%2Fsecret.txt').status_code == 404
+    assert client.get('/media/staging/secret.txt').status_code == 404
+    assert client.get('/media/reviews/missing.jpg').status_code == 404
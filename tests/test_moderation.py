@@ -0,0 +1,48 @@
+"""Bulk moderation regression tests."""
+from app import app
+from models import db, Appointment, Client, Review, ReviewStat
+
+BRANCHES = ('Delhi', 'Mumbai', 'Pune', 'Goa')
+
+
+def add_rows(count):
+    """`count` pending reviews and appointments, each from its own client, spread over every bucket."""
+    with app.app_context():
+        for i in range(count):
+            client = Client(phone=f'+91701479{i:04d}', name=f'Client {i}', appointment_count=1, review_count=1,
+                            rating_sum=i % 5 + 1)
+            db.session.add(client)
+            db.session.flush()
+            db.session.add(Review(customer_name=client.name, phone_number=client.phone, branch=BRANCHES[i % 4],
+                                  rating=i % 5 + 1, content='Lovely', client_id=client.id))
+            db.session.add(Appointment(customer_name=client.name, phone_number=client.phone, service='Curly Cut',
+                                       date_requested='2030-01-01', branch='Delhi', client_id=client.id))
+        db.session.commit()
+        return [row.id for row in Review.query], [row.id for row in Appointment.query]
+
+
+def moderate(client, kind, action, ids):
+    """A bulk request; under TESTING one over QUERY_BUDGET raises QueryBudgetExceeded."""
+    response = client.post(f'/admin/{kind}/bulk', json={'action': action, 'ids': ids})
+    assert response.status_code == 200
+    assert sorted(response.get_json()['ids']) == sorted(ids)
+
+
+def test_bulk_moderation_of_many_rows_stays_within_query_budget(client):
+    review_ids, appointment_ids = add_rows(40)
+    with client.session_transaction() as session:
+        session['admin'] = True
+
+    moderate(client, 'reviews', 'approve', review_ids)
+    with app.app_context():
+        assert sum(stat.count for stat in ReviewStat.query) == 40
+    moderate(client, 'appointments', 'confirm', appointment_ids)
+    with app.app_context():
+        assert {client.visit_count for client in Client.query} == {1}
+
+    moderate(client, 'reviews', 'delete', review_ids)
+    moderate(client, 'appointments', 'delete', appointment_ids)
+    with app.app_context():
+        assert sum(stat.count for stat in ReviewStat.query) == 0
+        assert {(client.appointment_count, client.visit_count, client.review_count, client.rating_sum)
+                for client in Client.query} == {(0, 0, 0, 0)}
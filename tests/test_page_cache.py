@@ -0,0 +1,61 @@
+"""Cached public pages must follow every admin action and kudos flush that changes them."""
+import kudos
+from app import app
+from models import db, Review
+
+
+def add_review(content, approved=True):
+    with app.app_context():
+        review = Review(customer_name='Client', phone_number='7014790175', branch='Delhi', rating=5,
+                        content=content, is_approved=approved)
+        db.session.add(review)
+        db.session.commit()
+        return review.id
+
+
+def page(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.headers.get('X-Page-Cache'), response.get_data(as_text=True)
+
+
+def test_moderation_and_kudos_invalidate_cached_pages(client):
+    shown = add_review('first-review')
+    pending = add_review('pending-review', approved=False)
+    assert page(client, '/reviews')[0] == 'MISS'
+    assert page(client, '/reviews')[0] == 'HIT'
+    assert page(client, '/')[0] == 'MISS'
+
+    with client.session_transaction() as session:
+        session['admin'] = True
+
+    client.get(f'/admin/approve_review/{pending}')
+    state, body = page(client, '/reviews')
+    assert state == 'MISS' and 'pending-review' in body
+
+    client.get(f'/admin/toggle_feature/{shown}')
+    state, body = page(client, '/')
+    assert state == 'MISS' and 'first-review' in body
+
+    page(client, '/reviews')
+    assert client.post(f'/reviews/like/{shown}').status_code == 200
+    assert page(client, '/reviews')[0] == 'HIT'   # the click is only buffered...
+    with app.app_context():
+        assert kudos.flush() == 1                  # ...until the flusher writes it
+    assert page(client, '/reviews')[0] == 'MISS'
+
+    client.get(f'/admin/delete_review/{shown}')
+    assert page(client, '/reviews')[0] is None    # shows the "deleted" flash: never cached
+    state, body = page(client, '/reviews')
+    assert state == 'MISS' and 'first-review' not in body
+    state, body = page(client, '/')
+    assert state == 'MISS' and 'first-review' not in body
+
+
+def test_new_build_does_not_serve_pages_cached_by_the_old_one(client):
+    add_review('first-review')
+    page(client, '/reviews')
+    assert page(client, '/reviews')[0] == 'HIT'
+
+    app.extensions['page_cache_build'] = 'next-deploy'
+    assert page(client, '/reviews')[0] == 'MISS'
@@ -0,0 +1,77 @@
+"""Keyset pagination of the gallery and review feeds (/api/works, /api/reviews)."""
+import base64
+import re
+from datetime import datetime
+
+import pytest
+
+from app import app
+from models import db, Work, Review
+
+# Three timestamps for 30 rows: every page boundary falls inside a tie
+MOMENTS = [datetime(2030, 1, day) for day in (3, 2, 1)]
+
+
+@pytest.fixture
+def feeds(client):
+    with app.app_context():
+        for i in range(30):
+            db.session.add(Work(title=f'Cut {i}', before_image=f'w{i}-before.jpg', after_image=f'w{i}-after.jpg',
+                                created_at=MOMENTS[i % 3]))
+            db.session.add(Review(customer_name=f'Client {i}', phone_number='7014790175', branch='Delhi', rating=5,
+                                  content=f'review-{i}-text', kudos=i % 2, is_approved=True,
+                                  created_at=MOMENTS[i % 3]))
+        db.session.commit()
+    return client
+
+
+def walk(client, url, marker):
+    """Follows next_url from the first page to the last; returns the row numbers in feed order, per page."""
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        data = response.get_json()
+        pages.append([int(n) for n in re.findall(marker, data['html'])])
+        url = data['next_url']
+    return pages
+
+
+def test_gallery_pages_cover_every_work_once_in_order(feeds):
+    pages = walk(feeds, '/api/works', r'w(\d+)-after\.jpg')
+    numbers = [n for page in pages for n in dict.fromkeys(page)]   # a card shows its image twice (srcset)
+
+    assert [len(dict.fromkeys(page)) for page in pages] == [12, 12, 6]
+    assert sorted(numbers) == list(range(30))
+    with app.app_context():
+        expected = [int(work.title.split()[1]) for work in
+                    Work.query.order_by(Work.created_at.desc(), Work.id.desc())]
+    assert numbers == expected
+
+
+@pytest.mark.parametrize('sort', ['kudos', 'newest'])
+def test_review_pages_cover_every_review_once(feeds, sort):
+    pages = walk(feeds, f'/api/reviews?sort={sort}', r'review-(\d+)-text')
+    numbers = [n for page in pages for n in page]
+    assert len(numbers) == 30 and sorted(numbers) == list(range(30))
+
+
+def test_last_page_has_no_next_cursor(feeds):
+    with app.app_context():
+        Work.query.filter(Work.id > 5).delete()
+        db.session.commit()
+    data = feeds.get('/api/works').get_json()
+    assert data['next_url'] is None
+
+
+@pytest.mark.parametrize('cursor', [
+    'garbage!',
+    base64.urlsafe_b64encode(b'not json').decode(),
+    base64.urlsafe_b64encode(b'[1]').decode(),                  # wrong number of keys
+    base64.urlsafe_b64encode(b'["yesterday", 5]').decode(),     # not a timestamp
+    base64.urlsafe_b64encode(b'{"a": 1, "b": 2}').decode(),
+    base64.urlsafe_b64encode(b'["2030-01-01T00:00:00", [5]]').decode(),
+])
+def test_tampered_cursor_is_a_400(feeds, cursor):
+    assert feeds.get('/api/works', query_string={'cursor': cursor}).status_code == 400
+    assert feeds.get('/api/reviews', query_string={'sort': 'newest', 'cursor': cursor}).status_code == 400
@@ -0,0 +1,26 @@
+"""The `flask check-query-plans` check, run as part of the suite."""
+import query_plans
+from app import app, encode_cursor
+from models import db, Work, Review, Appointment, Client
+
+
+def test_listing_queries_are_index_backed_and_within_budget(client):
+    """No listing page may fall back to a full table scan, a temp sort, or go over QUERY_BUDGET."""
+    with app.app_context():
+        for i in range(3):
+            customer = Client(phone=f'+9170147900{i:02d}', name=f'Client {i}', visit_count=1)
+            db.session.add(customer)
+            db.session.flush()
+            work = Work(title=f'Cut {i}', hair_type='Curly', before_image=f'b{i}.jpg', after_image=f'a{i}.jpg')
+            db.session.add(work)
+            db.session.flush()
+            db.session.add(Review(customer_name=customer.name, phone_number=customer.phone, branch='Delhi',
+                                  rating=5, content='Lovely', is_approved=True, work_id=work.id,
+                                  client_id=customer.id))
+            db.session.add(Appointment(customer_name=customer.name, phone_number=customer.phone,
+                                       service='Curly Cut', date_requested='2030-01-01', branch='Delhi',
+                                       client_id=customer.id))
+        db.session.commit()
+
+    problems = query_plans.check(app, query_plans.listing_urls(encode_cursor))
+    assert problems == []
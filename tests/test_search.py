@@ -0,0 +1,39 @@
+"""Search index triggers: results follow edits and deletes, however the row changes."""
+from sqlalchemy import text
+
+from app import app
+from models import db, Review, Work
+
+
+def found(client, query):
+    data = client.get('/api/search', query_string={'q': query}).get_json()
+    return [r['id'] for r in data['reviews']], [w['id'] for w in data['works']]
+
+
+def test_results_follow_edits_and_deletes(client):
+    with app.app_context():
+        review = Review(customer_name='Meera', phone_number='7014790175', branch='Delhi', rating=5,
+                        content='Bouncy ringlets that lasted all week', is_approved=True)
+        work = Work(title='Ringlet revival', hair_type='3B', before_image='b.jpg', after_image='a.jpg')
+        db.session.add_all([review, work])
+        db.session.commit()
+        review_id, work_id = review.id, work.id
+
+    assert found(client, 'ringlet') == ([review_id], [work_id])
+
+    # An edit through the ORM and one straight in SQL, as a manual fix would be
+    with app.app_context():
+        db.session.get(Review, review_id).content = 'Soft waves, very happy'
+        db.session.execute(text("UPDATE work SET title = 'Wave set' WHERE id = :id"), {'id': work_id})
+        db.session.commit()
+
+    assert found(client, 'ringlet') == ([], [])
+    assert found(client, 'waves') == ([review_id], [])
+    assert found(client, 'wave') == ([review_id], [work_id])
+
+    with app.app_context():
+        db.session.delete(db.session.get(Review, review_id))
+        db.session.execute(text("DELETE FROM work WHERE id = :id"), {'id': work_id})
+        db.session.commit()
+
+    assert found(client, 'wave') == ([], [])
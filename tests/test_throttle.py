@@ -0,0 +1,27 @@
+"""Form throttling: one phone number's bucket runs dry without affecting anyone else."""
+import throttle
+from app import app
+from models import Appointment
+
+from test_appointments import book
+
+
+def test_booking_limit_is_per_phone(client, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'THROTTLE_ENABLED', True)
+    monkeypatch.setitem(app.extensions, 'throttle', throttle.Store(str(tmp_path / 'throttle.db')))
+    burst, _ = app.config['THROTTLE_LIMITS']['appointment:phone']
+
+    # Written differently, still the same number and the same bucket
+    for n in range(burst):
+        book(client, f'Booking {n}', phone='7014790175' if n % 2 else '+91 70147 90175')
+
+    response = client.post('/appointment', data={
+        'name': 'One too many', 'phone': '070147 90175', 'branch': 'Delhi',
+        'service': 'Curly Cut', 'date': '2030-01-01',
+    })
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+    assert book(client, 'Someone else', phone='9876543210').startswith('https://wa.me/')
+    with app.app_context():
+        assert Appointment.query.count() == burst + 1
@@ -0,0 +1,94 @@
+"""Upload processing regression tests."""
+import io
+import os
+from concurrent.futures import Future
+
+from PIL import Image
+
+import images
+import jobs
+import storage
+from app import app
+from models import db, ImageBlob, ImageJob, Review
+
+
+def add_review_with_upload(name, photo):
+    """A review plus its claimed image job, the way the upload route and the dispatcher leave them."""
+    staged_path = os.path.join(app.config['STAGING_FOLDER'], name)
+    with open(staged_path, 'wb') as f:
+        f.write(photo)
+    review = Review(customer_name=name, phone_number='7014790175', branch='Delhi', rating=5, content='Lovely')
+    db.session.add(review)
+    db.session.flush()
+    job = ImageJob(target_type='review', target_id=review.id, field='image_back', subfolder='reviews',
+                   staged_path=staged_path, filename=name, status='running', attempts=1,
+                   claimed_by=jobs._owner_id())
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def test_identical_uploads_converted_together_are_stored_once(client):
+    """Both jobs miss the pre-conversion lookup; the second to finish must reuse the first one's file."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'teal').save(buffer, 'JPEG')
+    dest_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'reviews')
+
+    with app.app_context():
+        first = add_review_with_upload('first.jpg', buffer.getvalue())
+        second = add_review_with_upload('second.jpg', buffer.getvalue())
+        assert not jobs._reuse_stored(first) and not jobs._reuse_stored(second)
+
+        for job in (first, second):
+            future = Future()
+            future.set_result(images.process_upload(job.staged_path, dest_dir, job.filename))
+            jobs._finalize(app, job.id, future)
+
+        blob = ImageBlob.query.one()
+        assert (blob.filename, blob.refcount) == ('first.jpg', 2)
+        assert [review.image_back for review in Review.query] == ['first.jpg', 'first.jpg']
+        assert not os.path.exists(os.path.join(dest_dir, 'second.jpg'))
+
+
+def test_stored_original_loses_its_location(client):
+    """The original is served as is, so its EXIF (GPS above all) must not survive the upload."""
+    exif = Image.Exif()
+    exif[0x0112] = 6                          # orientation: kept
+    exif[0x010F] = 'Apple'                    # camera make: dropped
+    exif[0x8825] = {1: 'N', 2: (28.0, 36.0, 0.0)}   # GPS: dropped
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'teal').save(buffer, 'JPEG', exif=exif)
+    dest_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'reviews')
+
+    with app.app_context():
+        job = add_review_with_upload('located.jpg', buffer.getvalue())
+        images.process_upload(job.staged_path, dest_dir, job.filename)
+
+    with Image.open(os.path.join(dest_dir, 'located.jpg')) as stored:
+        assert dict(stored.getexif()) == {0x0112: 6}
+
+
+def test_backfill_stores_stripped_originals_under_new_names(client):
+    """Old names are cached as immutable, so the cleaned file must not reuse one."""
+    exif = Image.Exif()
+    exif[0x8825] = {1: 'N', 2: (28.0, 36.0, 0.0)}
+    dest_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'reviews')
+    os.makedirs(dest_dir, exist_ok=True)
+    Image.new('RGB', (64, 48), 'teal').save(os.path.join(dest_dir, 'old.jpg'), 'JPEG', exif=exif)
+
+    with app.app_context():
+        review = Review(customer_name='Old', phone_number='7014790175', branch='Delhi', rating=5,
+                        content='Lovely', image_back='old.jpg', variants={'old.jpg': []})
+        db.session.add(review)
+        db.session.add(ImageBlob(subfolder='reviews', filename='old.jpg', sha256='0' * 64, refcount=1))
+        db.session.commit()
+
+        assert storage.strip_existing(app) == 1
+        new_name = Review.query.one().image_back
+        assert new_name != 'old.jpg' and ImageBlob.query.one().filename == new_name
+        assert Review.query.one().variants == {new_name: []}
+        assert storage.strip_existing(app) == 0
+
+    assert not os.path.exists(os.path.join(dest_dir, 'old.jpg'))
+    with Image.open(os.path.join(dest_dir, new_name)) as stored:
+        assert not stored.getexif()
@@ -0,0 +1,114 @@
+"""
+Rate limits for the public submission forms (reviews and bookings).
+
+Token buckets: each (action, scope, key), e.g. ('review', 'ip', '1.2.3.4'),
+holds up to `burst` tokens and refills at burst/period tokens per second.
+A submission spends one token; an empty bucket answers 429 with a
+Retry-After header. Buckets are kept per client IP, so one client can't
+flood a form, and per normalized phone number, so rotating IPs doesn't help
+either. Limits are in THROTTLE_LIMITS.
+
+The buckets live in a small SQLite file shared by every gunicorn worker (like
+the page cache, and separate from the main database so throttling never
+contends with real writes). Each check is one IMMEDIATE transaction, so two
+workers can't both spend a bucket's last token. If the store is unavailable
+the request is let through: throttling must never take the forms down.
+
+Views call check() for the IP before touching request.form, so a throttled
+upload is turned away before a byte of its body is parsed or written; the
+phone check needs the form but still runs before any image is staged.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+from werkzeug.exceptions import TooManyRequests
+
+import metrics
+
+
+class Store:
+    """Token buckets in a SQLite file; one connection per thread and process."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS bucket (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                full_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_bucket_full_at ON bucket (full_at);
+        """)
+
+    def _conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def take(self, key, burst, period, now):
+        """Spends one token. Returns 0 if it was available, else the seconds until one is."""
+        rate = burst / period
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if tokens < 1:
+                conn.execute('ROLLBACK')
+                return (1 - tokens) / rate
+
+            tokens -= 1
+            conn.execute(
+                'INSERT INTO bucket (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, '
+                'updated_at = excluded.updated_at, full_at = excluded.full_at',
+                (key, tokens, now, now + (burst - tokens) / rate)
+            )
+            # A full bucket is the same as no row at all
+            conn.execute('DELETE FROM bucket WHERE full_at < ?', (now,))
+            conn.execute('COMMIT')
+            return 0
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def init_app(app):
+    """Opens the bucket store and keeps it on the app."""
+    app.extensions['throttle'] = Store(app.config['THROTTLE_PATH'])
+
+
+def check(action, scope, key):
+    """
+    Spends a token from the (action, scope, key) bucket, e.g.
+    check('review', 'ip', request.remote_addr). Raises TooManyRequests (429,
+    with Retry-After) when it is empty. A missing key is not limited.
+    """
+    config = current_app.config
+    if not key or not config['THROTTLE_ENABLED']:
+        return
+
+    burst, period = config['THROTTLE_LIMITS'][f"{action}:{scope}"]
+    try:
+        if 'throttle' not in current_app.extensions:
+            init_app(current_app)
+        wait = current_app.extensions['throttle'].take(f"{action}:{scope}:{key}", burst, period, time.time())
+    except sqlite3.Error as e:
+        print(f"❌ Throttle store unavailable, letting the request through: {e}")
+        metrics.inc('throttle_checks_total', action=action, scope=scope, outcome='error')
+        return
+
+    metrics.inc('throttle_checks_total', action=action, scope=scope, outcome='limited' if wait else 'allowed')
+    if wait:
+        raise TooManyRequests(retry_after=math.ceil(wait))